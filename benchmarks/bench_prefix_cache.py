@@ -0,0 +1,122 @@
+# benchmarks/bench_prefix_cache.py
+"""
+前缀稳定布局的 prefill 基准：用同一段合成对话分别以 "blocks"（原布局）和 "stable"（前缀稳定布局）
+逐轮请求 Ollama，比较每轮的首字延迟（TTFT，近似 prefill 时间）以及服务端报告的 prefill token 数。
+stable 布局下相邻两轮的消息前缀逐字节相同，服务端可复用上一轮的 KV 缓存，TTFT 应基本不随轮次增长。
+
+需要本地运行 Ollama；为了减少生成时间对结果的干扰，每轮只生成 --max-tokens 个 token，
+并把固定的合成回复（而不是模型的实际输出）写入工作记忆，两种布局看到的对话完全一致。
+
+用法：
+    python -m benchmarks.bench_prefix_cache --turns 12 --max-tokens 8
+    python -m benchmarks.bench_prefix_cache --url http://localhost:11434/api/chat --json prefix.json
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from config import LLM_CONFIG, MODEL_NAME1, MODEL_URL, SYSTEM_PROMPT
+from dialogue.prompt_builder import PromptBuilder
+from llm.llm_client import Llama3Client
+from wm.working_memory import WorkingMemory
+
+TOPICS = ["睡眠", "饮食", "运动", "学习计划", "工作安排", "阅读", "旅行", "预算"]
+
+
+def synthetic_turn(i: int):
+    """第 i 轮的用户输入、合成回复和本轮检索到的记忆（每轮不同）。"""
+    topic = TOPICS[i % len(TOPICS)]
+    user = f"第 {i} 轮：我想聊聊{topic}，最近在这方面有些困扰，你有什么建议吗？"
+    reply = (f"关于{topic}，先生可以先记录一周的实际情况，再逐步调整。"
+             f"建议每天固定一个时间回顾当天的{topic}安排，并在周末做一次总结。") * 2
+    memories = [
+        {"source": "episodic_memory", "key": f"user:{topic}", "timestamp": 1750000000 + i * 3600 + j,
+         "content": f"用户在第 {i - j} 天提到{topic}相关的情况，记录编号 {i * 10 + j}。", "score": 1.0 - j * 0.1}
+        for j in range(3)
+    ]
+    return user, reply, memories
+
+
+def run_layout(layout: str, client: Llama3Client, turns: int, max_tokens: int) -> dict:
+    wm = WorkingMemory(max_history=turns + 1)
+    builder = PromptBuilder(SYSTEM_PROMPT, layout=layout, verbose=False)
+    rows = []
+    for i in range(turns):
+        user, reply, memories = synthetic_turn(i)
+        wm.load_memories(memories)
+        wm.add_context("user", user)
+        messages = builder.build(user, [TOPICS[i % len(TOPICS)]], wm, max_tokens=max_tokens)
+        start = time.perf_counter()
+        for _ in client.chat_stream(messages, temperature=0.0, max_tokens=max_tokens):
+            pass
+        elapsed = time.perf_counter() - start
+        stats, usage = client.last_stream_stats, client.last_usage
+        rows.append({
+            "turn": i,
+            "prompt_tokens_est": builder.last_stats["prompt_tokens"],
+            "prefix_tokens_est": builder.last_stats.get("prefix_tokens"),
+            "ttft": stats.get("ttft"),
+            "total_time": elapsed,
+            "server_prompt_tokens": usage.get("prompt_tokens"),
+            "server_prefill_seconds": usage.get("prefill_seconds"),
+        })
+        wm.add_context("assistant", reply)
+        print(f"  [{layout}] 第 {i:>2} 轮：prompt 约 {rows[-1]['prompt_tokens_est']:>5} tokens，"
+              f"TTFT {rows[-1]['ttft'] or 0:.3f}s")
+
+    # 第 0 轮两种布局都是冷启动，不计入统计
+    ttfts = [r["ttft"] for r in rows[1:] if r["ttft"] is not None]
+    return {
+        "layout": layout,
+        "turns": rows,
+        "ttft_mean": float(np.mean(ttfts)) if ttfts else None,
+        "ttft_p50": float(np.percentile(ttfts, 50)) if ttfts else None,
+        "ttft_p99": float(np.percentile(ttfts, 99)) if ttfts else None,
+        "ttft_last": ttfts[-1] if ttfts else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="前缀稳定布局的 prefill 延迟基准")
+    parser.add_argument("--url", default=MODEL_URL, help="聊天接口地址（OpenAI 兼容或 Ollama 原生 /api/chat）")
+    parser.add_argument("--model", default=MODEL_NAME1)
+    parser.add_argument("--turns", type=int, default=12, help="每种布局的对话轮数")
+    parser.add_argument("--max-tokens", type=int, default=8, help="每轮生成的 token 数")
+    parser.add_argument("--keep-alive", default="30m", help="Ollama keep_alive，保持模型与 KV 缓存常驻")
+    parser.add_argument("--num-ctx", type=int, default=LLM_CONFIG["context_window"], help="Ollama num_ctx")
+    parser.add_argument("--layouts", default="blocks,stable", help="逗号分隔的布局")
+    parser.add_argument("--json", help="把结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    client = Llama3Client(model=args.model, url=args.url, keep_alive=args.keep_alive, num_ctx=args.num_ctx)
+    results = []
+    for layout in args.layouts.split(","):
+        print(f"布局 {layout}：")
+        try:
+            results.append(run_layout(layout, client, args.turns, args.max_tokens))
+        except Exception as err:
+            print(f"请求失败（确认 Ollama 已启动、模型已拉取）：{err}")
+            sys.exit(1)
+
+    print(f"\n{'布局':<8} {'TTFT 平均(s)':>13} {'p50(s)':>8} {'p99(s)':>8} {'末轮(s)':>8}")
+    for r in results:
+        if r["ttft_mean"] is None:
+            print(f"{r['layout']:<8} {'-':>13}")
+            continue
+        print(f"{r['layout']:<8} {r['ttft_mean']:>13.3f} {r['ttft_p50']:>8.3f} {r['ttft_p99']:>8.3f} {r['ttft_last']:>8.3f}")
+    by_layout = {r["layout"]: r for r in results}
+    if "blocks" in by_layout and "stable" in by_layout and by_layout["stable"]["ttft_mean"]:
+        ratio = by_layout["blocks"]["ttft_mean"] / by_layout["stable"]["ttft_mean"]
+        print(f"stable 布局的平均 TTFT 为 blocks 的 1/{ratio:.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/bulk_insert.py
+"""
+记忆体批量写入基准：在临时目录里向 EMStore 逐条 add() N 条记录，比较不同写入配置的吞吐：
+- rollback：原有的回滚日志 + synchronous=FULL，每条一次提交
+- wal：WAL + synchronous=NORMAL，每条一次提交
+- wal_full：WAL + synchronous=FULL，每条一次提交
+- write_behind：WAL + NORMAL，写后队列批量提交（计时包含最后的 flush()）
+
+用法：
+    python -m benchmarks.bulk_insert --n 5000 --batch 256
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from memory.em_store import EMStore
+
+MODES = {
+    "rollback": {"journal_mode": "delete", "synchronous": "full"},
+    "wal": {"journal_mode": "wal", "synchronous": "normal"},
+    "wal_full": {"journal_mode": "wal", "synchronous": "full"},
+    "write_behind": {"journal_mode": "wal", "synchronous": "normal", "write_behind": True},
+}
+
+
+def run(mode: str, n: int, batch: int, flush_interval: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bulk_insert_")
+    try:
+        store = EMStore(os.path.join(workdir, "em.db"), max_batch=batch,
+                        flush_interval=flush_interval, **MODES[mode])
+        start = time.perf_counter()
+        for i in range(n):
+            store.add(f"user:bench{i % 50}", f"第 {i} 条基准测试记录，内容用于全文索引。", str(time.time()))
+        submitted = time.perf_counter() - start
+        store.flush()
+        elapsed = time.perf_counter() - start
+        count = store.conn.execute("SELECT COUNT(*) FROM episodic_memory").fetchone()[0]
+        store.close()
+        assert count == n, f"{mode}: 期望 {n} 条，实际 {count} 条"
+        return {
+            "mode": mode,
+            "rows": n,
+            "seconds": elapsed,
+            "rows_per_sec": n / elapsed if elapsed else float("inf"),
+            "add_latency_us": submitted / n * 1e6,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="记忆体批量写入吞吐基准")
+    parser.add_argument("--n", type=int, default=5000, help="写入条数")
+    parser.add_argument("--batch", type=int, default=256, help="写后模式的批大小")
+    parser.add_argument("--flush-interval", type=float, default=0.05, help="写后模式的最长攒批时间（秒）")
+    parser.add_argument("--modes", default=",".join(MODES), help="逗号分隔的写入配置")
+    parser.add_argument("--json", help="把结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'配置':<14} {'条数':>8} {'耗时(s)':>9} {'条/秒':>10} {'add() 平均(us)':>15}")
+    for mode in args.modes.split(","):
+        r = run(mode, args.n, args.batch, args.flush_interval)
+        results.append(r)
+        print(f"{mode:<14} {r['rows']:>8} {r['seconds']:>9.3f} {r['rows_per_sec']:>10.0f} {r['add_latency_us']:>15.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# benchmarks/intent_eval.py
+"""
+意图路由分类器的离线评估：以 LLM 的历史判断为标签，按交叉验证比较
+不同置信度阈值下本地分类器直接回答的比例（即省下的 LLM 调用）与路由准确率，
+并给出单次预测的 p50/p99 延迟。
+
+低于阈值的样本会回退到 LLM，视为与标签一致；
+因此整体准确率 = 1 - 分类器直接回答但答错的样本占比。
+
+用法：
+    python -m benchmarks.intent_eval --log intent_log.jsonl --em em.db --folds 5
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+from intent.intent_classifier import IntentClassifier, load_em_turns, load_turn_log
+
+
+def cross_validate(samples, folds: int, thresholds, epochs: int, seed: int = 0):
+    """k 折交叉验证，返回每个阈值的统计和所有预测的延迟（秒）。"""
+    data = list(samples)
+    random.Random(seed).shuffle(data)
+    predictions = []  # (标签, 预测, 置信度)
+    latencies = []
+    for k in range(folds):
+        test = data[k::folds]
+        train = [s for i, s in enumerate(data) if i % folds != k]
+        if not test or not train:
+            continue
+        clf = IntentClassifier().train(train, epochs=epochs)
+        for text, label in test:
+            start = time.perf_counter()
+            pred, conf = clf.predict(text)
+            latencies.append(time.perf_counter() - start)
+            predictions.append((label, pred, conf))
+
+    n = len(predictions)
+    rows = []
+    for th in thresholds:
+        answered = [(y, p) for y, p, c in predictions if c >= th]
+        wrong = sum(1 for y, p in answered if y != p)
+        rows.append({
+            "threshold": th,
+            "llm_calls_saved": len(answered) / n if n else 0.0,
+            "fast_path_accuracy": 1 - wrong / len(answered) if answered else None,
+            "overall_accuracy": 1 - wrong / n if n else None,
+        })
+    raw_accuracy = sum(1 for y, p, _ in predictions if y == p) / n if n else 0.0
+    return rows, raw_accuracy, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="意图路由分类器离线评估")
+    parser.add_argument("--log", default="intent_log.jsonl", help="IntentDetector 的轮次日志")
+    parser.add_argument("--em", default="em.db", help="情景记忆体数据库（补充样本）")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--epochs", type=int, default=15)
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8,0.9,0.95,0.99")
+    parser.add_argument("--json", help="把结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    samples = []
+    if os.path.exists(args.log):
+        samples += load_turn_log(args.log)
+    if os.path.exists(args.em):
+        samples += load_em_turns(args.em)
+    samples = list(dict(samples).items())
+    if len(samples) < args.folds:
+        raise SystemExit(f"样本太少（{len(samples)} 条），无法做 {args.folds} 折交叉验证")
+
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+    rows, raw_accuracy, latencies = cross_validate(samples, args.folds, thresholds, args.epochs)
+    counts = {}
+    for _, label in samples:
+        counts[label] = counts.get(label, 0) + 1
+
+    print(f"样本 {len(samples)} 条，标签分布 {counts}")
+    print(f"分类器不设阈值的准确率 {raw_accuracy:.3f}，"
+          f"预测延迟 p50 {np.percentile(latencies, 50) * 1e6:.0f}us / p99 {np.percentile(latencies, 99) * 1e6:.0f}us")
+    print(f"{'阈值':>6} {'省下LLM调用':>12} {'快路径准确率':>12} {'整体准确率':>10}")
+    for r in rows:
+        fast = f"{r['fast_path_accuracy']:.3f}" if r["fast_path_accuracy"] is not None else "-"
+        print(f"{r['threshold']:>6.2f} {r['llm_calls_saved']:>12.1%} {fast:>12} {r['overall_accuracy']:>10.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "samples": len(samples), "labels": counts, "raw_accuracy": raw_accuracy,
+                "latency_p50_us": float(np.percentile(latencies, 50) * 1e6),
+                "latency_p99_us": float(np.percentile(latencies, 99) * 1e6),
+                "thresholds": rows,
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+# benchmarks/memory_scale.py
+"""
+记忆层与检索层的规模基准：用 benchmarks/synthetic.py 生成的可复现语料（1k ~ 1M 条），
+在临时目录中逐个规模测量：
+- 写入：EMStore / SMStore / MSStore 逐条 add() 的吞吐（条/秒）
+- 检索：SimpleMemoryRetriever（ngram / fts 后端）与 MemoryFilter 的索引构建耗时、单次查询 p50/p99
+- 向量：HashEmbeddingStore（离线确定性嵌入的 VectorStore）的构建耗时与查询 p50/p99
+- 内存：各阶段结束时的进程 RSS 与峰值 RSS（MB）
+结果连同提交号、参数写入 JSON，便于跨提交比较；--compare 指定旧结果文件时打印各指标的变化。
+
+用法：
+    python -m benchmarks.memory_scale --sizes 1000,10000,100000 --json memory_scale.json
+    python -m benchmarks.memory_scale --sizes 1000000 --skip fts,vector --write-behind
+    python -m benchmarks.memory_scale --sizes 10000 --compare memory_scale.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import psutil
+
+from benchmarks.synthetic import HashEmbeddingStore, generate_corpus, generate_queries
+from memory.em_store import EMStore
+from memory.memory_filter import MemoryFilter
+from memory.ms_store import MSStore
+from memory.ngram_index import MemoryTextIndex
+from memory.simpl_retriever import SimpleMemoryRetriever
+from memory.sm_store import SMStore
+
+STAGES = ("insert", "ngram", "filter", "fts", "vector")
+
+
+def rss_mb() -> float:
+    return psutil.Process().memory_info().rss / 2 ** 20
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 以 KB 为单位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def latency_stats(fn: Callable[[str], object], queries: List[str]) -> Dict[str, float]:
+    """逐条执行查询，返回 p50/p99/平均延迟（毫秒）。"""
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        latencies.append((time.perf_counter() - start) * 1000)
+    lat = np.array(latencies)
+    return {
+        "p50_ms": round(float(np.percentile(lat, 50)), 4),
+        "p99_ms": round(float(np.percentile(lat, 99)), 4),
+        "mean_ms": round(float(lat.mean()), 4),
+    }
+
+
+def run_size(n: int, args, queries: List[str]) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="memory_scale_")
+    result: Dict = {"size": n}
+    try:
+        opts = {"write_behind": args.write_behind}
+        stores = {
+            "episodic": EMStore(os.path.join(workdir, "em.db"), **opts),
+            "semantic": SMStore(os.path.join(workdir, "sm.db"), **opts),
+            "mission": MSStore(os.path.join(workdir, "ms.db"), **opts),
+        }
+        base_rss = rss_mb()
+
+        # —— 写入 ——
+        records = list(generate_corpus(n, seed=args.seed))
+        counts = {tier: 0 for tier in stores}
+        start = time.perf_counter()
+        for rec in records:
+            stores[rec.tier].add(rec.key, rec.content, rec.timestamp)
+            counts[rec.tier] += 1
+        for store in stores.values():
+            store.flush()
+        elapsed = time.perf_counter() - start
+        result["insert"] = {
+            "rows": n,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(n / elapsed, 1) if elapsed else None,
+            "per_tier": counts,
+            "rss_mb": round(rss_mb(), 1),
+        }
+        print(f"  写入 {n} 条：{elapsed:.2f}s，{n / elapsed:,.0f} 条/秒")
+        em, sm, ms = stores["episodic"], stores["semantic"], stores["mission"]
+
+        # —— n-gram 倒排索引（SimpleMemoryRetriever 默认后端），MemoryFilter 共用同一索引 ——
+        text_index = None
+        if "ngram" not in args.skip or "filter" not in args.skip:
+            start = time.perf_counter()
+            text_index = MemoryTextIndex(em, sm, ms)
+            retriever = SimpleMemoryRetriever(em, sm, ms, text_index=text_index)
+            # 索引在快照首次刷新时全量构建，这里显式触发，避免计入第一次查询
+            text_index.snapshot.refresh()
+            build = time.perf_counter() - start
+            result["ngram"] = {"build_s": round(build, 3), "rss_mb": round(rss_mb(), 1)}
+            if "ngram" not in args.skip:
+                result["ngram"].update(latency_stats(lambda q: retriever.query(q, top_k=5), queries))
+                print(f"  ngram：构建 {build:.2f}s，p50 {result['ngram']['p50_ms']:.2f}ms，"
+                      f"p99 {result['ngram']['p99_ms']:.2f}ms")
+            if "filter" not in args.skip:
+                memory_filter = MemoryFilter(em, sm, ms, text_index=text_index)
+                result["filter"] = latency_stats(lambda q: memory_filter.filter(q, top_k=5), queries)
+                print(f"  MemoryFilter：p50 {result['filter']['p50_ms']:.2f}ms，"
+                      f"p99 {result['filter']['p99_ms']:.2f}ms")
+
+        # —— FTS5（索引随写入由触发器维护，没有单独的构建阶段） ——
+        if "fts" not in args.skip:
+            fts = SimpleMemoryRetriever(em, sm, ms, backend="fts")
+            result["fts"] = latency_stats(lambda q: fts.query(q, top_k=5), queries)
+            print(f"  fts：p50 {result['fts']['p50_ms']:.2f}ms，p99 {result['fts']['p99_ms']:.2f}ms")
+
+        # —— 向量检索 ——
+        if "vector" not in args.skip:
+            vs = HashEmbeddingStore(dim=args.dim, index_type=args.index_type,
+                                    index_path=os.path.join(workdir, "vs.faiss"),
+                                    meta_path=os.path.join(workdir, "vs.meta.pkl"))
+            items = [(f"{r.tier}:{i}", r.content) for i, r in enumerate(records)]
+            start = time.perf_counter()
+            for i in range(0, len(items), args.vector_batch):
+                vs.add_batch(items[i:i + args.vector_batch])
+            build = time.perf_counter() - start
+            result["vector"] = {"build_s": round(build, 3), "vectors": len(vs), "rss_mb": round(rss_mb(), 1)}
+            result["vector"].update(latency_stats(lambda q: vs.query(q, top_k=5), queries))
+            print(f"  vector（{args.index_type}, dim={args.dim}）：构建 {build:.2f}s，"
+                  f"p50 {result['vector']['p50_ms']:.2f}ms，p99 {result['vector']['p99_ms']:.2f}ms")
+
+        result["rss_mb"] = round(rss_mb(), 1)
+        result["rss_delta_mb"] = round(result["rss_mb"] - base_rss, 1)
+        result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        for store in stores.values():
+            store.close()
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        gc.collect()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+# 比较时关注的指标：(阶段, 指标, 越大越好)
+COMPARE_METRICS = [
+    ("insert", "rows_per_sec", True),
+    ("ngram", "build_s", False), ("ngram", "p50_ms", False), ("ngram", "p99_ms", False),
+    ("filter", "p50_ms", False), ("filter", "p99_ms", False),
+    ("fts", "p50_ms", False), ("fts", "p99_ms", False),
+    ("vector", "build_s", False), ("vector", "p50_ms", False), ("vector", "p99_ms", False),
+    (None, "rss_delta_mb", False),
+]
+
+
+def compare(old: Dict, new: Dict):
+    """按规模对齐两次结果，打印各指标的相对变化（正数表示变好）。"""
+    old_by_size = {r["size"]: r for r in old.get("results", [])}
+    print(f"\n与 {old.get('commit') or '旧结果'} 比较：")
+    for r in new["results"]:
+        prev = old_by_size.get(r["size"])
+        if prev is None:
+            continue
+        for stage, metric, higher_better in COMPARE_METRICS:
+            a = (prev.get(stage) or {}).get(metric) if stage else prev.get(metric)
+            b = (r.get(stage) or {}).get(metric) if stage else r.get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a * (1 if higher_better else -1)
+            flag = "  <-- 退化" if change < -0.1 else ""
+            name = f"{stage}.{metric}" if stage else metric
+            print(f"  {r['size']:>8} {name:<22} {a:>12.3f} -> {b:>12.3f}  {change:+.1%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="记忆层与检索层的规模基准")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="逗号分隔的语料规模（最大 1000000）")
+    parser.add_argument("--queries", type=int, default=200, help="每个检索后端的查询条数")
+    parser.add_argument("--seed", type=int, default=0, help="语料随机种子")
+    parser.add_argument("--skip", default="", help=f"逗号分隔的跳过阶段，可选 {','.join(STAGES[1:])}")
+    parser.add_argument("--write-behind", action="store_true", help="记忆体使用写后批量提交")
+    parser.add_argument("--dim", type=int, default=128, help="离线嵌入维度")
+    parser.add_argument("--index-type", default="flat", help="向量索引类型，见 memory/ann_index.py")
+    parser.add_argument("--vector-batch", type=int, default=10000, help="向量库每次 add_batch 的条数")
+    parser.add_argument("--json", default="memory_scale.json", help="结果 JSON 文件")
+    parser.add_argument("--compare", help="与该旧结果 JSON 比较")
+    args = parser.parse_args()
+    args.skip = {s for s in args.skip.split(",") if s}
+
+    queries = generate_queries(args.queries)
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        print(f"规模 {size}：")
+        results.append(run_size(size, args, queries))
+
+    report = {
+        "benchmark": "memory_scale",
+        "commit": git_commit(),
+        "created": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {k: (sorted(v) if isinstance(v, set) else v) for k, v in vars(args).items()
+                   if k not in ("json", "compare")},
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+    with open(args.json, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/synthetic.py
+"""
+基准测试用的合成记忆语料与离线嵌入：
+- generate_corpus()：按固定种子生成可复现的三大记忆体记录，中文与中英混排文本、
+  与线上一致的 key 形式（"user:意图;短语"、时间戳 key、概念名）和递增的 Unix 秒时间戳
+- HashEmbeddingStore：VectorStore 子类，用字符 n-gram 特征哈希代替 Ollama 嵌入，
+  结果确定、无需网络，相似文本的向量也相近，适合衡量索引与检索本身的开销
+"""
+
+import random
+import zlib
+from typing import Dict, Iterator, List, NamedTuple
+
+import faiss
+import numpy as np
+
+from memory.vector_store import VectorStore
+
+TOPICS: Dict[str, List[str]] = {
+    "吃饭": ["早餐", "午饭", "晚饭", "夜宵", "外卖", "火锅", "拉面"],
+    "睡眠": ["午睡", "失眠", "早睡", "熬夜", "作息"],
+    "运动": ["跑步", "游泳", "健身", "瑜伽", "骑行", "羽毛球"],
+    "学习": ["英语", "数学", "Python", "机器学习", "阅读笔记"],
+    "工作": ["会议", "周报", "需求评审", "上线", "出差"],
+    "健康": ["体检", "血压", "体重", "喝水", "感冒"],
+    "旅行": ["机票", "酒店", "签证", "行程", "景点"],
+    "购物": ["手机", "耳机", "衣服", "日用品", "书"],
+}
+NAMES = ["小王", "李雷", "韩梅梅", "Alice", "Bob", "张老师", "老板"]
+PLACES = ["公司楼下", "家里", "学校", "健身房", "咖啡馆", "Shanghai", "Beijing"]
+TEMPLATES = [
+    "{day}在{place}{sub}，感觉{mood}。",
+    "用户说{day}的{sub}安排在 {hh}:{mm}，需要提前提醒。",
+    "和{name}聊到{topic}，对方建议{sub}每周至少 {n} 次。",
+    "{day}花了 {price} 元在{sub}上，比预算{cmp}。",
+    "记录：{topic} / {sub}，持续 {n} 分钟，评分 {score}/10。",
+    "Today I did some {sub_en} at {place}, about {n} minutes, 感觉{mood}.",
+    "TODO: {day}之前完成{sub}相关的 {n} 项任务（priority={score}）。",
+]
+DAYS = ["今天", "昨天", "周一", "周三", "周末", "上个月", "前天晚上"]
+MOODS = ["不错", "有点累", "很满意", "一般", "比预期好", "需要调整"]
+CMPS = ["多一些", "少一些", "差不多"]
+SUB_EN = ["running", "reading", "coding", "swimming", "shopping", "cooking"]
+GOALS = ["本月跑步 {n} 公里", "每天睡够 {h} 小时", "读完 {n} 本书", "体重减到 {w} 公斤", "学完 {sub} 课程"]
+
+# 各记忆体在语料中的占比
+TIER_SHARES = {"episodic": 0.8, "semantic": 0.1, "mission": 0.1}
+
+
+class SyntheticRecord(NamedTuple):
+    tier: str
+    key: str
+    content: str
+    timestamp: int
+
+
+def _sentence(rng: random.Random, topic: str, sub: str) -> str:
+    return rng.choice(TEMPLATES).format(
+        day=rng.choice(DAYS), place=rng.choice(PLACES), sub=sub, topic=topic, mood=rng.choice(MOODS),
+        hh=f"{rng.randint(6, 23):02d}", mm=f"{rng.choice((0, 15, 30, 45)):02d}", name=rng.choice(NAMES),
+        n=rng.randint(1, 60), price=rng.randint(5, 3000), cmp=rng.choice(CMPS), score=rng.randint(1, 10),
+        sub_en=rng.choice(SUB_EN),
+    )
+
+
+def generate_corpus(n: int, seed: int = 0, start_ts: int = 1700000000) -> Iterator[SyntheticRecord]:
+    """
+    生成 n 条记录（按 TIER_SHARES 分配到三大记忆体），同一 (n, seed) 每次结果相同。
+    时间戳从 start_ts 开始按平均 90 秒的间隔递增。
+    """
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    ts = start_ts
+    counts = {tier: int(n * share) for tier, share in TIER_SHARES.items()}
+    counts["episodic"] += n - sum(counts.values())
+    tiers = [tier for tier, c in counts.items() for _ in range(c)]
+    rng.shuffle(tiers)
+    for i, tier in enumerate(tiers):
+        ts += int(rng.expovariate(1 / 90)) + 1
+        topic = rng.choice(topics)
+        sub = rng.choice(TOPICS[topic])
+        if tier == "episodic":
+            # 与对话流程写入的 key 一致：带角色前缀的意图短语，或 record 分支的时间戳 key
+            role = rng.choice(("user", "assistant", "record"))
+            key = str(ts) if role == "record" else f"{role}:{topic};{sub}"
+            content = _sentence(rng, topic, sub)
+        elif tier == "semantic":
+            # 语义记忆 key 唯一
+            key = f"{topic}·{sub}#{i}"
+            content = f"{topic}（{sub}）：" + _sentence(rng, topic, sub) + _sentence(rng, topic, sub)
+        else:
+            key = f"{ts}.{i}"
+            content = rng.choice(GOALS).format(n=rng.randint(2, 200), h=rng.randint(6, 9),
+                                               w=rng.randint(50, 90), sub=sub)
+        yield SyntheticRecord(tier, key, content, ts)
+
+
+def generate_queries(n: int, seed: int = 1) -> List[str]:
+    """检索短语：意图词、子话题、两者组合及中英混排短语。"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        topic = rng.choice(list(TOPICS))
+        sub = rng.choice(TOPICS[topic])
+        queries.append(rng.choice((topic, sub, f"{topic}{sub}", f"{sub} {rng.choice(SUB_EN)}",
+                                   f"{rng.choice(DAYS)}{sub}")))
+    return queries
+
+
+class HashEmbeddingStore(VectorStore):
+    """
+    离线、确定性的 VectorStore：字符 1/2-gram 经 crc32 哈希到 dim 维（带符号），L2 归一化。
+    不访问 Ollama、不使用嵌入缓存，其余索引逻辑与 VectorStore 完全相同。
+    """
+
+    def __init__(self, dim: int = 128, **kwargs):
+        kwargs.setdefault("use_cache", False)
+        kwargs.setdefault("max_workers", 1)
+        kwargs.setdefault("batch_size", 4096)
+        super().__init__(dim=dim, **kwargs)
+
+    def _embed_chunk(self, texts: List[str]) -> np.ndarray:
+        vecs = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            grams = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+            for g in grams:
+                h = zlib.crc32(g.encode("utf-8"))
+                vecs[row, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        faiss.normalize_L2(vecs)
+        return vecs
@@ -19,4 +19,11 @@ MODEL_NAME1 = "deepseek-llm:latest"
 MODEL_NAME2 = "deepseek-r1:7b"
 
 # Ollama HTTP 接口地址
-MODEL_URL = "http://localhost:11434/v1/chat/completions"
\ No newline at end of file
+MODEL_URL = "http://localhost:11434/v1/chat/completions"
+
+# 分阶段追踪：每轮对话的 span 树追加写入 sink（JSONL），各阶段的 p50/p95/p99 保留在进程内
+TRACING_CONFIG = {
+    "enabled": True,
+    "sink": "traces.jsonl",   # None 时只统计不写文件
+    "max_samples": 4096,      # 每个阶段保留的最近耗时样本数
+}
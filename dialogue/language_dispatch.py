@@ -1,5 +1,7 @@
 # 语言调度器模块
 from llm.llm_client import Llama3Client
+from dialogue.prompt_builder import PromptBuilder
+from utils.tracing import get_tracer
 
 
 class LanguageDispatcher:
@@ -7,17 +9,21 @@ class LanguageDispatcher:
     负责构建多角色对话消息 (roles)、调用 LLM 并返回最终回复。
     """
 
-    def __init__(self, llm_client, system_prompt: str = None, abstractor=None, default_model: str = "gpt-3.5-turbo"):
+    def __init__(self, llm_client, system_prompt: str = None, abstractor=None, default_model: str = "gpt-3.5-turbo",
+                 prompt_builder: PromptBuilder = None, layout: str = "blocks"):
         """
         :param llm_client: LLMClient 或 LocalLLMClient 实例
         :param system_prompt: 系统提示词
         :param abstractor: Abstractor 实例（可选）
         :param default_model: 默认模型名
+        :param prompt_builder: 按 token 预算组装消息的 PromptBuilder，默认按 LLM_CONFIG 的上下文窗口与粗估分词
+        :param layout: 未传入 prompt_builder 时使用的消息布局，"stable" 为前缀稳定布局（可复用服务端 KV 缓存）
         """
         self.llm = llm_client
         self.system_prompt = system_prompt or "你是用户的私人助理AGI，你的所有回复应该是更像一个私人管家，称号用户为先生，语气温柔一点。"
         self.abstractor = abstractor
         self.default_model = default_model
+        self.prompt_builder = prompt_builder or PromptBuilder(self.system_prompt, layout=layout)
 
     def generate_response(
         self,
@@ -36,19 +42,7 @@ class LanguageDispatcher:
         :param max_tokens: 最大 tokens
         :return: LLM 返回的回复
         """
-        # —— 1. 准备记忆块和历史对话块 —— 
-        mem_text = working_memory.get_memories_text()
-        ctx_text = working_memory.get_context_text()
-        intent_str = ", ".join(intents)
-
-        # —— 2. 构造 OpenAI-compatible messages 格式 —— 
-        messages = [
-            {"role": "system",    "content": self.system_prompt},
-            {"role": "assistant", "content": "历史记忆：\n" + (mem_text or "（无记忆）")},
-            {"role": "assistant", "content": "对话历史：\n" + (ctx_text or "（无历史）")},
-            {"role": "assistant", "content": f"当前意图：{intent_str}"},
-            {"role": "user",      "content": user_input},
-        ]
+        messages = self._build_messages(user_input, intents, working_memory, max_tokens)
 
         # —— 3. 调用 LLMClient.chat —— 
         try:
@@ -60,4 +54,56 @@ class LanguageDispatcher:
             )
         except Exception as err:
             print(f"[LanguageDispatcher] LLM 调用失败：{err}")
-            return "抱歉，处理请求失败，请稍后重试。"
\ No newline at end of file
+            return "抱歉，处理请求失败，请稍后重试。"
+
+    def generate_response_stream(
+        self,
+        user_input: str,
+        intents: list[str],
+        working_memory,
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+    ):
+        """
+        与 generate_response 相同的 prompt，但通过 llm.chat_stream() 逐段 yield 回复，
+        结束后打印首字延迟（TTFT）和生成速度。调用失败且尚未输出内容时 yield 兜底回复。
+        """
+        messages = self._build_messages(user_input, intents, working_memory, max_tokens)
+        produced = False
+        try:
+            for delta in self.llm.chat_stream(
+                messages=messages,
+                model=self.default_model,
+                temperature=temperature,
+                max_tokens=max_tokens
+            ):
+                produced = True
+                yield delta
+        except Exception as err:
+            print(f"[LanguageDispatcher] LLM 调用失败：{err}")
+            if not produced:
+                yield "抱歉，处理请求失败，请稍后重试。"
+            return
+
+        stats = self.llm.last_stream_stats
+        if stats.get("ttft") is not None:
+            rate = stats.get("tokens_per_sec") or 0.0
+            # 首字延迟单独计入统计，生成量记到调用方的 generation span 上
+            tracer = get_tracer()
+            tracer.record("ttft", stats["ttft"])
+            span = tracer.current()
+            if span is not None:
+                span.set(ttft=round(stats["ttft"], 4), tokens=stats["tokens"])
+            print(f"\n[LanguageDispatcher] 首字延迟 {stats['ttft']:.2f}s，"
+                  f"生成 {stats['tokens']} tokens，{rate:.1f} tokens/s")
+
+    def _build_messages(self, user_input: str, intents: list[str], working_memory,
+                        max_tokens: int = None) -> list[dict]:
+        """
+        按 token 预算与布局组装 OpenAI-compatible messages，
+        超出预算时按优先级丢弃较旧的对话与低分记忆，见 dialogue/prompt_builder.py。
+        """
+        with get_tracer().span("prompt_build") as span:
+            messages = self.prompt_builder.build(user_input, intents, working_memory, max_tokens)
+            span.set(**self.prompt_builder.last_stats)
+        return messages
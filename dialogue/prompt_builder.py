@@ -0,0 +1,221 @@
+# dialogue/prompt_builder.py
+
+from typing import Dict, List, Optional
+
+from config import LLM_CONFIG
+from utils.tokens import make_token_counter
+
+
+class PromptBuilder:
+    """
+    按 token 预算组装对话消息，预算 = 上下文窗口 - 预留的生成长度。
+    按优先级依次填充，放不下的部分丢弃：
+    1. 系统提示词、当前意图与用户输入（必选）
+    2. 最近 recent_turns 条对话（从新到旧）
+    3. 记忆条目（按检索分数从高到低，单条放不下时跳过，继续尝试更短的）
+    4. 更早的对话（从新到旧，遇到放不下的即停止，保证历史连续）
+    消息布局（layout）：
+    - "blocks"：与之前一致，系统提示词、历史记忆、对话历史、当前意图、用户输入
+    - "stable"：前缀稳定布局，系统提示词、逐条的历史对话消息（不带时间戳）、
+      末尾才是每轮都会变化的记忆与意图，最后是用户输入。相邻两轮的消息前缀逐字节相同且只追加，
+      服务端（Ollama）可以复用上一轮的 KV 缓存，只对新增部分做 prefill。
+      超出预算或历史起点被工作记忆淘汰时，历史从最早处一次性裁掉约一半，之后若干轮前缀又保持稳定，
+      而不是每轮滑动窗口
+    prefill 时间随 prompt token 数线性增长，每次组装的统计保存在 last_stats 中。
+    """
+
+    LAYOUTS = ("blocks", "stable")
+
+    def __init__(self, system_prompt: str, context_window: int = None, reserve_tokens: int = 512,
+                 tokenizer=None, recent_turns: int = 4, message_overhead: int = 4, verbose: bool = True,
+                 layout: str = "blocks"):
+        """
+        :param context_window: 模型上下文窗口（token），默认 LLM_CONFIG["context_window"]
+        :param reserve_tokens: 为生成预留的 token 数，build() 传入 max_tokens 时以其为准
+        :param tokenizer: 分词器，见 make_token_counter；None 时使用粗估
+        :param recent_turns: 优先保留的最近对话条数（一问一答为 2 条）
+        :param message_overhead: 每条消息的角色/分隔符开销（token）
+        :param verbose: 是否打印每次组装的 token 统计
+        :param layout: 消息布局，"blocks" 或 "stable"
+        """
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"不支持的 layout：{layout}，可选 {self.LAYOUTS}")
+        self.system_prompt = system_prompt
+        self.context_window = context_window or LLM_CONFIG["context_window"]
+        self.reserve_tokens = reserve_tokens
+        self.count_tokens = make_token_counter(tokenizer)
+        self.recent_turns = recent_turns
+        self.message_overhead = message_overhead
+        self.verbose = verbose
+        self.layout = layout
+        self.last_stats: Dict[str, int] = {}
+        # stable 布局下历史的起点（工作记忆中的条目对象），只在超出预算或被工作记忆淘汰时前移
+        self._anchor = None
+
+    def budget(self, max_tokens: Optional[int] = None) -> int:
+        """prompt 可用的 token 数。"""
+        return self.context_window - (max_tokens or self.reserve_tokens)
+
+    def _message_tokens(self, content: str) -> int:
+        return self.count_tokens(content) + self.message_overhead
+
+    def build(self, user_input: str, intents: List[str], working_memory,
+              max_tokens: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        :param working_memory: WorkingMemory 实例（使用其 context / memories 条目上缓存的文本行与 token 数）
+        :param max_tokens: 本次生成的最大 token 数，用于计算预算
+        :return: OpenAI 兼容的 messages 列表
+        """
+        budget = self.budget(max_tokens)
+        if self.layout == "stable":
+            return self._build_stable(user_input, intents, working_memory, budget)
+        intent_msg = f"当前意图：{', '.join(intents)}"
+        mem_header, ctx_header = "历史记忆：\n", "对话历史：\n"
+
+        # 1. 必选部分（含记忆块与历史块的标题和消息开销）
+        used = (self._message_tokens(self.system_prompt) + self._message_tokens(intent_msg)
+                + self._message_tokens(user_input)
+                + self._message_tokens(mem_header) + self._message_tokens(ctx_header))
+
+        context = working_memory.context
+        turn_cost = [self._tokens(working_memory, entry, "tokens", entry.line) + 1 for entry in context]
+        kept_turns = set()
+
+        def fill_turns(indices):
+            # 从新到旧填充，遇到放不下的即停止，保证保留的历史连续
+            nonlocal used
+            for i in indices:
+                if used + turn_cost[i] > budget:
+                    return
+                used += turn_cost[i]
+                kept_turns.add(i)
+
+        # 2. 最近的对话
+        n = len(context)
+        recent = list(range(n - 1, max(n - self.recent_turns, 0) - 1, -1))
+        fill_turns(recent)
+
+        # 3. 记忆：按分数从高到低
+        memories = working_memory.memories
+        kept_mems, used = self._fill_memories(working_memory, used, budget)
+
+        # 4. 更早的对话：只在最近对话全部保留时继续，保证历史连续
+        if len(kept_turns) == len(recent):
+            fill_turns(range(n - len(recent) - 1, -1, -1))
+
+        if len(kept_mems) == len(memories):
+            mem_text = working_memory.get_memories_text()
+        else:
+            mem_text = "\n".join(memories[i].line for i in kept_mems)
+        # 历史全部放得下时直接复用工作记忆缓存的文本块
+        if len(kept_turns) == n:
+            ctx_text = working_memory.get_context_text()
+        else:
+            ctx_text = "\n".join(context[i].line for i in sorted(kept_turns))
+        if not mem_text:
+            used += self.count_tokens("（无记忆）")
+        if not ctx_text:
+            used += self.count_tokens("（无历史）")
+
+        self.last_stats = {
+            "prompt_tokens": used,
+            "budget": budget,
+            "memories": len(kept_mems),
+            "memories_total": len(memories),
+            "turns": len(kept_turns),
+            "turns_total": n,
+        }
+        if self.verbose:
+            print(f"[PromptBuilder] prompt 约 {used} tokens / 预算 {budget}"
+                  f"（记忆 {len(kept_mems)}/{len(memories)}，对话 {len(kept_turns)}/{n}）")
+
+        return [
+            {"role": "system",    "content": self.system_prompt},
+            {"role": "assistant", "content": mem_header + (mem_text or "（无记忆）")},
+            {"role": "assistant", "content": ctx_header + (ctx_text or "（无历史）")},
+            {"role": "assistant", "content": intent_msg},
+            {"role": "user",      "content": user_input},
+        ]
+
+    def _tokens(self, working_memory, entry, attr: str, text: str) -> int:
+        """工作记忆与本构建器使用同一计数函数时，直接复用条目写入时缓存的 token 数。"""
+        if getattr(working_memory, "count_tokens", None) is self.count_tokens:
+            return getattr(entry, attr)
+        return self.count_tokens(text)
+
+    def _fill_memories(self, working_memory, used: int, budget: int):
+        """按检索分数从高到低放入记忆，单条放不下时跳过；返回 (保留的下标, 新的 used)。"""
+        memories = working_memory.memories
+        order = sorted(range(len(memories)), key=lambda i: -(memories[i].get("score") or 0.0))
+        kept = set()
+        for i in order:
+            cost = self._tokens(working_memory, memories[i], "tokens", memories[i].line) + 1
+            if used + cost <= budget:
+                used += cost
+                kept.add(i)
+        return sorted(kept), used
+
+    def _anchor_index(self, history) -> Optional[int]:
+        """锚点在历史中的下标；还没有锚点时为 0，锚点已被工作记忆淘汰时为 None。"""
+        if self._anchor is None:
+            return 0
+        for i, entry in enumerate(history):
+            if entry is self._anchor:
+                return i
+        return None
+
+    def _build_stable(self, user_input: str, intents: List[str], working_memory, budget: int):
+        # 当前输入已由调用方加入工作记忆时，只作为末尾的用户消息发送，不在历史中重复
+        history = list(working_memory.context)
+        if history and history[-1]["role"] == "user" and history[-1]["text"] == user_input:
+            history.pop()
+        intent_msg = f"当前意图：{', '.join(intents)}"
+        mem_header = "参考记忆：\n"
+        used = (self._message_tokens(self.system_prompt) + self._message_tokens(user_input)
+                + self._message_tokens(intent_msg) + self.count_tokens(mem_header))
+
+        # 历史从锚点开始整体保留；放不下、或锚点已被工作记忆的环形缓冲区淘汰时，
+        # 锚点一次前移到只占剩余预算的一半，并对齐到用户消息，之后若干轮前缀又保持稳定
+        costs = [self._tokens(working_memory, entry, "text_tokens", entry.text) + self.message_overhead
+                 for entry in history]
+        start = self._anchor_index(history)
+        evicted = start is None
+        if evicted:
+            # 淘汰是逐轮发生的：只保留缓冲区容量一半以内的最近历史，新锚点在之后几轮内不会被淘汰
+            capacity = getattr(working_memory.context, "maxlen", None) or len(history)
+            start = max(len(history) - capacity // 2, 0)
+        total = sum(costs[start:])
+        trimmed = evicted or used + total > budget
+        if trimmed:
+            target = max(budget - used, 0) // 2
+            while start < len(history) and (total > target or history[start]["role"] != "user"):
+                total -= costs[start]
+                start += 1
+        self._anchor = history[start] if start < len(history) else None
+        used += total
+        prefix_tokens = self._message_tokens(self.system_prompt) + total
+
+        kept_mems, used = self._fill_memories(working_memory, used, budget)
+        mem_text = "\n".join(working_memory.memories[i].line for i in kept_mems)
+        tail = (mem_header + mem_text + "\n" if mem_text else "") + intent_msg
+
+        turns = len(history) - start
+        self.last_stats = {
+            "prompt_tokens": used,
+            "budget": budget,
+            "prefix_tokens": prefix_tokens,
+            "memories": len(kept_mems),
+            "memories_total": len(working_memory.memories),
+            "turns": turns,
+            "turns_total": len(history),
+        }
+        if self.verbose:
+            print(f"[PromptBuilder] prompt 约 {used} tokens / 预算 {budget}，稳定前缀约 {prefix_tokens} tokens"
+                  f"（记忆 {len(kept_mems)}/{len(working_memory.memories)}，对话 {turns}/{len(history)}"
+                  f"{'，历史已裁剪' if trimmed else ''}）")
+
+        return (
+            [{"role": "system", "content": self.system_prompt}]
+            + [{"role": entry["role"], "content": entry["text"]} for entry in history[start:]]
+            + [{"role": "assistant", "content": tail}, {"role": "user", "content": user_input}]
+        )
@@ -0,0 +1,201 @@
+# dialogue/turn_pipeline.py
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from intent.intent_detector import IntentRoute
+from utils.tools import Tools
+from utils.tracing import bind, get_tracer
+
+
+def merge_hits(primary: List[Dict], secondary: List[Dict], top_k: int) -> List[Dict]:
+    """
+    合并两路检索结果：按 (source, key, content) 去重，保留较高分数，按分数降序取前 top_k。
+    分数相同时 primary（意图短语检索）优先。
+    """
+    merged: Dict[tuple, Dict] = {}
+    for hit in primary + secondary:
+        ident = (hit["source"], hit["key"], hit["content"])
+        if ident not in merged or hit["score"] > merged[ident]["score"]:
+            merged[ident] = hit
+    results = sorted(merged.values(), key=lambda x: x["score"], reverse=True)
+    return results[:top_k]
+
+
+class TurnPipeline:
+    """
+    基于 asyncio 的单轮对话流水线，让互不依赖的阶段重叠执行：
+    - 意图识别（LLM 调用）进行的同时，先用原始输入做一次推测检索
+    - 意图返回后用检索短语再检索一次，与推测检索结果合并
+    - 回复流式输出完成后，记忆写入与摘要/抽象交给后台单线程写入器，不阻塞下一轮输入
+    同步组件（LLM、检索器、记忆体）都在线程池中运行；写入器只有一个线程，保证写入顺序。
+    记忆体按线程分配 SQLite 连接（StorageEngine 或 write_behind.ThreadConnections），线程池与写入线程不共享连接。
+    每轮是一个 "turn" 追踪记录，各阶段为其子 span（见 utils/tracing.py），交给线程池时带上当前上下文。
+    """
+
+    def __init__(self, intent_detector, retriever, dispatcher, wm, em_store, sm_store, ms_store,
+                 abstractor, top_k: int = 5, summarize_every: int = 10, speculative: bool = True,
+                 abstraction_worker=None):
+        """
+        :param abstraction_worker: 可选的 AbstractionWorker；传入时摘要与抽象交给它在后台执行，
+            写入线程不再等待 LLM，drain() 也只等待记忆写入
+        :param summarize_every: 工作记忆达到多少条时摘要并写入语义记忆体
+        :param speculative: 是否在意图识别期间用原始输入做推测检索
+        """
+        self.intent_detector = intent_detector
+        self.retriever = retriever
+        self.dispatcher = dispatcher
+        self.wm = wm
+        self.em_store = em_store
+        self.sm_store = sm_store
+        self.ms_store = ms_store
+        self.abstractor = abstractor
+        self.abstraction_worker = abstraction_worker
+        self.top_k = top_k
+        self.summarize_every = summarize_every
+        self.speculative = speculative
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-writer")
+        self._background: set = set()
+        self.last_timings: Dict[str, float] = {}
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, bind(fn), *args)
+
+    async def _detect_intent(self, user_input: str):
+        return await self._run(self.intent_detector.route, user_input)
+
+    async def _timed(self, name: str, coro):
+        start = time.perf_counter()
+        try:
+            with get_tracer().span(name):
+                return await coro
+        finally:
+            self.last_timings[name] = time.perf_counter() - start
+
+    async def retrieve(self, user_input: str) -> Tuple[IntentRoute, List[Dict]]:
+        """
+        意图识别与推测检索并发执行，意图返回后做短语检索并合并结果；
+        本地分类器直接命中时检索短语就是原始输入，推测检索的结果即可复用。
+        :return: (路由结果, 合并后的命中记忆)
+        """
+        intent_task = asyncio.ensure_future(self._timed("intent", self._detect_intent(user_input)))
+        spec_task = None
+        if self.speculative:
+            spec_task = asyncio.ensure_future(
+                self._timed("speculative_retrieval", self._run(self.retriever.query, user_input, self.top_k)))
+        route = await intent_task
+        if spec_task is not None and route.query == user_input:
+            return route, await spec_task
+        hits = await self._timed("intent_retrieval", self._run(self.retriever.query, route.query, self.top_k))
+        if spec_task is not None:
+            hits = merge_hits(hits, await spec_task, self.top_k)
+        return route, hits
+
+    async def run_turn(self, user_input: str,
+                       on_delta: Optional[Callable[[str], None]] = None) -> Dict:
+        """
+        执行一轮对话。on_delta 在生成线程中逐个收到回复增量（用于流式打印）。
+        :return: {"intents","route","hits","response","timings"}；记忆写入在返回后于后台完成
+        """
+        with get_tracer().trace("turn", input_chars=len(user_input)) as turn:
+            result = await self._run_turn(user_input, on_delta)
+            turn.set(label=result["route"].label, hits=len(result["hits"]))
+        return result
+
+    async def _run_turn(self, user_input: str, on_delta: Optional[Callable[[str], None]]) -> Dict:
+        self.last_timings = {}
+        start = time.perf_counter()
+        route, hits = await self._timed("retrieval", self.retrieve(user_input))
+        intents = route.query
+        mems = [
+            {"source": h["source"], "key": h["key"], "content": h["content"], "timestamp": h["timestamp"],
+             "score": h["score"]}
+            for h in hits
+        ]
+        self.wm.load_memories(mems)
+        self.wm.add_context("user", user_input)
+
+        def generate():
+            chunks = []
+            for delta in self.dispatcher.generate_response_stream(user_input, intents, self.wm):
+                if on_delta:
+                    on_delta(delta)
+                chunks.append(delta)
+            return "".join(chunks)
+
+        response = await self._timed("generation", self._run(generate))
+        self.wm.add_context("assistant", response)
+
+        # 需要摘要的对话片段在前台截取，LLM 摘要与写入在后台进行
+        to_summarize = None
+        if len(self.wm.context) >= self.summarize_every:
+            to_summarize = self.wm.recent(self.summarize_every)
+            self.wm.truncate(2)
+        self._submit(self._persist_turn, user_input, intents, route.label, response, to_summarize)
+
+        self.last_timings["total"] = time.perf_counter() - start
+        return {"intents": intents, "route": route, "hits": hits, "response": response, "timings": dict(self.last_timings)}
+
+    def _submit(self, fn, *args):
+        future = self._writer.submit(bind(fn), *args)
+        self._background.add(future)
+        future.add_done_callback(self._on_background_done)
+
+    def _on_background_done(self, future):
+        self._background.discard(future)
+        err = future.exception()
+        if err is not None:
+            print(f"[TurnPipeline] 后台记忆写入失败：{err}")
+
+    def _persist_turn(self, user_input: str, intents: str, label: str, response: str,
+                      to_summarize: Optional[List[Dict]]):
+        """在写入线程中执行：记录本轮对话、摘要、按意图更新记忆。"""
+        with get_tracer().span("memory_write", label=label):
+            self._persist(user_input, intents, label, response, to_summarize)
+
+    def _persist(self, user_input: str, intents: str, label: str, response: str,
+                 to_summarize: Optional[List[Dict]]):
+        # —— 自动记录用户输入与助手回复到 Episodic Memory ——
+        self.em_store.add(key="user:" + ";".join(intents), content=user_input, timestamp=Tools.get_timestamp())
+        self.em_store.add(key="assistant:" + ";".join(intents), content=response, timestamp=Tools.get_timestamp())
+
+        # —— 定期生成摘要并存入 Semantic Memory ——
+        if to_summarize and self.abstraction_worker is not None:
+            self.abstraction_worker.submit_conversation(to_summarize)
+        elif to_summarize:
+            summary = self.abstractor.abstract_conversation(to_summarize)
+            self.sm_store.add(key="conversation_summary", content=summary, timestamp=Tools.get_timestamp())
+
+        # —— 根据意图更新记忆 ——
+        if label == 'record':
+            self.em_store.add(Tools.get_timestamp(), user_input)
+        elif label == 'update_goal':
+            self.ms_store.add(Tools.get_timestamp(), user_input)
+        elif label == 'update_memory':
+            self.sm_store.add(Tools.get_timestamp(), user_input)
+        elif label == 'clear_memory':
+            # 先等排队中的抽象写完，避免清空后又写回旧摘要
+            if self.abstraction_worker is not None:
+                self.abstraction_worker.flush()
+            self.em_store.clear(); self.sm_store.clear(); self.ms_store.clear()
+        elif label == 'abstract' and self.abstraction_worker is not None:
+            self.abstraction_worker.submit_key(
+                user_input, callback=lambda key, summary: print(f"\nAssistant: 抽象结果：{summary}"))
+        elif label == 'abstract':
+            summary = self.abstractor.abstract(user_input)
+            print(f"\nAssistant: 抽象结果：{summary}")
+
+    @property
+    def pending(self) -> int:
+        """尚未完成的后台写入任务数。"""
+        return len(self._background)
+
+    async def drain(self):
+        """等待所有后台写入完成。"""
+        await self._run(self._writer.submit(lambda: None).result)
+
+    def close(self):
+        """等待后台写入完成并关闭写入线程。"""
+        self._writer.shutdown(wait=True)
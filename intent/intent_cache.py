@@ -0,0 +1,193 @@
+# intent/intent_cache.py
+
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from utils import tracing
+
+_SPACE = re.compile(r"\s+")
+# 首尾的标点与语气符号不影响意图，归一化时去掉
+_EDGE_PUNCT = "。，！？!?,.~～…、；;：: "
+
+
+def normalize_input(text: str) -> str:
+    """意图缓存的输入归一化：NFKC（全角转半角）、转小写、合并空白、去掉首尾标点。"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _SPACE.sub(" ", text).strip()
+    return text.strip(_EDGE_PUNCT)
+
+
+class IntentCache:
+    """
+    detect_intent 结果的记忆化缓存（temperature=0 时输出只取决于归一化后的输入和模型）：
+    - 内存层：按 (模型, 归一化输入) 的有界 LRU，超过 max_entries 淘汰最久未使用的条目
+    - 磁盘层（可选，db_path 不为 None 时启用）：SQLite 持久化，进程重启后仍可命中，
+      维护行数计数，只在超过 max_disk_entries 时才清理过期条目并按最近访问时间淘汰
+    - 两层条目都在 ttl 秒后过期（ttl=None 表示不过期）
+    - 记录内存命中/磁盘命中/未命中计数，内存层与磁盘层的淘汰分别计数
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 7 * 24 * 3600,
+                 db_path: Optional[str] = "intent_cache.db", max_disk_entries: int = 100000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.disk_entries = 0
+        self.conn = None
+        if db_path:
+            self.conn = tracing.connect(db_path, check_same_thread=False)
+            self._ensure_table()
+            self.disk_entries = self.conn.execute("SELECT COUNT(*) FROM intent_cache").fetchone()[0]
+
+    def _ensure_table(self):
+        """创建磁盘缓存表和淘汰用的访问时间、创建时间索引。"""
+        c = self.conn.cursor()
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS intent_cache (
+            model TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created REAL NOT NULL,
+            last_access REAL NOT NULL,
+            PRIMARY KEY (model, hash)
+        )
+        """)
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_intent_cache_access
+        ON intent_cache(last_access)
+        """)
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_intent_cache_created
+        ON intent_cache(created)
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def _hash(normalized: str) -> str:
+        return hashlib.md5(normalized.encode()).hexdigest()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, model: str, text: str) -> Optional[str]:
+        """查询缓存，未命中或已过期时返回 None。"""
+        normalized = normalize_input(text)
+        key = (model, normalized)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, created = entry
+                if not self._expired(created, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+
+            if self.conn is not None:
+                c = self.conn.cursor()
+                h = self._hash(normalized)
+                c.execute("SELECT result, created FROM intent_cache WHERE model = ? AND hash = ?", (model, h))
+                row = c.fetchone()
+                if row is not None:
+                    result, created = row
+                    if not self._expired(created, now):
+                        c.execute("UPDATE intent_cache SET last_access = ? WHERE model = ? AND hash = ?",
+                                  (now, model, h))
+                        self.conn.commit()
+                        self._remember(key, result, created)
+                        self.disk_hits += 1
+                        return result
+                    c.execute("DELETE FROM intent_cache WHERE model = ? AND hash = ?", (model, h))
+                    self.disk_entries -= c.rowcount
+                    self.conn.commit()
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, result: str):
+        """写入缓存（内存层与磁盘层）。"""
+        normalized = normalize_input(text)
+        now = time.time()
+        with self._lock:
+            self._remember((model, normalized), result, now)
+            if self.conn is not None:
+                c = self.conn.cursor()
+                h = self._hash(normalized)
+                c.execute("SELECT 1 FROM intent_cache WHERE model = ? AND hash = ?", (model, h))
+                if c.fetchone() is None:
+                    self.disk_entries += 1
+                c.execute("""
+                INSERT OR REPLACE INTO intent_cache(model, hash, result, created, last_access)
+                VALUES (?, ?, ?, ?, ?)
+                """, (model, h, result, now, now))
+                if self.disk_entries > self.max_disk_entries:
+                    self._evict_disk()
+                self.conn.commit()
+
+    def _remember(self, key: Tuple[str, str], result: str, created: float):
+        self._entries[key] = (result, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _evict_disk(self):
+        """磁盘层超过上限时先删除过期条目，仍超出则删除最久未访问的条目，淘汰到上限的 90%。"""
+        c = self.conn.cursor()
+        if self.ttl is not None:
+            c.execute("DELETE FROM intent_cache WHERE created < ?", (time.time() - self.ttl,))
+            self.disk_entries -= c.rowcount
+            self.disk_evictions += c.rowcount
+        if self.disk_entries <= self.max_disk_entries:
+            return
+        excess = self.disk_entries - int(self.max_disk_entries * 0.9)
+        c.execute("""
+        DELETE FROM intent_cache WHERE rowid IN (
+            SELECT rowid FROM intent_cache ORDER BY last_access ASC LIMIT ?
+        )
+        """, (excess,))
+        self.disk_entries -= c.rowcount
+        self.disk_evictions += c.rowcount
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中/未命中计数、命中率，以及内存层与磁盘层各自的条目数和淘汰数。"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "disk_evictions": self.disk_evictions,
+                "disk_entries": self.disk_entries,
+            }
+
+    def clear(self):
+        """清空内存层与磁盘层。"""
+        with self._lock:
+            self._entries.clear()
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM intent_cache")
+                self.conn.commit()
+                self.disk_entries = 0
+
+    def close(self):
+        """关闭数据库连接。"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,188 @@
+# intent/intent_classifier.py
+
+import argparse
+import json
+import math
+import os
+import pickle
+import random
+import sqlite3
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from intent.intent_cache import normalize_input
+from memory.ngram_index import char_ngrams
+
+# 主循环据以分支的路由标签，顺序与 main.py / maintest.py 中 if/elif 的判断顺序一致
+ROUTE_LABELS = ("record", "update_goal", "update_memory", "clear_memory", "abstract", "other")
+_BIAS = "\0bias"
+
+
+def label_from_intent(intent: str) -> str:
+    """按主循环的规则（子串判断、先到先得）把 LLM 输出的意图串映射成路由标签。"""
+    for label in ROUTE_LABELS[:-1]:
+        if label in intent:
+            return label
+    return "other"
+
+
+def load_turn_log(path: str) -> List[Tuple[str, str]]:
+    """
+    读取 IntentDetector 记录的 JSONL 日志（每行 {"text","intent","label",...}）。
+    :return: [(用户输入, 路由标签)]
+    """
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            samples.append((rec["text"], rec.get("label") or label_from_intent(rec.get("intent", ""))))
+    return samples
+
+
+def load_em_turns(db_path: str = "em.db") -> List[Tuple[str, str]]:
+    """
+    从情景记忆体中恢复历史轮次：主循环以 key="user:" + ";".join(意图) 记录用户输入。
+    由分类器直接路由的轮次，意图就是原始输入，key 里没有 LLM 给出的标签，这些轮次不作为样本，
+    否则分类器会把自己处理过的输入都学成 "other"。
+    :return: [(用户输入, 路由标签)]
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT key, content FROM episodic_memory WHERE key LIKE 'user:%' ORDER BY id"
+        ).fetchall()
+    finally:
+        conn.close()
+    samples = []
+    for key, content in rows:
+        # ";".join 作用在字符串上，每个字符之间都插入了分号，这里还原
+        intent = key[5:].replace(";", "")
+        if intent == content.replace(";", ""):
+            continue
+        samples.append((content, label_from_intent(intent)))
+    return samples
+
+
+class IntentClassifier:
+    """
+    进程内的轻量路由分类器：归一化后的字符 n-gram（二值特征，按 1/sqrt(n) 缩放）+ 多类 softmax 线性模型。
+    - 权重按特征存成 {n-gram: 各标签权重向量}，预测只需累加输入中出现的几十个 n-gram，远低于 1ms
+    - predict 返回 (标签, 置信度)；输入中已知 n-gram 占比低于 min_coverage 时置信度为 0，交给 LLM
+    - 用 IntentDetector 记录的轮次日志或情景记忆体中的历史轮次训练
+    """
+
+    def __init__(self, ns: Tuple[int, ...] = (1, 2, 3), labels: Sequence[str] = ROUTE_LABELS,
+                 min_coverage: float = 0.3):
+        self.ns = ns
+        self.labels = tuple(labels)
+        self.min_coverage = min_coverage
+        self.weights: Dict[str, np.ndarray] = {}
+
+    def _features(self, text: str) -> List[str]:
+        return list(set(char_ngrams(normalize_input(text), self.ns)))
+
+    def _scores(self, feats: List[str]) -> Tuple[np.ndarray, float]:
+        scale = 1.0 / math.sqrt(len(feats)) if feats else 0.0
+        z = self.weights[_BIAS].copy() if _BIAS in self.weights else np.zeros(len(self.labels))
+        known = 0
+        for f in feats:
+            w = self.weights.get(f)
+            if w is not None:
+                z += w * scale
+                known += 1
+        return z, (known / len(feats) if feats else 0.0)
+
+    @staticmethod
+    def _softmax(z: np.ndarray) -> np.ndarray:
+        e = np.exp(z - z.max())
+        return e / e.sum()
+
+    def train(self, samples: List[Tuple[str, str]], epochs: int = 15, lr: float = 0.5,
+              seed: int = 0) -> "IntentClassifier":
+        """
+        SGD 训练 softmax 回归（交叉熵损失）。
+        :param samples: [(用户输入, 路由标签)]，不在 labels 中的标签按 "other" 处理
+        """
+        index = {label: i for i, label in enumerate(self.labels)}
+        other = index.get("other", len(self.labels) - 1)
+        data = [(self._features(text), index.get(label, other)) for text, label in samples]
+        self.weights = {_BIAS: np.zeros(len(self.labels))}
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            step = lr / (1 + epoch * 0.2)
+            for feats, y in data:
+                for f in feats:
+                    if f not in self.weights:
+                        self.weights[f] = np.zeros(len(self.labels))
+                z, _ = self._scores(feats)
+                grad = self._softmax(z)
+                grad[y] -= 1.0
+                grad *= step
+                scale = 1.0 / math.sqrt(len(feats)) if feats else 0.0
+                self.weights[_BIAS] -= grad
+                for f in feats:
+                    self.weights[f] -= grad * scale
+        return self
+
+    def predict_proba(self, text: str) -> Tuple[Dict[str, float], float]:
+        """:return: ({标签: 概率}, 已知 n-gram 覆盖率)"""
+        z, coverage = self._scores(self._features(text))
+        probs = self._softmax(z)
+        return dict(zip(self.labels, probs.tolist())), coverage
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """:return: (路由标签, 置信度)"""
+        if not self.weights:
+            return "other", 0.0
+        z, coverage = self._scores(self._features(text))
+        probs = self._softmax(z)
+        best = int(probs.argmax())
+        confidence = float(probs[best]) if coverage >= self.min_coverage else 0.0
+        return self.labels[best], confidence
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            pickle.dump({"ns": self.ns, "labels": self.labels, "min_coverage": self.min_coverage,
+                         "weights": self.weights}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        clf = cls(ns=data["ns"], labels=data["labels"], min_coverage=data["min_coverage"])
+        clf.weights = data["weights"]
+        return clf
+
+    @classmethod
+    def load_if_exists(cls, path: Optional[str]) -> Optional["IntentClassifier"]:
+        """模型文件存在时加载，否则返回 None（IntentDetector 将始终调用 LLM）。"""
+        if path and os.path.exists(path):
+            return cls.load(path)
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用历史轮次训练意图路由分类器")
+    parser.add_argument("--log", default="intent_log.jsonl", help="IntentDetector 的轮次日志")
+    parser.add_argument("--em", default="em.db", help="情景记忆体数据库（补充样本）")
+    parser.add_argument("--out", default="intent_classifier.pkl")
+    parser.add_argument("--epochs", type=int, default=15)
+    args = parser.parse_args()
+
+    samples = []
+    if os.path.exists(args.log):
+        samples += load_turn_log(args.log)
+    if os.path.exists(args.em):
+        samples += load_em_turns(args.em)
+    samples = list(dict(samples).items())  # 同一输入只保留最后一次的标签
+    if not samples:
+        raise SystemExit("没有可用的训练样本")
+    clf = IntentClassifier().train(samples, epochs=args.epochs)
+    clf.save(args.out)
+    counts = {label: sum(1 for _, y in samples if y == label) for label in clf.labels}
+    print(f"[IntentClassifier] 用 {len(samples)} 条样本训练完成，已保存到 {args.out}：{counts}")
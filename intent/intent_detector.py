@@ -1,17 +1,72 @@
 # intent/intent_detector.py
 
+import json
+import re
+import time
+from typing import NamedTuple
+
 from llm.llm_client import Llama3Client
 from config import MODEL_NAME2, MODEL_URL
+from intent.intent_cache import IntentCache
+from intent.intent_classifier import IntentClassifier, label_from_intent
+
+_THINK = re.compile(r"<think>.*?</think>", flags=re.DOTALL)
+
+
+class IntentRoute(NamedTuple):
+    """
+    一次路由判断的结果。
+    - label: 路由标签（见 intent_classifier.ROUTE_LABELS）
+    - query: 检索短语；走本地分类器时为原始输入
+    - confidence: 分类器置信度，LLM 判断时为 1.0
+    - source: "classifier" / "cache" / "llm"
+    """
+    label: str
+    query: str
+    confidence: float
+    source: str
+
+
+# 分类器即使高置信度也不直接采用的标签：误判会清空全部记忆
+DESTRUCTIVE_LABELS = frozenset({"clear_memory"})
+
 
 class IntentDetector:
     """
     让 LLaMA3 根据用户输入，输出一个简短的“检索查询”。
+    temperature=0 时结果只取决于输入，经 IntentCache 记忆化，重复或模板化的输入不再调用模型。
+    route() 先用本地分类器判断路由标签，置信度不足时才调用 LLM；
+    破坏性标签（DESTRUCTIVE_LABELS，如清空记忆）不走分类器捷径，始终由 LLM 判断；
+    每次 LLM 判断都追加到 log_path（JSONL），作为分类器的训练数据。
     """
 
-    def __init__(self, model=None, url=None):
+    def __init__(self, model=None, url=None, cache: IntentCache = None, use_cache: bool = True,
+                 classifier: IntentClassifier = None, classifier_path: str = "intent_classifier.pkl",
+                 min_confidence: float = 0.9, log_path: str = "intent_log.jsonl"):
+        """
+        :param cache: 意图缓存，默认新建（内存 LRU + intent_cache.db 磁盘层）
+        :param use_cache: 为 False 时每次都调用模型
+        :param classifier: 本地路由分类器，默认从 classifier_path 加载（文件不存在时不启用）
+        :param min_confidence: 分类器置信度不低于该值时跳过 LLM
+        :param log_path: LLM 判断结果的 JSONL 日志，None 表示不记录
+        """
         self.llm = Llama3Client(model=model or MODEL_NAME2, url=url or MODEL_URL)
+        self.cache = (cache or IntentCache()) if use_cache else None
+        self.classifier = classifier or IntentClassifier.load_if_exists(classifier_path)
+        self.min_confidence = min_confidence
+        self.log_path = log_path
+        self.stats = {"classifier": 0, "cache": 0, "llm": 0}
 
     def detect_intent(self, text: str) -> str:
+        return self._detect(text)[0]
+
+    def _detect(self, text: str):
+        """:return: (检索短语, 是否来自缓存)"""
+        if self.cache is not None:
+            cached = self.cache.get(self.llm.model, text)
+            if cached is not None:
+                return cached, True
+
         prompt = (
             "你是一名意图分析模块。只能使用中文。"
             f"请基于用户输入生成一个最精准的“查询短语”，用于检索与用户意图相关的信息或记忆。"
@@ -24,4 +79,34 @@ class IntentDetector:
             temperature=0.0,
             max_tokens=32
         ).strip()
-        return query
+
+        if self.cache is not None and query:
+            self.cache.put(self.llm.model, text, query)
+        return query, False
+
+    def route(self, text: str) -> IntentRoute:
+        """
+        判断路由标签和检索短语：分类器足够自信时直接返回，否则调用 detect_intent（含缓存）。
+        """
+        if self.classifier is not None:
+            label, confidence = self.classifier.predict(text)
+            if confidence >= self.min_confidence and label not in DESTRUCTIVE_LABELS:
+                self.stats["classifier"] += 1
+                return IntentRoute(label, text, confidence, "classifier")
+
+        query, cached = self._detect(text)
+        query = _THINK.sub("", query).strip()
+        label = label_from_intent(query)
+        if cached:
+            self.stats["cache"] += 1
+            return IntentRoute(label, query, 1.0, "cache")
+        self.stats["llm"] += 1
+        self._log(text, query, label)
+        return IntentRoute(label, query, 1.0, "llm")
+
+    def _log(self, text: str, intent: str, label: str):
+        if not self.log_path:
+            return
+        record = {"text": text, "intent": intent, "label": label, "model": self.llm.model, "ts": time.time()}
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
@@ -1,38 +1,158 @@
 # llm/llm_client.py
 
 from config import MODEL_NAME1, MODEL_URL
-import json, urllib.request
+import json
 import random
+import time
+from utils.transport import get_default_transport
 
 class Llama3Client:
-    def __init__(self, model=None, url=None):
+    HEADERS = {"Content-Type": "application/json"}
+
+    def __init__(self, model=None, url=None, transport=None, read_timeout=None, keep_alive=None, num_ctx=None):
         self.model = model or MODEL_NAME1
         self.url   = url   or MODEL_URL
+        # 共享长连接池（带连接/读超时和有限重试），与 VectorStore 的嵌入请求共用
+        self.transport = transport or get_default_transport()
+        # 单次请求的读超时（秒），None 时使用 transport 的默认值
+        self.read_timeout = read_timeout
+        # 最近一次流式调用的统计：首字延迟(ttft)、生成 token 数、tokens/s
+        self.last_stream_stats = {}
+        # Ollama 保持模型（及其 KV 缓存）常驻的时长，如 "30m"、-1；None 时使用服务端默认（5 分钟）
+        self.keep_alive = keep_alive
+        # 上下文窗口大小（options.num_ctx），各请求保持一致服务端才不会重新加载模型、丢弃缓存
+        self.num_ctx = num_ctx
+        # 最近一次调用服务端报告的用量：prompt_tokens、completion_tokens，原生接口另有 prefill_seconds
+        self.last_usage = {}
 
-    def chat(self, messages, model=None, temperature=0.7, max_tokens=None, **kwargs):
+    def _build_request(self, messages, temperature, max_tokens, stream):
         payload = {
             "model": self.model,
             "messages": messages,
             "temperature": temperature,
             "seed": random.randint(0, 2**32 - 1),
-            "stream": False  # 禁用流，保证响应完整
+            "stream": stream
         }
 
+        options = {}
         if max_tokens:
-            payload["options"] = {"max_new_tokens": max_tokens}
+            # OpenAI 兼容接口读取顶层 max_tokens，Ollama 原生接口读取 options.num_predict
+            payload["max_tokens"] = max_tokens
+            options["num_predict"] = max_tokens
+        if self.num_ctx:
+            options["num_ctx"] = self.num_ctx
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        if stream:
+            # OpenAI 兼容接口在最后一个分片中附带 usage
+            payload["stream_options"] = {"include_usage": True}
 
-        req = urllib.request.Request(
-            self.url,
-            data=json.dumps(payload).encode("utf-8"),
-            headers={"Content-Type": "application/json"},
-            method="POST"
-        )
+        return json.dumps(payload).encode("utf-8")
+
+    def chat(self, messages, model=None, temperature=0.7, max_tokens=None, **kwargs):
+        body = self._build_request(messages, temperature, max_tokens, stream=False)  # 禁用流，保证响应完整
 
         result = ""
-        with urllib.request.urlopen(req) as resp:
-            resp_json = json.load(resp)  # 一次性解析整个响应
-            if "choices" in resp_json:
-                result += resp_json["choices"][0]["message"]["content"]
-            elif "message" in resp_json:
-                result += resp_json["message"]["content"]
+        resp = self.transport.request("POST", self.url, body=body, headers=self.HEADERS,
+                                      read_timeout=self.read_timeout)
+        resp.raise_for_status()
+        resp_json = resp.json()  # 一次性解析整个响应
+        self.last_usage = self._parse_usage(resp_json)
+        if "choices" in resp_json:
+            result += resp_json["choices"][0]["message"]["content"]
+        elif "message" in resp_json:
+            result += resp_json["message"]["content"]
         return result
+
+    @staticmethod
+    def _parse_usage(chunk: dict) -> dict:
+        """
+        从响应（或流式的最后一个分片）中取出用量，兼容 OpenAI 的 usage 与 Ollama 原生的 *_eval_count。
+        prompt_tokens 是本次实际参与 prefill 计算的 token 数时（Ollama 原生接口），命中前缀缓存的部分不计入。
+        """
+        usage = {}
+        if chunk.get("usage"):
+            u = chunk["usage"]
+            usage["prompt_tokens"] = u.get("prompt_tokens")
+            usage["completion_tokens"] = u.get("completion_tokens")
+        if "prompt_eval_count" in chunk:
+            usage["prompt_tokens"] = chunk["prompt_eval_count"]
+        if "eval_count" in chunk:
+            usage["completion_tokens"] = chunk["eval_count"]
+        if chunk.get("prompt_eval_duration"):
+            usage["prefill_seconds"] = chunk["prompt_eval_duration"] / 1e9
+        return usage
+
+    @staticmethod
+    def _parse_stream_line(line: str):
+        """
+        解析流式响应的一行，兼容两种格式：
+        - OpenAI 兼容接口的 SSE：data: {"choices":[{"delta":{"content":...}}]} / data: [DONE]
+        - Ollama 原生 /api/chat 的 NDJSON：{"message":{"content":...},"done":false}
+        :return: (文本增量, 完成时的服务端统计 dict 或 None, 是否结束)
+        """
+        line = line.strip()
+        if not line or line.startswith(":"):
+            return "", None, False
+        if line.startswith("data:"):
+            line = line[5:].strip()
+            if line == "[DONE]":
+                return "", None, True
+        chunk = json.loads(line)
+        if "choices" in chunk:
+            choices = chunk["choices"]
+            delta = choices[0].get("delta", {}).get("content") or "" if choices else ""
+            usage = chunk.get("usage")
+            stats = {"tokens": usage["completion_tokens"], "usage": Llama3Client._parse_usage(chunk)} if usage else None
+            return delta, stats, False
+        delta = chunk.get("message", {}).get("content") or ""
+        if chunk.get("done"):
+            stats = {"usage": Llama3Client._parse_usage(chunk)}
+            if "eval_count" in chunk:
+                stats["tokens"] = chunk["eval_count"]
+            if chunk.get("eval_duration"):
+                stats["server_tokens_per_sec"] = chunk["eval_count"] / (chunk["eval_duration"] / 1e9)
+            return delta, stats, True
+        return delta, None, False
+
+    def chat_stream(self, messages, model=None, temperature=0.7, max_tokens=None, **kwargs):
+        """
+        流式对话：逐个 yield 服务端返回的文本增量。
+        结束后在 last_stream_stats 中记录首字延迟（ttft，秒）、token 数和 tokens/s；
+        服务端未返回 token 数时以增量分片数近似。
+        """
+        body = self._build_request(messages, temperature, max_tokens, stream=True)
+        start = time.perf_counter()
+        first = None
+        pieces = 0
+        server_stats = {}
+        self.last_stream_stats = {}
+        self.last_usage = {}
+
+        with self.transport.stream("POST", self.url, body=body, headers=self.HEADERS,
+                                   read_timeout=self.read_timeout) as resp:
+            for raw in resp:
+                delta, stats, done = self._parse_stream_line(raw.decode("utf-8"))
+                if stats:
+                    server_stats.update(stats)
+                if delta:
+                    if first is None:
+                        first = time.perf_counter()
+                    pieces += 1
+                    yield delta
+                if done:
+                    break
+
+        end = time.perf_counter()
+        self.last_usage = server_stats.pop("usage", {})
+        tokens = server_stats.get("tokens", pieces)
+        gen_time = end - first if first is not None else 0.0
+        self.last_stream_stats = {
+            "ttft": (first - start) if first is not None else None,
+            "total_time": end - start,
+            "tokens": tokens,
+            "tokens_per_sec": tokens / gen_time if gen_time > 0 else None,
+            **{k: v for k, v in server_stats.items() if k != "tokens"},
+        }
@@ -11,7 +11,9 @@ from wm.working_memory import WorkingMemory
 from dialogue.language_dispatch import LanguageDispatcher
 from llm.llm_client import Llama3Client as LLMClient
 from memory.abstractor import Abstractor
+from memory.abstraction_worker import AbstractionWorker
 from utils.tools import Tools
+from utils.tracing import get_tracer
 
 def main():
     # 1. 启动时检查 Ollama 服务
@@ -27,16 +29,20 @@ def main():
     sm_store = SMStore()
     ms_store = MSStore()
 
-    # 3. 构建向量索引（启动一次）
-    indexer = MemoryVectorIndexer(model_name="all-minilm:l6-v2")
+    # 3. 构建向量索引（启动时对账一次，之后随记忆体写入增量更新）
+    indexer = MemoryVectorIndexer(model_name="all-minilm:l6-v2",
+                                  em_store=em_store, sm_store=sm_store, ms_store=ms_store)
     indexer.build_indexes()
 
     wm = WorkingMemory()
     llm_client = LLMClient(model=MODEL_NAME, url=MODEL_URL)
     dispatcher = LanguageDispatcher(llm_client)
     abstractor = Abstractor(em_store, sm_store)
+    abstraction_worker = AbstractionWorker(abstractor)
 
-    print("欢迎使用 AGI-V1 助手！输入 'exit' 或 'quit' 退出。")
+    tracer = get_tracer()
+
+    print("欢迎使用 AGI-V1 助手！输入 'exit' 或 'quit' 退出，'/trace' 查看各阶段延迟。")
 
     while True:
         try:
@@ -49,46 +55,73 @@ def main():
             print("Goodbye!")
             break
 
-        # 4. 意图识别
-        intents = intent_detector.detect_intent(user_input)
-        print(f"Assistant: 我判断你的意图是 {intents}")
+        # 随时输入 /trace 打印各阶段的延迟分位数
+        if user_input == "/trace":
+            print(tracer.format_summary())
+            continue
+
+        # 每轮一条追踪记录（写入 traces.jsonl），各阶段为子 span
+        with tracer.trace("turn", input_chars=len(user_input)):
+            # 4. 意图识别
+            # 本地分类器足够自信时直接给出路由标签，否则调用 LLM
+            with tracer.span("intent"):
+                route = intent_detector.route(user_input)
+            intents = route.query
+            print(f"Assistant: 我判断你的意图是 {intents}（{route.label}，来源 {route.source}）")
 
-        # 5. 向量检索最相关的记忆
-        hits = indexer.query(user_input, top_k=5)
-        mems = [
-            {
-                "source": hit["source"],
-                "key": hit["key"],
-                "content": hit["content"],
-                "timestamp": ""
-            } for hit in hits
-        ]
-        # print(f"Assistant: 找到相关记忆：{[h['content'] for h in hits]}")
-        wm.load_memories(mems)
-        wm.add_context("user", user_input)
-        print(f"Assistant: 找到相关记忆：{[h['content'] for h in hits]}")
+            # 5. 向量检索最相关的记忆
+            with tracer.span("retrieval") as span:
+                hits = indexer.query(user_input, top_k=5)
+                span.set(hits=len(hits))
+            mems = [
+                {
+                    "source": hit["source"],
+                    "key": hit["key"],
+                    "content": hit["content"],
+                    "timestamp": hit["timestamp"],
+                    "score": hit["score"]
+                } for hit in hits
+            ]
+            # print(f"Assistant: 找到相关记忆：{[h['content'] for h in hits]}")
+            wm.load_memories(mems)
+            wm.add_context("user", user_input)
+            print(f"Assistant: 找到相关记忆：{[h['content'] for h in hits]}")
 
-        # 6. 生成回复
-        response = dispatcher.generate_response(user_input, intents, wm)
-        print(f"Assistant: {response}\n")
-        wm.add_context("assistant", response)
+            # 6. 生成回复（prompt 组装在其中单独计为 prompt_build）
+            print("Assistant: ", end="", flush=True)
+            chunks = []
+            with tracer.span("generation"):
+                for delta in dispatcher.generate_response_stream(user_input, intents, wm):
+                    print(delta, end="", flush=True)
+                    chunks.append(delta)
+            response = "".join(chunks)
+            print("\n")
+            wm.add_context("assistant", response)
 
-        # 7. 根据意图更新记忆（如果需要）
-        if 'record' in intents:
-            ts = Tools.get_timestamp()
-            em_store.add(ts, user_input)
-        elif 'update_goal' in intents:
-            ts = Tools.get_timestamp()
-            ms_store.add(ts, user_input)
-        elif 'update_memory' in intents:
-            ts = Tools.get_timestamp()
-            sm_store.add(ts, user_input)
-        elif 'clear_memory' in intents:
-            em_store.clear(); sm_store.clear(); ms_store.clear()
-        elif 'abstract' in intents:
-            summary = abstractor.abstract(user_input)
-            print(f"Assistant: 抽象结果：{summary}")
+            # 7. 根据意图更新记忆（如果需要）
+            with tracer.span("memory_write", label=route.label):
+                if route.label == 'record':
+                    ts = Tools.get_timestamp()
+                    em_store.add(ts, user_input)
+                elif route.label == 'update_goal':
+                    ts = Tools.get_timestamp()
+                    ms_store.add(ts, user_input)
+                elif route.label == 'update_memory':
+                    ts = Tools.get_timestamp()
+                    sm_store.add(ts, user_input)
+                elif route.label == 'clear_memory':
+                    abstraction_worker.flush()
+                    em_store.clear(); sm_store.clear(); ms_store.clear()
+                elif route.label == 'abstract':
+                    # 抽象在后台执行，不阻塞下一轮输入
+                    abstraction_worker.submit_key(
+                        user_input, callback=lambda key, summary: print(f"\nAssistant: 抽象结果：{summary}"))
+                    print("Assistant: 已在后台抽象该主题，完成后写入语义记忆体。")
 
+    abstraction_worker.close()
+    indexer.close()
+    print(tracer.format_summary())
+    tracer.close()
     sys.exit(0)
 
 if __name__ == '__main__':
@@ -1,22 +1,22 @@
 # import os
 # os.environ["TRANSFORMERS_NO_TF"] = "1"
 import sys
-from config import MODEL_NAME1, MODEL_URL, SYSTEM_PROMPT
+import asyncio
+from config import LLM_CONFIG, MODEL_NAME1, MODEL_URL, SYSTEM_PROMPT
 from intent.intent_detector import IntentDetector
 from memory.em_store import EMStore
 from memory.sm_store import SMStore
 from memory.ms_store import MSStore
+from memory.storage import StorageEngine
 from wm.working_memory import WorkingMemory
 from dialogue.language_dispatch import LanguageDispatcher
 from llm.llm_client import Llama3Client as LLMClient
 from memory.abstractor import Abstractor
+from memory.abstraction_worker import AbstractionWorker
 from utils.tools import Tools
+from utils.tracing import get_tracer
 from memory.simpl_retriever import SimpleMemoryRetriever
-import re
-
-def strip_think_tags(text: str) -> str:
-    # 删除 <think>...</think> 及其中所有内容
-    return re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL).strip()
+from dialogue.turn_pipeline import TurnPipeline
 
 def main():
     # 1. 启动时检查 Ollama 服务
@@ -28,19 +28,48 @@ def main():
 
     # 2. 初始化各组件
     intent_detector = IntentDetector()
-    em_store = EMStore()
-    sm_store = SMStore()
-    ms_store = MSStore()
+    # python maintest.py --unified：三大记忆体共用 memory.db（按线程分配连接），首次启动时导入旧的 em/sm/ms.db
+    if "--unified" in sys.argv:
+        engine = StorageEngine("memory.db")
+        engine.import_legacy()
+        em_store = EMStore(engine=engine)
+        sm_store = SMStore(engine=engine)
+        ms_store = MSStore(engine=engine)
+    else:
+        em_store = EMStore()
+        sm_store = SMStore()
+        ms_store = MSStore()
 
     # 3. 构建向量索引（启动一次）
     retriever = SimpleMemoryRetriever(em_store, sm_store, ms_store)
 
     wm = WorkingMemory()
-    llm_client = LLMClient(model=MODEL_NAME1, url=MODEL_URL)
-    dispatcher = LanguageDispatcher(llm_client,system_prompt=SYSTEM_PROMPT)
+    # python maintest.py --stable-prefix：前缀稳定的消息布局，并让 Ollama 保持模型常驻以复用上一轮的 KV 缓存
+    if "--stable-prefix" in sys.argv:
+        llm_client = LLMClient(model=MODEL_NAME1, url=MODEL_URL,
+                               keep_alive="30m", num_ctx=LLM_CONFIG["context_window"])
+        dispatcher = LanguageDispatcher(llm_client, system_prompt=SYSTEM_PROMPT, layout="stable")
+    else:
+        llm_client = LLMClient(model=MODEL_NAME1, url=MODEL_URL)
+        dispatcher = LanguageDispatcher(llm_client,system_prompt=SYSTEM_PROMPT)
     abstractor = Abstractor(em_store, sm_store)
+    # 摘要与抽象在后台线程执行，不阻塞对话轮次
+    abstraction_worker = AbstractionWorker(abstractor)
+
+    tracer = get_tracer()
+
+    print("欢迎使用 AGI-V1 助手！输入 'exit' 或 'quit' 退出，'/trace' 查看各阶段延迟。")
 
-    print("欢迎使用 AGI-V1 助手！输入 'exit' 或 'quit' 退出。")
+    # python maintest.py --async：使用并发流水线（意图识别与推测检索并行，记忆写入后台完成）
+    if "--async" in sys.argv:
+        pipeline = TurnPipeline(intent_detector, retriever, dispatcher, wm,
+                                em_store, sm_store, ms_store, abstractor,
+                                abstraction_worker=abstraction_worker)
+        asyncio.run(run_pipeline(pipeline))
+        abstraction_worker.close()
+        print(tracer.format_summary())
+        tracer.close()
+        sys.exit(0)
 
     while True:
         try:
@@ -53,75 +82,130 @@ def main():
             print("Goodbye!")
             break
 
-        # 4. 意图识别
-        intents = intent_detector.detect_intent(user_input)
-        # 删除think标签
-        intents = strip_think_tags(intents)
-        print(f"Assistant: 我判断你的意图是 {intents}")
-
-        # 5. 向量检索最相关的记忆
-        # hits = indexer.query(user_input, top_k=5)
-        # 1) 生成检索短语
-        query = intents
-        print(f"检索短语：{query}")
-        # 2) 用短语在记忆中检索
-        hits = retriever.query(query, top_k=5)
-        mems = [
-            {
-                "source": h["source"],
-                "key": h["key"],
-                "content": h["content"],
-                "timestamp": h["timestamp"]
-            }
-            for h in hits
-        ]
-        print("Assistant: 找到相关记忆：")
-        for h in hits:
-            print(f"  [{h['source']}][{h['timestamp']}]({h['score']:.2f}) {h['content']}")
-        wm.load_memories(mems)
-        wm.add_context("user", user_input)
-        print(f"Assistant: 找到相关记忆：{[h['content'] for h in hits]}")
-
-        # 6. 生成回复
-        print(f"user_input: {user_input}, intents: {intents},wm.context: {wm}")
-        response = dispatcher.generate_response(user_input, intents, wm)
-        print(f"Assistant: {response}\n")
-        wm.add_context("assistant", response)
-        # —— 自动记录用户输入到 Episodic Memory —— 
-        ts = Tools.get_timestamp()
-        # 这里把意图列表也当作 key 前缀，方便检索
-        em_store.add(key="user:" + ";".join(intents), content=user_input, timestamp=ts)
-
-        # —— 自动记录助手回复到 Episodic Memory（可选） —— 
-        ts2 = Tools.get_timestamp()
-        em_store.add(key="assistant:" + ";".join(intents), content=response, timestamp=ts2)
-
-        # —— 定期生成摘要并存入 Semantic Memory —— 
-        # 当工作记忆的轮次达到阈值时，摘要并清理
-        if len(wm.context) >= 10:
-            # 摘要最近 10 条
-            summary = abstractor.abstract_conversation(wm.context[-10:])
-            sm_store.add(key="conversation_summary", content=summary, timestamp=Tools.get_timestamp())
-            # 可选择清空旧上下文
-            wm.context = wm.context[-2:]
-
-        # 7. 根据意图更新记忆（如果需要）
-        if 'record' in intents:
-            ts = Tools.get_timestamp()
-            em_store.add(ts, user_input)
-        elif 'update_goal' in intents:
-            ts = Tools.get_timestamp()
-            ms_store.add(ts, user_input)
-        elif 'update_memory' in intents:
-            ts = Tools.get_timestamp()
-            sm_store.add(ts, user_input)
-        elif 'clear_memory' in intents:
-            em_store.clear(); sm_store.clear(); ms_store.clear()
-        elif 'abstract' in intents:
-            summary = abstractor.abstract(user_input)
-            print(f"Assistant: 抽象结果：{summary}")
-
+        # 随时输入 /trace 打印各阶段的延迟分位数
+        if user_input == "/trace":
+            print(tracer.format_summary())
+            continue
+
+        # 每轮一条追踪记录（写入 traces.jsonl），各阶段为子 span
+        with tracer.trace("turn", input_chars=len(user_input)):
+            # 4. 意图识别
+            # 本地分类器足够自信时直接给出路由标签，否则调用 LLM（已去掉 think 标签）
+            with tracer.span("intent"):
+                route = intent_detector.route(user_input)
+            intents = route.query
+            print(f"Assistant: 我判断你的意图是 {intents}（{route.label}，来源 {route.source}）")
+
+            # 5. 向量检索最相关的记忆
+            # hits = indexer.query(user_input, top_k=5)
+            # 1) 生成检索短语
+            query = intents
+            print(f"检索短语：{query}")
+            # 2) 用短语在记忆中检索
+            with tracer.span("retrieval") as span:
+                hits = retriever.query(query, top_k=5)
+                span.set(hits=len(hits))
+            mems = [
+                {
+                    "source": h["source"],
+                    "key": h["key"],
+                    "content": h["content"],
+                    "timestamp": h["timestamp"],
+                    "score": h["score"]
+                }
+                for h in hits
+            ]
+            print("Assistant: 找到相关记忆：")
+            for h in hits:
+                print(f"  [{h['source']}][{Tools.format_timestamp(h['timestamp'])}]({h['score']:.2f}) {h['content']}")
+            wm.load_memories(mems)
+            wm.add_context("user", user_input)
+            print(f"Assistant: 找到相关记忆：{[h['content'] for h in hits]}")
+
+            # 6. 生成回复（prompt 组装在其中单独计为 prompt_build）
+            print(f"user_input: {user_input}, intents: {intents},wm.context: {wm}")
+            print("Assistant: ", end="", flush=True)
+            chunks = []
+            with tracer.span("generation"):
+                for delta in dispatcher.generate_response_stream(user_input, intents, wm):
+                    print(delta, end="", flush=True)
+                    chunks.append(delta)
+            response = "".join(chunks)
+            print("\n")
+            wm.add_context("assistant", response)
+            with tracer.span("memory_write", label=route.label):
+                # —— 自动记录用户输入到 Episodic Memory —— 
+                ts = Tools.get_timestamp()
+                # 这里把意图列表也当作 key 前缀，方便检索
+                em_store.add(key="user:" + ";".join(intents), content=user_input, timestamp=ts)
+
+                # —— 自动记录助手回复到 Episodic Memory（可选） —— 
+                ts2 = Tools.get_timestamp()
+                em_store.add(key="assistant:" + ";".join(intents), content=response, timestamp=ts2)
+
+                # —— 定期生成摘要并存入 Semantic Memory —— 
+                # 当工作记忆的轮次达到阈值时，摘要并清理
+                if len(wm.context) >= 10:
+                    # 摘要最近 10 条
+                    abstraction_worker.submit_conversation(wm.recent(10))
+                    # 可选择清空旧上下文
+                    wm.truncate(2)
+
+                # 7. 根据意图更新记忆（如果需要）
+                if route.label == 'record':
+                    ts = Tools.get_timestamp()
+                    em_store.add(ts, user_input)
+                elif route.label == 'update_goal':
+                    ts = Tools.get_timestamp()
+                    ms_store.add(ts, user_input)
+                elif route.label == 'update_memory':
+                    ts = Tools.get_timestamp()
+                    sm_store.add(ts, user_input)
+                elif route.label == 'clear_memory':
+                    abstraction_worker.flush()
+                    em_store.clear(); sm_store.clear(); ms_store.clear()
+                elif route.label == 'abstract':
+                    abstraction_worker.submit_key(
+                        user_input, callback=lambda key, summary: print(f"\nAssistant: 抽象结果：{summary}"))
+                    print("Assistant: 已在后台抽象该主题，完成后写入语义记忆体。")
+
+    # 退出前执行完排队中的摘要/抽象
+    abstraction_worker.close()
+    print(tracer.format_summary())
+    tracer.close()
     sys.exit(0)
 
+async def run_pipeline(pipeline: TurnPipeline):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                # 等待输入期间，上一轮的记忆写入在后台继续进行
+                user_input = (await loop.run_in_executor(None, input, "You: ")).strip()
+            except (EOFError, KeyboardInterrupt):
+                print("\nGoodbye!")
+                break
+
+            if not user_input or user_input.lower() in ['exit', 'quit']:
+                print("Goodbye!")
+                break
+
+            if user_input == "/trace":
+                print(get_tracer().format_summary())
+                continue
+
+            # 上一轮的写入（如清空记忆）需先于本轮检索完成
+            await pipeline.drain()
+            print("Assistant: ", end="", flush=True)
+            result = await pipeline.run_turn(user_input, on_delta=lambda d: print(d, end="", flush=True))
+            print("\n")
+            print(f"检索短语：{result['intents']}")
+            for h in result["hits"]:
+                print(f"  [{h['source']}][{Tools.format_timestamp(h['timestamp'])}]({h['score']:.2f}) {h['content']}")
+            timings = result["timings"]
+            print("[TurnPipeline] " + " | ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+    finally:
+        pipeline.close()
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,188 @@
+# memory/abstraction_worker.py
+
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from utils.tools import Tools
+from utils.tracing import get_tracer
+
+
+class AbstractionJob(NamedTuple):
+    """
+    一个待执行的抽象任务：
+    - kind="key"：Abstractor.abstract(key)，按主题增量抽象
+    - kind="conversation"：Abstractor.abstract_conversation(messages)，摘要写入 SMStore 的 key
+    """
+    kind: str
+    key: str
+    messages: Optional[List[Dict]]
+    callbacks: Tuple[Callable[[str, Optional[str]], None], ...]
+    submitted: float
+
+
+def _message_key(message) -> Tuple:
+    return message["role"], message.get("ts"), message["text"]
+
+
+def _merge_messages(queued: List[Dict], messages: List[Dict]) -> List[Dict]:
+    """
+    把新提交的对话并入排队中的任务，跳过已在任务中的条目：
+    调用方每次提交最近若干条后只保留最后两条，下一次提交会再次带上这两条。
+    """
+    seen = {_message_key(m) for m in queued}
+    return queued + [m for m in messages if _message_key(m) not in seen]
+
+
+class AbstractionWorker:
+    """
+    后台抽象任务队列，让摘要/抽象的 LLM 调用不阻塞对话轮次：
+    - submit_key() / submit_conversation() 只入队并立即返回，由单个后台线程按提交顺序执行
+    - 按 (kind, key) 去重：同一主题已在排队时不再重复入队（abstract 是增量的，执行时会读到所有新记录）；
+      对话摘要在排队期间会把新消息（按角色、时间戳与内容去重）并入同一个任务
+    - 结果写入 SMStore，完成后调用回调；stats() 提供排队数、去重数、失败数与平均耗时
+    - flush() 等待当前已提交的任务全部完成；close() 默认处理完剩余任务再退出，进程退出时自动调用
+    """
+
+    def __init__(self, abstractor, sm_store=None, name: str = "abstraction-worker"):
+        """
+        :param sm_store: 对话摘要写入的语义记忆体，默认使用 abstractor.sm_store
+        """
+        self.abstractor = abstractor
+        self.sm_store = sm_store or abstractor.sm_store
+        self.name = name
+        self._jobs: "OrderedDict[Tuple[str, str], AbstractionJob]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._running: Optional[AbstractionJob] = None
+        self._stopped = False
+        self.last_error: Optional[Exception] = None
+        self._stats = {"submitted": 0, "deduplicated": 0, "completed": 0, "failed": 0, "dropped": 0,
+                       "seconds": 0.0, "wait_seconds": 0.0}
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def _enqueue(self, kind: str, key: str, messages: Optional[List[Dict]],
+                 callback: Optional[Callable[[str, Optional[str]], None]]) -> bool:
+        callbacks = (callback,) if callback is not None else ()
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError(f"[{self.name}] 抽象任务队列已关闭")
+            self._stats["submitted"] += 1
+            ident = (kind, key)
+            queued = self._jobs.get(ident)
+            if queued is not None:
+                self._stats["deduplicated"] += 1
+                if messages:
+                    messages = _merge_messages(queued.messages or [], messages)
+                self._jobs[ident] = queued._replace(messages=messages or queued.messages,
+                                                    callbacks=queued.callbacks + callbacks)
+                return False
+            self._jobs[ident] = AbstractionJob(kind, key, list(messages) if messages else None,
+                                               callbacks, time.monotonic())
+            self._cond.notify_all()
+            return True
+
+    def submit_key(self, key: str, callback: Callable[[str, Optional[str]], None] = None) -> bool:
+        """
+        提交一个主题抽象任务（结果由 Abstractor.abstract 写入 SMStore）。
+        :param callback: 完成后以 (key, summary) 在后台线程中调用
+        :return: 是否新入队；同一主题已在排队时返回 False（已合并）
+        """
+        return self._enqueue("key", key, None, callback)
+
+    def submit_conversation(self, messages: List[Dict], key: str = "conversation_summary",
+                            callback: Callable[[str, Optional[str]], None] = None) -> bool:
+        """
+        提交一个对话摘要任务，摘要写入 SMStore 的 key。
+        :param messages: 工作记忆中的对话条目（会复制一份，调用方之后可以修改原列表）
+        :return: 是否新入队；同一 key 的摘要已在排队时返回 False（消息已并入该任务）
+        """
+        return self._enqueue("conversation", key, messages, callback)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._jobs or self._stopped)
+                if not self._jobs:
+                    return
+                _, job = self._jobs.popitem(last=False)
+                self._running = job
+                self._stats["wait_seconds"] += time.monotonic() - job.submitted
+            start = time.perf_counter()
+            summary, failed = None, False
+            try:
+                summary = self._execute(job)
+            except Exception as err:
+                failed = True
+                self.last_error = err
+                print(f"[{self.name}] 抽象任务失败（{job.kind}: {job.key}）：{err}")
+            elapsed = time.perf_counter() - start
+            if not failed:
+                for callback in job.callbacks:
+                    try:
+                        callback(job.key, summary)
+                    except Exception as err:
+                        print(f"[{self.name}] 回调失败（{job.key}）：{err}")
+            with self._cond:
+                self._stats["failed" if failed else "completed"] += 1
+                self._stats["seconds"] += elapsed
+                self._running = None
+                self._cond.notify_all()
+
+    def _execute(self, job: AbstractionJob) -> Optional[str]:
+        # 每个任务是一条独立的追踪记录，包含其中的 LLM 请求与 SQLite 语句
+        with get_tracer().trace("abstraction", kind=job.kind, key=job.key,
+                                wait_s=round(time.monotonic() - job.submitted, 3)):
+            if job.kind == "key":
+                return self.abstractor.abstract(job.key)
+            summary = self.abstractor.abstract_conversation(job.messages)
+            self.sm_store.add(key=job.key, content=summary, timestamp=Tools.get_timestamp())
+        print(f"[{self.name}] 已摘要 {len(job.messages)} 条对话并写入语义记忆体（{job.key}）")
+        return summary
+
+    @property
+    def pending(self) -> int:
+        """排队中与执行中的任务数。"""
+        with self._cond:
+            return len(self._jobs) + (self._running is not None)
+
+    def stats(self) -> Dict:
+        """任务统计：提交/去重/完成/失败/丢弃数，当前排队数，平均执行与排队耗时（秒）。"""
+        with self._cond:
+            s = dict(self._stats)
+            s["queued"] = len(self._jobs)
+            s["running"] = f"{self._running.kind}:{self._running.key}" if self._running else None
+        finished = s["completed"] + s["failed"]
+        s["avg_seconds"] = s["seconds"] / finished if finished else 0.0
+        s["avg_wait_seconds"] = s["wait_seconds"] / finished if finished else 0.0
+        return s
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞到队列清空且没有正在执行的任务。
+        :return: 是否在 timeout 内完成
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._jobs and self._running is None, timeout)
+
+    def close(self, drain: bool = True):
+        """
+        停止接收新任务并关闭后台线程。
+        :param drain: True 时先执行完排队中的任务；False 时丢弃排队任务，只等待正在执行的任务
+        """
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            if not drain:
+                self._stats["dropped"] += len(self._jobs)
+                self._jobs.clear()
+            self._cond.notify_all()
+        self._worker.join()
+        atexit.unregister(self.close)
+        s = self.stats()
+        print(f"[{self.name}] 已关闭：完成 {s['completed']}，失败 {s['failed']}，去重 {s['deduplicated']}，"
+              f"丢弃 {s['dropped']}，平均耗时 {s['avg_seconds']:.2f}s")
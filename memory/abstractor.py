@@ -1,36 +1,144 @@
 # 抽象记忆层
 
 
+from concurrent.futures import ThreadPoolExecutor
 from llm.llm_client import Llama3Client
-from config import MODEL_NAME1, MODEL_URL
+from config import LLM_CONFIG, MODEL_NAME1, MODEL_URL
 from memory.sm_store import SMStore
+from utils.tools import Tools
+from utils.tracing import bind
 from typing import List, Dict
 
 class Abstractor:
     """
     抽象器模块：从 EMStore 中提取历史事实并总结抽象概念，写入 SMStore。
+    增量 map-reduce：
+    - SMStore 为每个 key 记录水位（已折叠的最后一条情景记忆 id），每次只处理水位之后的新记录
+    - 新记录按字符预算切成固定大小的块，各块并行总结（map），块总结过多时逐层合并（reduce）
+    - 最后把新总结折叠进已有的抽象结果，写回 SMStore 并推进水位
+    每次调用的 LLM 开销只与新增记录量成正比，单个提示词不会超过上下文窗口。
     """
 
-    def __init__(self, em_store, sm_store=None):
+    def __init__(self, em_store, sm_store=None, llm=None, chunk_chars: int = None, max_workers: int = 4,
+                 max_levels: int = 4):
+        """
+        :param chunk_chars: 每块（及每个提示词中历史部分）的最大字符数，默认取上下文窗口的一半
+        :param max_workers: 并行总结的最大线程数
+        :param max_levels: reduce 的最大层数，超过后直接截断到一块
+        """
         self.em_store = em_store
         self.sm_store = sm_store or SMStore()
-        self.llm = Llama3Client()
+        self.llm = llm or Llama3Client()
+        self.chunk_chars = chunk_chars or LLM_CONFIG["context_window"] // 2
+        self.max_workers = max(1, max_workers)
+        self.max_levels = max(1, max_levels)
+
+    def _ask(self, prompt: str, max_tokens: int = None) -> str:
+        return self.llm.chat(
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.3,
+            max_tokens=max_tokens
+        ).strip()
+
+    def _chunk(self, lines: List[str]) -> List[List[str]]:
+        """按字符预算贪心装箱，单行超出预算时独占一块。"""
+        chunks, current, size = [], [], 0
+        for line in lines:
+            if current and size + len(line) > self.chunk_chars:
+                chunks.append(current)
+                current, size = [], 0
+            current.append(line)
+            size += len(line) + 1
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _parallel(self, prompts: List[str]) -> List[str]:
+        if len(prompts) == 1:
+            return [self._ask(prompts[0], max_tokens=200)]
+        # 每个请求各绑定一份当前上下文，HTTP span 挂在所属的抽象任务下
+        calls = [bind(self._ask) for _ in prompts]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(prompts)),
+                                thread_name_prefix="abstractor") as pool:
+            return list(pool.map(lambda call, p: call(p, max_tokens=200), calls, prompts))
+
+    def _truncate(self, lines: List[str]) -> List[str]:
+        """保留最新的若干行，总长度不超过一块；单行超长时截断该行。"""
+        kept, size = [], 0
+        for line in reversed(lines):
+            if size + len(line) > self.chunk_chars:
+                if not kept:
+                    kept.append(line[:self.chunk_chars])
+                break
+            kept.append(line)
+            size += len(line) + 1
+        return kept[::-1]
+
+    def _map_reduce(self, key: str, lines: List[str]) -> List[str]:
+        """
+        把新记录压缩到一个提示词放得下的若干段文本。
+        一块放得下时原样返回，不额外调用 LLM；否则逐层并行总结，直到总长度在预算之内。
+        LLM 的总结不保证变短：块数不再减少或层数达到 max_levels 时，截断为一块（保留最新的部分）。
+        """
+        level = 0
+        previous = None
+        while True:
+            chunks = self._chunk(lines)
+            if len(chunks) == 1:
+                return chunks[0]
+            if level >= self.max_levels or (previous is not None and len(chunks) >= previous):
+                print(f"[Abstractor] {key}: 第 {level} 层后仍有 {len(chunks)} 块，截断到一块")
+                return self._truncate(lines)
+            previous = len(chunks)
+            kind = "历史事实" if level == 0 else "阶段总结"
+            prompts = [
+                f"请把以下关于“{key}”的{kind}压缩成一段简短的中文要点，保留用户的偏好、习惯和关键变化：\n\n"
+                + "\n".join(chunk)
+                for chunk in chunks
+            ]
+            lines = [f"- {part}" for part in self._parallel(prompts)]
+            level += 1
+            print(f"[Abstractor] {key}: 第 {level} 层合并 {len(chunks)} 块 -> {len(lines)} 段")
 
     def abstract(self, key: str):
         """
-        对指定 key（如“吃饭”、“学习”等）对应的历史事实进行抽象总结。
+        对指定 key（如“吃饭”、“学习”等）对应的历史事实进行增量抽象总结。
         :param key: 要抽象的意图或主题
-        :return: 抽象总结字符串（并已写入 SMStore）
+        :return: 抽象总结字符串（并已写入 SMStore）；没有任何记录时返回 None
         """
-        # 从 EMStore 中获取所有历史记录
-        records = self.em_store.get_all(key)
+        # 写后模式下先让已提交的情景记忆与上次的水位落库，保证能读到
+        self.em_store.flush()
+        self.sm_store.flush()
+        watermark = self.sm_store.get_watermark(key)
+        existing = self.sm_store.get(key) if watermark else None
+        records = self.em_store.get_after(key, watermark)
         if not records:
+            if existing:
+                print(f"[Abstractor] {key}: 水位 {watermark} 之后没有新记录，沿用已有抽象")
+                return existing[0]
             print(f"[Abstractor] No episodic records found for key: {key}")
             return None
 
-        # 构建提示词，输入给 LLM
-        memory_text = "\n".join([f"- {content}（{ts}）" for content, ts in records])
-        prompt = f"""
+        # map-reduce：新记录压缩成一个提示词放得下的文本
+        lines = [f"- {content}（{Tools.format_timestamp(ts)}）" for _, content, ts in records]
+        memory_text = "\n".join(self._map_reduce(key, lines))
+
+        # 折叠进已有的抽象结果
+        if existing:
+            prompt = f"""
+            你是一名智能助理，下面是用户关于“{key}”的已有抽象总结，以及之后新增的历史事实。
+            请结合两者更新总结，新的事实与旧总结冲突时以新事实为准。总结应简洁、概括，并包含用户的偏好或习惯。
+
+            已有总结：
+            {existing[0]}
+
+            新增事实：
+            {memory_text}
+
+            请用一句简短的话给出更新后的总结。
+            """
+        else:
+            prompt = f"""
             你是一名智能助理，请根据以下历史事实，为用户生成一个抽象总结。总结应简洁、概括，并包含用户的偏好或习惯。
 
             历史事实：
@@ -38,14 +146,13 @@ class Abstractor:
 
             请用一句简短的话总结这个主题：“{key}”。
             """
+        summary = self._ask(prompt)
 
-        # 请求 LLM
-        summary = self.llm.chat(prompt).strip()
-
-        # 存入 SMStore（语义记忆体）
+        # 存入 SMStore（语义记忆体），先写总结再推进水位
         self.sm_store.add(key, summary)
+        self.sm_store.set_watermark(key, records[-1][0])
 
-        print(f"[Abstractor] 抽象结果已写入语义记忆体: {summary}")
+        print(f"[Abstractor] 抽象结果已写入语义记忆体（新增 {len(records)} 条，水位 {records[-1][0]}）: {summary}")
         return summary
     
     def abstract_conversation(self, messages: List[Dict[str,str]]) -> str:
@@ -0,0 +1,117 @@
+# memory/ann_index.py
+
+import math
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+# 支持的索引类型：
+# - flat:     精确内积检索，O(N) 暴力扫描，召回率 100%
+# - hnsw:     分层小世界图，无需训练，检索快、内存约为 flat 的 1.2~1.5 倍，不支持物理删除
+# - ivf_flat: 倒排 + 原始向量，需要训练，检索只扫描 nprobe 个簇
+# - ivf_pq:   倒排 + 乘积量化，需要训练，内存约为 flat 的 1/16~1/32，召回率略低
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+DEFAULT_PARAMS = {
+    "hnsw_m": 32,              # HNSW 每个节点的邻居数
+    "ef_construction": 80,     # HNSW 建图时的候选集大小
+    "ef_search": 64,           # HNSW 检索时的候选集大小
+    "nlist": None,             # IVF 簇数，None 表示按训练样本数取 sqrt(N)
+    "nprobe": 16,              # IVF 检索时扫描的簇数
+    "pq_m": 48,                # PQ 子空间个数，必须整除 dim
+    "pq_nbits": 8,             # 每个子空间的编码位数
+    "min_train_size": None,    # 自动训练所需的最少向量数，None 表示按类型取默认值
+}
+
+
+def resolve_params(params: Optional[Dict] = None) -> Dict:
+    """用默认值补全索引参数。"""
+    merged = dict(DEFAULT_PARAMS)
+    merged.update(params or {})
+    return merged
+
+
+def needs_training(index_type: str) -> bool:
+    return index_type in ("ivf_flat", "ivf_pq")
+
+
+def supports_remove(index_type: str) -> bool:
+    """HNSW 图不支持物理删除，只能重建。"""
+    return index_type != "hnsw"
+
+
+def min_train_size(index_type: str, params: Optional[Dict] = None) -> int:
+    """
+    自动训练所需的最少向量数：IVF 每个簇至少约 39 个样本；
+    PQ 每个子空间码本有 2^nbits 个中心，同样需要约 39 倍样本。
+    """
+    p = resolve_params(params)
+    if p["min_train_size"]:
+        return p["min_train_size"]
+    if index_type == "ivf_flat":
+        return 2048
+    if index_type == "ivf_pq":
+        return max(2048, 39 * (1 << p["pq_nbits"]))
+    return 0
+
+
+def _nlist_for(n: int, params: Dict) -> int:
+    if params["nlist"]:
+        return params["nlist"]
+    return max(8, min(65536, int(math.sqrt(n))))
+
+
+def create_index(index_type: str, dim: int, params: Optional[Dict] = None,
+                 train_vectors: Optional[np.ndarray] = None) -> faiss.Index:
+    """
+    创建支持 add_with_ids 的内积索引。
+    需要训练的类型必须传入 train_vectors，返回时已完成训练。
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型：{index_type}，可选 {INDEX_TYPES}")
+    p = resolve_params(params)
+
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    if index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, p["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = p["ef_construction"]
+        hnsw.hnsw.efSearch = p["ef_search"]
+        return faiss.IndexIDMap2(hnsw)
+
+    if train_vectors is None or len(train_vectors) == 0:
+        raise ValueError(f"{index_type} 索引需要训练向量")
+    nlist = min(_nlist_for(len(train_vectors), p), len(train_vectors))
+    # 训练样本足够覆盖每个簇即可，过多只会拖慢 k-means
+    max_train = 256 * max(nlist, 1 << p["pq_nbits"] if index_type == "ivf_pq" else nlist)
+    if len(train_vectors) > max_train:
+        rng = np.random.default_rng(0)
+        train_vectors = train_vectors[rng.choice(len(train_vectors), max_train, replace=False)]
+    quantizer = faiss.IndexFlatIP(dim)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+        if dim % p["pq_m"] != 0:
+            raise ValueError(f"pq_m={p['pq_m']} 必须整除向量维度 {dim}")
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, p["pq_m"], p["pq_nbits"],
+                                 faiss.METRIC_INNER_PRODUCT)
+    index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+    # IVF 本身支持自定义 id 和 remove_ids，不需要再包 IndexIDMap2
+    index.nprobe = min(p["nprobe"], nlist)
+    # quantizer 的生命周期交给 C++ 索引管理，避免 Python 端先回收
+    quantizer.this.disown()
+    index.own_fields = True
+    return index
+
+
+def apply_search_params(index: faiss.Index, index_type: str, params: Optional[Dict] = None):
+    """设置检索期参数（HNSW efSearch / IVF nprobe），加载或复制索引后需要重新设置。"""
+    p = resolve_params(params)
+    if index_type == "hnsw":
+        inner = faiss.downcast_index(index.index) if hasattr(index, "index") else index
+        inner.hnsw.efSearch = p["ef_search"]
+    elif needs_training(index_type):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(p["nprobe"], ivf.nlist)
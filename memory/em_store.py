@@ -1,45 +1,51 @@
 import os
-import sqlite3
-from datetime import datetime
-
-class EMStore:
+import time
+from memory.events import ChangeFeed
+from memory.fts import search_table
+from memory.migrations import ensure_schema, range_table, to_epoch
+from memory.storage import StorageEngine
+from memory.write_behind import BufferedWrites
+
+class EMStore(ChangeFeed, BufferedWrites):
     """
     Episodic Memory Store，基于 SQLite 持久化到 em.db。
     每次 add() 都插入一条新记录，不会覆盖旧记录。
+    写操作会向订阅者发布变更事件（doc_key 为行 id）。
+    可选写后模式（write_behind=True）：写入批量提交，add() 立即返回；行 id 由 SQLite 在落库时分配，
+    随变更事件发布，因此与其他连接同时写入同一文件也不会冲突。
     """
 
-    def __init__(self, db_path: str = "em.db"):
-        self.db_path = db_path
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+    tier = "episodic"
+
+    def __init__(self, db_path: str = "em.db", journal_mode: str = "wal", synchronous: str = "normal",
+                 write_behind: bool = False, max_batch: int = 256, flush_interval: float = 0.05,
+                 engine: StorageEngine = None):
+        """
+        :param journal_mode / synchronous: SQLite 日志模式与同步级别，默认 WAL + NORMAL
+        :param write_behind: 为 True 时写入先进入内存队列，按 max_batch 条或 flush_interval 秒批量提交
+        :param engine: 共用的存储引擎（所有层级同库、按线程分配连接），传入时忽略 db_path 与日志配置
+        """
+        super().__init__()
+        self._init_storage(db_path, engine, journal_mode, synchronous, write_behind, max_batch, flush_interval)
         self._ensure_table()
 
     def _ensure_table(self):
-        """创建表结构，如果不存在则新建。"""
-        c = self.conn.cursor()
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS episodic_memory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            key TEXT NOT NULL,
-            content TEXT NOT NULL,
-            timestamp TEXT NOT NULL
-        )
-        """)
-        self.conn.commit()
+        """创建表结构（如不存在）并应用未完成的结构迁移，见 memory/migrations.py。"""
+        ensure_schema(self.conn, "episodic", "episodic_memory", rowid_col="id")
 
     def add(self, key: str, content: str, timestamp: str = None):
         """
         添加一条记忆（每次都插入新记录）。
         :param key: 记忆关键词
         :param content: 记忆内容
-        :param timestamp: 时间戳字符串，默认当前时间
+        :param timestamp: Unix 秒或日期字符串，统一存为整数 Unix 秒，默认当前时间
+        :return: 新记录的行 id；写后模式下为 None（行 id 落库后随变更事件发布）
         """
-        ts = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        c = self.conn.cursor()
-        c.execute("""
+        ts = to_epoch(timestamp) if timestamp is not None else int(time.time())
+        return self._write("""
         INSERT INTO episodic_memory (key, content, timestamp)
         VALUES (?, ?, ?)
-        """, (key, content, ts))
-        self.conn.commit()
+        """, (key, content, ts), "insert", key=key, content=content, timestamp=ts, rowid_key=True)
 
     def get_all(self, key: str):
         """
@@ -51,10 +57,29 @@ class EMStore:
         SELECT content, timestamp 
         FROM episodic_memory 
         WHERE key = ? 
-        ORDER BY timestamp ASC
+        ORDER BY timestamp ASC, id ASC
         """, (key,))
         return c.fetchall()
 
+    def get_after(self, key: str, after_id: int = 0, limit: int = None):
+        """
+        获取指定 key 中行 id 大于 after_id 的记录（即某个水位之后新增的记录），按 id 升序。
+        :return: list of (id, content, timestamp)
+        """
+        sql = """
+        SELECT id, content, timestamp
+        FROM episodic_memory
+        WHERE key = ? AND id > ?
+        ORDER BY id ASC
+        """
+        params = [key, after_id]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        c = self.conn.cursor()
+        c.execute(sql, params)
+        return c.fetchall()
+
     def get_latest(self, key: str):
         """
         获取指定 key 的最新一条记录。
@@ -65,7 +90,7 @@ class EMStore:
         SELECT content, timestamp 
         FROM episodic_memory 
         WHERE key = ? 
-        ORDER BY timestamp DESC 
+        ORDER BY timestamp DESC, id DESC
         LIMIT 1
         """, (key,))
         row = c.fetchone()
@@ -99,16 +124,23 @@ class EMStore:
         清空所有记忆，或者只清空指定 key 的所有记录。
         :param key: str or None
         """
+        self.flush()
         c = self.conn.cursor()
         if key is None:
             c.execute("DELETE FROM episodic_memory")
+            self.conn.commit()
+            self._publish("clear")
         else:
+            c.execute("SELECT id FROM episodic_memory WHERE key = ?", (key,))
+            ids = [row[0] for row in c.fetchall()]
             c.execute("DELETE FROM episodic_memory WHERE key = ?", (key,))
-        self.conn.commit()
+            self.conn.commit()
+            for row_id in ids:
+                self._publish("delete", str(row_id), key)
 
     def close(self):
-        """关闭数据库连接。"""
-        self.conn.close()
+        """落库缓冲中的写入并关闭数据库连接。"""
+        self._close_storage()
 
     def get_all_texts(self) -> list[str]:
         """
@@ -118,6 +150,46 @@ class EMStore:
         c.execute("SELECT content FROM episodic_memory")
         return [row[0] for row in c.fetchall()]
 
+    def get_all_entries(self) -> list[tuple[str, str, str, str]]:
+        """
+        返回所有 (doc_key, key, content, timestamp)，doc_key 为行 id，
+        与变更事件中的 doc_key 一致，用于增量索引的全量对账。
+        """
+        c = self.conn.cursor()
+        c.execute("SELECT id, key, content, timestamp FROM episodic_memory")
+        return [(str(row_id), k, cont, ts) for row_id, k, cont, ts in c.fetchall()]
+
+    def search(self, query: str, limit: int = 10, since=None) -> list[tuple[str, str, str, float]]:
+        """
+        基于 FTS5（trigram 分词）的全文检索，子串与排序都在 SQLite 内完成。
+        :param query: 检索短语，短于 3 个字符时退回 LIKE 子串匹配
+        :param limit: 最多返回条数
+        :param since: 只返回 timestamp >= since 的记录（Unix 秒或日期字符串）
+        :return: [(key, content, timestamp, score)]，按 score（-bm25）降序
+        """
+        return search_table(self.conn, "episodic_memory", query, limit, to_epoch(since), rowid_col="id")
+
+    def get_by_ids(self, ids: list[int]) -> dict:
+        """
+        按行 id 批量取记录。
+        :return: { id: (key, content, timestamp) }
+        """
+        if not ids:
+            return {}
+        c = self.conn.cursor()
+        marks = ",".join("?" * len(ids))
+        c.execute(f"""
+        SELECT id, key, content, timestamp
+        FROM episodic_memory
+        WHERE id IN ({marks})
+        """, list(ids))
+        return {row_id: (k, cont, ts) for row_id, k, cont, ts in c.fetchall()}
+
+    def range(self, key: str = None, since=None, until=None, limit: int = None,
+              descending: bool = False) -> list[tuple[str, str, int]]:
+        """按时间范围取记录（Unix 秒或日期字符串），见 memory/migrations.range_table。"""
+        return range_table(self.conn, "episodic_memory", key, to_epoch(since), to_epoch(until), limit, descending, rowid_col="id")
+
 if __name__ == '__main__':
     em = EMStore(db_path="em.db")
 
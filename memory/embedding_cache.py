@@ -0,0 +1,213 @@
+# memory/embedding_cache.py
+
+import hashlib
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from utils import tracing
+
+
+def content_hash(text: str) -> str:
+    """文本内容哈希，与 VectorStore.add_texts 生成 key 的方式一致（md5）。"""
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    持久化的内容寻址嵌入缓存，基于 SQLite 存储到 embedding_cache.db。
+    - 以 (model_name, dim, 内容哈希) 为键，值为 float32 向量的原始字节
+    - 按总字节数做 LRU 淘汰：超过 max_bytes 时沿 last_access 索引删除最久未访问的条目
+    - 读路径不写库：命中只在内存中记下访问时间，攒够 touch_batch 条、下一次写入或淘汰前
+      才批量写回 last_access（进程退出前未写回的访问时间会丢失，只影响淘汰顺序）
+    - 记录命中/未命中/淘汰计数，便于观察冷启动效果
+    同一进程内的所有 VectorStore 默认共用 EmbeddingCache.default()。
+    """
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, db_path: str = "embedding_cache.db", max_bytes: int = 512 * 1024 * 1024,
+                 touch_batch: int = 1024):
+        """
+        :param touch_batch: 内存中积攒多少条访问时间后批量写回
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        # (model, dim, hash) -> 最近访问时间，尚未写回数据库
+        self._touched: Dict[Tuple[str, int, str], float] = {}
+        self.conn = tracing.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._ensure_table()
+        c = self.conn.cursor()
+        c.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache")
+        self.total_bytes = c.fetchone()[0]
+
+    @classmethod
+    def default(cls) -> "EmbeddingCache":
+        """进程内共享的默认缓存实例。"""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def _ensure_table(self):
+        """创建缓存表和淘汰用的访问时间索引。"""
+        c = self.conn.cursor()
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            model TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            last_access REAL NOT NULL,
+            PRIMARY KEY (model, dim, hash)
+        )
+        """)
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_embedding_cache_access
+        ON embedding_cache(last_access)
+        """)
+        self.conn.commit()
+
+    def get_many(self, model: str, dim: int, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """
+        批量查询缓存。
+        :return: { 内容哈希: 向量(shape=(dim,)) }，只包含命中的条目
+        """
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(hashes))
+        if not unique:
+            return found
+        with self._lock:
+            c = self.conn.cursor()
+            # 分批，避免超过 SQLite 的参数个数上限
+            for i in range(0, len(unique), 500):
+                part = unique[i: i + 500]
+                marks = ",".join("?" * len(part))
+                c.execute(f"""
+                SELECT hash, vector FROM embedding_cache
+                WHERE model = ? AND dim = ? AND hash IN ({marks})
+                """, (model, dim, *part))
+                for h, blob in c.fetchall():
+                    found[h] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                for h in found:
+                    self._touched[(model, dim, h)] = now
+                if len(self._touched) >= self.touch_batch:
+                    self._write_access(c)
+                    self.conn.commit()
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, model: str, dim: int, items: Dict[str, np.ndarray]):
+        """
+        批量写入缓存，写入后按 max_bytes 做淘汰。
+        :param items: { 内容哈希: 向量 }
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (model, dim, h, np.asarray(vec, dtype=np.float32).tobytes(), now)
+            for h, vec in items.items()
+        ]
+        with self._lock:
+            c = self.conn.cursor()
+            # 已存在的条目会被替换，先扣掉旧大小
+            for i in range(0, len(rows), 500):
+                part = [r[2] for r in rows[i: i + 500]]
+                marks = ",".join("?" * len(part))
+                c.execute(f"""
+                SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache
+                WHERE model = ? AND dim = ? AND hash IN ({marks})
+                """, (model, dim, *part))
+                self.total_bytes -= c.fetchone()[0]
+            c.executemany("""
+            INSERT OR REPLACE INTO embedding_cache(model, dim, hash, vector, last_access)
+            VALUES (?, ?, ?, ?, ?)
+            """, rows)
+            self.total_bytes += sum(len(r[3]) for r in rows)
+            # 刚写入的条目 last_access 已是最新，不必再写回
+            for r in rows:
+                self._touched.pop((model, dim, r[2]), None)
+            self._write_access(c)
+            self._evict()
+            self.conn.commit()
+
+    def _write_access(self, c):
+        """把内存中积攒的访问时间批量写回（在调用方的事务中，由调用方提交）。"""
+        if not self._touched:
+            return
+        c.executemany("""
+        UPDATE embedding_cache SET last_access = ?
+        WHERE model = ? AND dim = ? AND hash = ?
+        """, [(ts, model, dim, h) for (model, dim, h), ts in self._touched.items()])
+        self._touched.clear()
+
+    def _evict(self):
+        """
+        超过 max_bytes 时按最久未访问淘汰，淘汰到上限的 90% 以免频繁触发。
+        沿 idx_embedding_cache_access 索引从最旧的条目读起，凑够要释放的字节数即停止，不扫全表。
+        """
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        c = self.conn.cursor()
+        c.execute("""
+        SELECT model, dim, hash, LENGTH(vector) FROM embedding_cache INDEXED BY idx_embedding_cache_access
+        ORDER BY last_access ASC
+        """)
+        victims = []
+        freed = 0
+        for model, dim, h, size in c:
+            if self.total_bytes - freed <= target:
+                break
+            victims.append((model, dim, h))
+            freed += size
+        c.executemany("""
+        DELETE FROM embedding_cache WHERE model = ? AND dim = ? AND hash = ?
+        """, victims)
+        self.total_bytes -= freed
+        self.evictions += len(victims)
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中/未命中/淘汰计数和当前占用。"""
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute("SELECT COUNT(*) FROM embedding_cache")
+            entries = c.fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": self.total_bytes,
+            }
+
+    def clear(self):
+        """清空缓存。"""
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute("DELETE FROM embedding_cache")
+            self.conn.commit()
+            self._touched.clear()
+            self.total_bytes = 0
+
+    def close(self):
+        """写回积攒的访问时间并关闭数据库连接。"""
+        with self._lock:
+            if self._touched:
+                self._write_access(self.conn.cursor())
+                self.conn.commit()
+            self.conn.close()
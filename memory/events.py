@@ -0,0 +1,60 @@
+# memory/events.py
+
+from typing import Callable, List, NamedTuple, Optional
+
+
+class MemoryEvent(NamedTuple):
+    """
+    记忆体变更事件。
+    - tier: 记忆层级，"episodic" / "semantic" / "mission"
+    - op: "insert" / "update" / "delete" / "clear"
+    - doc_key: 记录在该层级内的唯一标识（EM 为行 id，SM/MS 为 key）；clear 时为 None
+    - key / content / timestamp: 记录内容，delete/clear 时 content 为 None
+    """
+    tier: str
+    op: str
+    doc_key: Optional[str]
+    key: Optional[str] = None
+    content: Optional[str] = None
+    timestamp: Optional[int] = None
+
+
+class ChangeFeed:
+    """
+    记忆体的变更订阅混入类：写操作提交后调用 _publish 通知所有订阅者。
+    订阅者在写入线程中被同步调用，应只做入队等轻量操作。
+    version 是单调递增的写入计数（每个事件加一），读取它不涉及 SQL，
+    可用来判断缓存是否过期；只统计经由本实例的写入。
+    """
+
+    tier: str = ""
+
+    def __init__(self):
+        self._listeners: List[Callable[[MemoryEvent], None]] = []
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def subscribe(self, listener: Callable[[MemoryEvent], None]):
+        """注册变更回调。"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[MemoryEvent], None]):
+        """取消变更回调。"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _publish(self, op: str, doc_key: Optional[str] = None, key: str = None,
+                 content: str = None, timestamp: int = None):
+        self._version += 1
+        if not self._listeners:
+            return
+        event = MemoryEvent(self.tier, op, doc_key, key, content, timestamp)
+        for listener in list(self._listeners):
+            try:
+                listener(event)
+            except Exception as err:
+                print(f"[ChangeFeed] 变更回调失败：{err}")
@@ -0,0 +1,93 @@
+# memory/fts.py
+
+import sqlite3
+from typing import List, Optional, Tuple
+
+# trigram 分词器需要 SQLite >= 3.34；查询短于 3 个字符时无法用索引，退回 LIKE
+TRIGRAM_MIN_LEN = 3
+
+
+def ensure_fts(conn: sqlite3.Connection, table: str, rowid_col: str = "rowid"):
+    """
+    为 table.content 建立外部内容的 FTS5 虚表 {table}_fts（trigram 分词，中文子串也能命中），
+    并用触发器与主表保持同步。虚表首次创建时回填已有数据。
+    """
+    fts = f"{table}_fts"
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,))
+    existed = c.fetchone() is not None
+    c.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+        content,
+        content='{table}',
+        content_rowid='{rowid_col}',
+        tokenize='trigram'
+    )
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {fts}(rowid, content) VALUES (new.{rowid_col}, new.content);
+    END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.{rowid_col}, old.content);
+    END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.{rowid_col}, old.content);
+        INSERT INTO {fts}(rowid, content) VALUES (new.{rowid_col}, new.content);
+    END
+    """)
+    if not existed:
+        c.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    conn.commit()
+
+
+def build_match(query: str) -> Optional[str]:
+    """
+    把查询拆成重叠的 trigram，用 OR 连接成 MATCH 表达式：
+    整句命中的记录包含全部 trigram，BM25 排在最前；部分命中的也能召回。
+    查询短于 3 个字符时返回 None。
+    """
+    text = query.strip()
+    if len(text) < TRIGRAM_MIN_LEN:
+        return None
+    grams = dict.fromkeys(text[i: i + 3] for i in range(len(text) - 2))
+    return " OR ".join('"' + g.replace('"', '""') + '"' for g in grams)
+
+
+def search_table(conn: sqlite3.Connection, table: str, query: str, limit: int = 10,
+                 since=None, rowid_col: str = "rowid") -> List[Tuple[str, str, str, float]]:
+    """
+    在 table 上做全文检索。
+    :param since: 只返回 timestamp >= since 的记录
+    :return: [(key, content, timestamp, score)]，score 越大越相关
+    """
+    fts = f"{table}_fts"
+    match = build_match(query)
+    time_filter = "AND t.timestamp >= ?" if since is not None else ""
+    c = conn.cursor()
+    if match is not None:
+        params = [match] + ([since] if since is not None else []) + [limit]
+        c.execute(f"""
+        SELECT t.key, t.content, t.timestamp, -bm25({fts}) AS score
+        FROM {fts} JOIN {table} AS t ON t.{rowid_col} = {fts}.rowid
+        WHERE {fts} MATCH ? {time_filter}
+        ORDER BY bm25({fts})
+        LIMIT ?
+        """, params)
+    else:
+        # 短查询：trigram 索引无法使用，退回 LIKE 子串匹配，按时间倒序
+        pattern = "%" + query.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        params = [pattern] + ([since] if since is not None else []) + [limit]
+        c.execute(f"""
+        SELECT t.key, t.content, t.timestamp, 1.0 AS score
+        FROM {table} AS t
+        WHERE t.content LIKE ? ESCAPE '\\' {time_filter}
+        ORDER BY t.timestamp DESC
+        LIMIT ?
+        """, params)
+    return c.fetchall()
+
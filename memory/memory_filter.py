@@ -1,17 +1,21 @@
 # memory/memory_filter.py
 
-import difflib
 from typing import List, Dict
+from memory.ngram_index import MemoryTextIndex
 
 class MemoryFilter:
     """
     根据 LLM 生成的查询短语，在 EM/SM/MS 三大记忆里检索最匹配的条目。
     """
 
-    def __init__(self, em_store, sm_store, ms_store):
+    def __init__(self, em_store, sm_store, ms_store, text_index: MemoryTextIndex = None):
+        """
+        :param text_index: 可与 SimpleMemoryRetriever 共用的全文索引，默认新建
+        """
         self.em_store = em_store
         self.sm_store = sm_store
         self.ms_store = ms_store
+        self.text_index = text_index or MemoryTextIndex(em_store, sm_store, ms_store)
 
     def filter(self, query: str, top_k: int = 5) -> List[Dict]:
         """
@@ -19,33 +23,9 @@ class MemoryFilter:
         :param top_k: 最多返回条数
         :return: List of {"source","key","content","timestamp","score"}
         """
-        # 1) 把所有记忆体拼成一张大表
-        pool = []
-        # episodic
-        for key, content, ts in self.em_store.get_all_records():
-            pool.append({"source":"episodic_memory","key":key,
-                         "content":content,"timestamp":ts})
-        # semantic
-        for key, content, ts in self.sm_store.get_all_records():
-            pool.append({"source":"semantic_memory","key":key,
-                         "content":content,"timestamp":ts})
-        # mission
-        for key, content, ts in self.ms_store.get_all_records():
-            pool.append({"source":"mission_memory","key":key,
-                         "content":content,"timestamp":ts})
-
-        # 2) 对每条 content 计算简单相似度：子串匹配得高分，否则 difflib
-        results = []
-        for item in pool:
-            text = item["content"]
-            if query in text:
-                score = 1.0
-            else:
-                # ratio([0,1])
-                score = difflib.SequenceMatcher(None, query, text).ratio()
-            if score > 0.1:  # 阈值可调
-                results.append({**item, "score": score})
+        # 1) 倒排索引按 BM25 召回候选，不再逐条扫描三大记忆体
+        # 2) 对候选计算简单相似度：子串匹配得高分，否则 difflib ratio([0,1])
+        results = self.text_index.search(query, top_k)
 
-        # 3) 按 score 排序并取 top_k
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:top_k]
+        # 3) 按阈值过滤（已按 score 排序并取 top_k）
+        return [r for r in results if r["score"] > 0.1]  # 阈值可调
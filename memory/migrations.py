@@ -0,0 +1,266 @@
+# memory/migrations.py
+
+import sqlite3
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from memory.fts import ensure_fts
+
+
+class Migration(NamedTuple):
+    """一次结构迁移：version 从 1 开始连续递增，apply 在事务内执行。"""
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+_TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S",
+                 "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%d")
+
+
+def to_epoch(value) -> Optional[int]:
+    """
+    把各种历史时间戳统一成整数 Unix 秒：
+    - int / float / 数字字符串（Tools.get_timestamp() 写入的格式）直接取整
+    - "%Y-%m-%d %H:%M:%S" 等日期字符串按本地时间解析（与 datetime.now() 写入时一致）
+    - None 返回 None；无法解析时返回 0，排在所有记录之前
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    try:
+        return int(float(text))
+    except ValueError:
+        pass
+    for fmt in _TIME_FORMATS:
+        try:
+            return int(time.mktime(datetime.strptime(text, fmt).timetuple()))
+        except ValueError:
+            continue
+    return 0
+
+
+def _ensure_migrations_table(conn: sqlite3.Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        component TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        description TEXT NOT NULL,
+        applied_at INTEGER NOT NULL,
+        PRIMARY KEY (component, version)
+    )
+    """)
+
+
+def current_version(conn: sqlite3.Connection, component: str) -> int:
+    """component 已应用的最高迁移版本，未迁移过时为 0。"""
+    _ensure_migrations_table(conn)
+    row = conn.execute(
+        "SELECT COALESCE(MAX(version), 0) FROM schema_migrations WHERE component = ?", (component,)
+    ).fetchone()
+    return row[0]
+
+
+def migrate(conn: sqlite3.Connection, component: str, migrations: List[Migration]) -> int:
+    """
+    按版本顺序应用 component 尚未应用的迁移，每个迁移连同版本记录在同一事务中提交，失败时回滚并抛出。
+    版本按组件记录在 schema_migrations 表中（而不是 PRAGMA user_version），多个组件可共用一个数据库。
+    :return: 迁移后的版本
+    """
+    if conn.in_transaction:
+        conn.commit()
+    version = current_version(conn, component)
+    conn.commit()
+    for m in sorted(migrations, key=lambda m: m.version):
+        if m.version <= version:
+            continue
+        start = time.perf_counter()
+        try:
+            conn.execute("BEGIN")
+            m.apply(conn)
+            conn.execute(
+                "INSERT INTO schema_migrations(component, version, description, applied_at) VALUES (?, ?, ?, ?)",
+                (component, m.version, m.description, int(time.time())))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f"[Migrations] {component} 迁移到 v{m.version} 失败：{m.description}")
+            raise
+        version = m.version
+        print(f"[Migrations] {component} 已迁移到 v{m.version}（{m.description}），"
+              f"用时 {time.perf_counter() - start:.2f}s")
+    return version
+
+
+def _column_type(conn: sqlite3.Connection, table: str, column: str) -> Optional[str]:
+    for _, name, col_type, *_ in conn.execute(f"PRAGMA table_info({table})"):
+        if name == column:
+            return col_type.upper()
+    return None
+
+
+def _integer_timestamps(table: str, columns: str, copy_cols: str) -> Callable[[sqlite3.Connection], None]:
+    """
+    把 table.timestamp 从 TEXT 重建为 INTEGER（SQLite 不支持修改列类型）：
+    建新表 -> 转换并复制数据（保留 rowid/id，FTS 中的 rowid 仍然有效）-> 删除旧表 -> 改名。
+    旧表的 FTS 触发器随旧表删除，由 ensure_fts 随后重新创建；FTS 虚表在这里整体重建。
+    """
+    def apply(conn: sqlite3.Connection):
+        if _column_type(conn, table, "timestamp") == "INTEGER":
+            return
+        conn.create_function("to_epoch", 1, to_epoch, deterministic=True)
+        # 保留 AUTOINCREMENT 序列，避免删除过的行 id 被重新使用（向量索引以行 id 为文档键）
+        seq = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").fetchone() and \
+            conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        conn.execute(f"DROP TABLE IF EXISTS {table}__new")
+        conn.execute(f"CREATE TABLE {table}__new ({columns})")
+        conn.execute(f"""
+        INSERT INTO {table}__new({copy_cols}, key, content, timestamp)
+        SELECT {copy_cols}, key, content, to_epoch(timestamp) FROM {table}
+        """)
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}__new RENAME TO {table}")
+        if seq:
+            conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq[0], table))
+        fts = f"{table}_fts"
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)).fetchone():
+            conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    return apply
+
+
+def _rowid_alias(table: str, columns: str) -> Callable[[sqlite3.Connection], None]:
+    """
+    给以 TEXT key 为主键的表加上显式的 id INTEGER PRIMARY KEY（rowid 的别名）：
+    外部内容 FTS 以 rowid 关联主表，隐式 rowid 在 VACUUM 时可能被重新编号，FTS 随之错位；
+    rowid 成为列之后 VACUUM 不会改变它。按原 rowid 复制数据，重建时间索引与 FTS。
+    """
+    def apply(conn: sqlite3.Connection):
+        if _column_type(conn, table, "id") is not None:
+            return
+        conn.execute(f"DROP TABLE IF EXISTS {table}__new")
+        conn.execute(f"CREATE TABLE {table}__new ({columns})")
+        conn.execute(f"""
+        INSERT INTO {table}__new(id, key, content, timestamp)
+        SELECT rowid, key, content, timestamp FROM {table}
+        """)
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}__new RENAME TO {table}")
+        for sql in _time_indexes(table):
+            conn.execute(sql)
+        fts = f"{table}_fts"
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)).fetchone():
+            conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    return apply
+
+
+def _run_statements(*statements: str) -> Callable[[sqlite3.Connection], None]:
+    def apply(conn: sqlite3.Connection):
+        for sql in statements:
+            conn.execute(sql)
+    return apply
+
+
+def _time_indexes(table: str) -> Tuple[str, ...]:
+    return (
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_key_ts ON {table}(key, timestamp)",
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table}(timestamp)",
+    )
+
+
+def _migrations_for(table: str, columns: str, copy_cols: str) -> List[Migration]:
+    return [
+        Migration(1, "timestamp 统一为 INTEGER Unix 秒", _integer_timestamps(table, columns, copy_cols)),
+        Migration(2, "增加 (key, timestamp) 与 (timestamp) 索引", _run_statements(*_time_indexes(table))),
+    ]
+
+
+def range_table(conn: sqlite3.Connection, table: str, key: str = None, since: int = None, until: int = None,
+                limit: int = None, descending: bool = False,
+                rowid_col: Optional[str] = None) -> List[Tuple[str, str, int]]:
+    """
+    按时间范围取 table 的记录，走 (key, timestamp) / (timestamp) 索引，不做全表扫描。
+    两个索引都不是覆盖索引：命中的每一行再按 rowid 回表读取 content（content 不放进索引，避免正文存两份）。
+    :param key: 只取该 key 的记录，None 表示所有 key
+    :param since / until: 时间下界 / 上界（含），Unix 秒
+    :param limit: 最多返回条数
+    :param descending: 是否按时间倒序
+    :param rowid_col: 时间相同时按该列排序（与时间同向），None 表示不加
+    :return: [(key, content, timestamp)]
+    """
+    where, params = [], []
+    if key is not None:
+        where.append("key = ?")
+        params.append(key)
+    if since is not None:
+        where.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("timestamp <= ?")
+        params.append(until)
+    order = "DESC" if descending else "ASC"
+    sql = f"SELECT key, content, timestamp FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY timestamp {order}"
+    if rowid_col is not None:
+        sql += f", {rowid_col} {order}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    c = conn.cursor()
+    c.execute(sql, params)
+    return c.fetchall()
+
+
+# 各记忆体当前的表结构（新库直接按此建表，迁移 1 对新库是空操作）
+SCHEMAS: Dict[str, str] = {
+    "episodic_memory": """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp INTEGER NOT NULL
+    """,
+    "semantic_memory": """
+        id INTEGER PRIMARY KEY,
+        key TEXT NOT NULL UNIQUE,
+        content TEXT NOT NULL,
+        timestamp INTEGER NOT NULL
+    """,
+    "mission_state": """
+        id INTEGER PRIMARY KEY,
+        key TEXT NOT NULL UNIQUE,
+        content TEXT NOT NULL,
+        timestamp INTEGER NOT NULL
+    """,
+}
+
+# 组件名 -> 迁移列表；组件名即记忆层级（ChangeFeed.tier）
+MIGRATIONS: Dict[str, List[Migration]] = {
+    "episodic": _migrations_for("episodic_memory", SCHEMAS["episodic_memory"], "id"),
+    "semantic": _migrations_for("semantic_memory", SCHEMAS["semantic_memory"], "rowid") + [
+        Migration(3, "增加抽象水位表 abstraction_watermark", _run_statements("""
+        CREATE TABLE IF NOT EXISTS abstraction_watermark (
+            key TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL
+        )
+        """)),
+        Migration(4, "增加 id INTEGER PRIMARY KEY，FTS 的 rowid 不再随 VACUUM 变化",
+                  _rowid_alias("semantic_memory", SCHEMAS["semantic_memory"])),
+    ],
+    "mission": _migrations_for("mission_state", SCHEMAS["mission_state"], "rowid") + [
+        Migration(3, "增加 id INTEGER PRIMARY KEY，FTS 的 rowid 不再随 VACUUM 变化",
+                  _rowid_alias("mission_state", SCHEMAS["mission_state"])),
+    ],
+}
+
+
+def ensure_schema(conn: sqlite3.Connection, component: str, table: str, rowid_col: str = "rowid"):
+    """建表（如不存在）、应用未完成的迁移，再确保 FTS 虚表与触发器存在。"""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({SCHEMAS[table]})")
+    conn.commit()
+    migrate(conn, component, MIGRATIONS[component])
+    ensure_fts(conn, table, rowid_col=rowid_col)
@@ -0,0 +1,203 @@
+# memory/ngram_index.py
+
+import difflib
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+from memory.snapshot import MemoryRecord, MemorySnapshot
+
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """n-gram 切分前的规整：转小写并去掉空白。"""
+    return _SPACE.sub("", text.lower())
+
+
+def char_ngrams(text: str, ns: Tuple[int, ...] = (2, 3)) -> List[str]:
+    """
+    字符 n-gram 切分（默认 bigram + trigram），中文无需分词器。
+    先转小写并去掉空白；文本短于最小 n 时整段作为一个词项。
+    """
+    text = normalize_text(text)
+    grams = []
+    for n in ns:
+        grams.extend(text[i: i + n] for i in range(len(text) - n + 1))
+    if not grams and text:
+        grams.append(text)
+    return grams
+
+
+def similarity(query: str, text: str) -> float:
+    """原有的相似度规则：子串命中得 1.0，否则 difflib 相似度。"""
+    if query in text:
+        return 1.0
+    return difflib.SequenceMatcher(None, query, text).ratio()
+
+
+class NgramIndex:
+    """
+    增量维护的字符 n-gram 倒排索引，BM25 打分。
+    查询只遍历查询词项的倒排链，代价与命中的 posting 数成正比，而不是语料总量。
+    另维护单字倒排（字符 -> 文档集合），供短于最小 n 的查询（如单个汉字）做子串查找。
+    """
+
+    def __init__(self, ns: Tuple[int, ...] = (2, 3), k1: float = 1.2, b: float = 0.75):
+        self.ns = ns
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[Hashable, int]] = {}   # 词项 -> {文档 id: 词频}
+        self.doc_len: Dict[Hashable, int] = {}
+        self.doc_terms: Dict[Hashable, Tuple[str, ...]] = {}  # 删除时需要知道文档有哪些词项
+        self.chars: Dict[str, Set[Hashable]] = {}             # 单字 -> {文档 id}
+        self.total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    def add(self, doc_id: Hashable, text: str):
+        """加入或替换一篇文档。"""
+        if doc_id in self.doc_len:
+            self.remove(doc_id)
+        tf = Counter(char_ngrams(text, self.ns))
+        for term, count in tf.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        length = sum(tf.values())
+        self.doc_len[doc_id] = length
+        self.doc_terms[doc_id] = tuple(tf)
+        self.total_len += length
+        for ch in set("".join(tf)):
+            self.chars.setdefault(ch, set()).add(doc_id)
+
+    def remove(self, doc_id: Hashable) -> bool:
+        """删除一篇文档，只触及该文档自身的词项。"""
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return False
+        for term in terms:
+            plist = self.postings.get(term)
+            if plist is not None:
+                plist.pop(doc_id, None)
+                if not plist:
+                    del self.postings[term]
+        for ch in set("".join(terms)):
+            docs = self.chars.get(ch)
+            if docs is not None:
+                docs.discard(doc_id)
+                if not docs:
+                    del self.chars[ch]
+        self.total_len -= self.doc_len.pop(doc_id)
+        return True
+
+    def clear(self):
+        self.postings.clear()
+        self.doc_len.clear()
+        self.doc_terms.clear()
+        self.chars.clear()
+        self.total_len = 0
+
+    def search(self, query: str, limit: int = 200) -> List[Tuple[Hashable, float]]:
+        """
+        BM25 检索。
+        :return: [(文档 id, 分数)]，按分数降序，最多 limit 条
+        """
+        n_docs = len(self.doc_len)
+        if not n_docs:
+            return []
+        avg_len = self.total_len / n_docs or 1.0
+        k1, b = self.k1, self.b
+        scores: Dict[Hashable, float] = {}
+        for term in set(char_ngrams(query, self.ns)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            df = len(plist)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in plist.items():
+                norm = tf + k1 * (1 - b + b * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        return ranked[:limit]
+
+    def search_short(self, query: str) -> Set[Hashable]:
+        """
+        短于最小 n 的查询：取查询中各字符的单字倒排的交集。
+        单字查询即为精确结果；更长的查询只是候选，需再做子串校验。
+        """
+        query = normalize_text(query)
+        if not query:
+            return set()
+        sets = sorted((self.chars.get(ch, set()) for ch in set(query)), key=len)
+        return set(sets[0]).intersection(*sets[1:])
+
+
+class MemoryTextIndex:
+    """
+    三大记忆体的全文索引，建立在 MemorySnapshot 之上：
+    快照首次刷新时全量建索引，之后只按快照转发的增量更新倒排链；
+    记忆体版本未变化时检索不执行任何 SQL。供 SimpleMemoryRetriever 与 MemoryFilter 共用。
+    """
+
+    def __init__(self, em_store, sm_store, ms_store, snapshot: MemorySnapshot = None):
+        """
+        :param snapshot: 可与其他组件共用的记忆快照，默认新建
+        """
+        self.snapshot = snapshot or MemorySnapshot(em_store, sm_store, ms_store)
+        self.index = NgramIndex()
+        self._lock = threading.RLock()
+        self.snapshot.add_listener(self._on_change)
+
+    def _on_change(self, tier: str, doc_key: Optional[str], record: Optional[MemoryRecord]):
+        with self._lock:
+            if doc_key is None:
+                # 该层被清空或即将整层重新加载
+                for doc_id in [d for d in self.index.doc_len if d[0] == tier]:
+                    self.index.remove(doc_id)
+            elif record is None:
+                self.index.remove((tier, doc_key))
+            else:
+                self.index.add((tier, doc_key), record.content)
+
+    def all_records(self) -> List[Dict]:
+        return self.snapshot.as_dicts()
+
+    def search(self, query: str, top_k: int = 5, rerank: bool = True,
+               candidates: int = 200) -> List[Dict]:
+        """
+        先用 BM25 取前 candidates 个候选，再按原有规则打分：
+        子串命中得 1.0，否则 difflib 相似度（rerank=True）；
+        rerank=False 时直接返回按最高分归一化的 BM25 分数。
+        :return: List of {"source","key","content","timestamp","score"}，按 score 降序
+        """
+        self.snapshot.refresh()
+        with self._lock:
+            normalized = normalize_text(query)
+            if len(normalized) < min(self.index.ns):
+                # 查询短于最小 n，切不出可命中的 n-gram：改查单字倒排；
+                # 否则 BM25 无结果即说明不存在子串命中，无需再扫描全部记录
+                items = []
+                for tier, doc_key in self.index.search_short(query):
+                    record = self.snapshot.get(tier, doc_key)
+                    if record is not None and normalized in normalize_text(record.content):
+                        items.append((record, 1.0))
+                        if len(items) >= candidates:
+                            break
+            else:
+                ranked = self.index.search(query, candidates)
+                items = [(self.snapshot.get(tier, doc_key), score) for (tier, doc_key), score in ranked]
+
+        results = []
+        top = items[0][1] if items else 1.0
+        for record, bm25 in items:
+            if record is None:
+                continue
+            if rerank or query in record.content:
+                score = similarity(query, record.content)
+            else:
+                score = bm25 / top
+            results.append({**record.as_dict(), "score": score})
+        results.sort(key=lambda x: x["score"], reverse=True)
+        return results[:top_k] if top_k else results
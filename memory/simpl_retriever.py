@@ -1,48 +1,67 @@
 # memory/simple_retriever.py
 
-import difflib
 from typing import List, Dict
+from memory.ngram_index import MemoryTextIndex, similarity
+from memory.snapshot import MemorySnapshot
 
 class SimpleMemoryRetriever:
     """
     用于基于检索短语，在三大记忆体中做子串+相似度匹配，返回 Top-K 结果。
+    候选召回有两种后端，只对少量候选做 difflib 精排：
+    - "ngram"：进程内增量维护的 n-gram 倒排索引（BM25）
+    - "fts"：各记忆体 SQLite 中的 FTS5 trigram 全文索引，子串与排序下推到数据库
     """
 
-    def __init__(self, em_store, sm_store, ms_store):
+    def __init__(self, em_store, sm_store, ms_store, text_index: MemoryTextIndex = None,
+                 rerank: bool = True, candidates: int = 200, backend: str = "ngram"):
+        """
+        :param backend: 候选召回后端，"ngram" 或 "fts"
+        :param text_index: 可与 MemoryFilter 共用的全文索引，默认新建（仅 ngram 后端）
+        :param rerank: 是否对 BM25 候选做 difflib 精排
+        :param candidates: 参与精排的 BM25 候选数
+        """
+        if backend not in ("ngram", "fts"):
+            raise ValueError(f"不支持的检索后端：{backend}")
         self.em = em_store
         self.sm = sm_store
         self.ms = ms_store
+        self.backend = backend
+        self.text_index = text_index
+        if backend == "ngram" and text_index is None:
+            self.text_index = MemoryTextIndex(em_store, sm_store, ms_store)
+        # get_all() 读取的版本化快照：没有新写入时不执行任何 SQL
+        self.snapshot = self.text_index.snapshot if self.text_index else MemorySnapshot(em_store, sm_store, ms_store)
+        self.rerank = rerank
+        self.candidates = candidates
 
     def get_all(self) -> List[Dict]:
         """
-        把三大记忆体的所有记录都读出来，格式化成列表。
+        把三大记忆体的所有记录格式化成列表（来自快照，同一版本下返回同一个列表，请勿修改）。
         """
-        pool = []
-        # 事实记忆：可能多条
-        for key, content, ts in self.em.get_all_records():
-            pool.append({"source":"episodic_memory","key":key,"content":content,"timestamp":ts})
-        # 语义记忆：只要最新一条
-        for key, content, ts in self.sm.get_all_records():
-            pool.append({"source":"semantic_memory","key":key,"content":content,"timestamp":ts})
-        # 目标记忆：只要最新一条
-        for key, content, ts in self.ms.get_all_records():
-            pool.append({"source":"mission_memory","key":key,"content":content,"timestamp":ts})
-        return pool
+        return self.snapshot.as_dicts()
 
     def query(self, query: str, top_k: int = 5, cutoff: float = 0.2) -> List[Dict]:
         """
-        对所有 content 做子串和 difflib 相似度匹配，返回 Top-K。
+        对 BM25 召回的候选做子串和 difflib 相似度匹配，返回 Top-K。
         """
-        pool = self.get_all()
+        if self.backend == "fts":
+            results = self._query_fts(query)
+        else:
+            results = self.text_index.search(query, top_k, rerank=self.rerank, candidates=self.candidates)
+        results = [r for r in results if r["score"] >= cutoff]
+        return results[:top_k]
+
+    def _query_fts(self, query: str) -> List[Dict]:
+        """每个记忆体在 SQLite 内用 FTS5 取前 candidates 条候选，再统一精排。"""
         results = []
-        for item in pool:
-            text = item["content"]
-            if query in text:
-                score = 1.0
-            else:
-                score = difflib.SequenceMatcher(None, query, text).ratio()
-            if score >= cutoff:
-                results.append({**item, "score": score})
-        # 排序，取前 K
+        for source, store in (("episodic_memory", self.em),
+                              ("semantic_memory", self.sm),
+                              ("mission_memory", self.ms)):
+            hits = store.search(query, self.candidates)
+            top = max((rank for *_, rank in hits), default=1.0) or 1.0
+            for key, content, ts, rank in hits:
+                score = similarity(query, content) if self.rerank or query in content else rank / top
+                results.append({"source": source, "key": key, "content": content,
+                                "timestamp": ts, "score": score})
         results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:top_k]
+        return results
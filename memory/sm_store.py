@@ -1,53 +1,54 @@
 # memory/sm_store.py
 
-import sqlite3
-from datetime import datetime
-
-class SMStore:
+import time
+from memory.events import ChangeFeed
+from memory.fts import search_table
+from memory.migrations import ensure_schema, range_table, to_epoch
+from memory.storage import StorageEngine
+from memory.write_behind import BufferedWrites
+
+class SMStore(ChangeFeed, BufferedWrites):
     """
     Semantic Memory Store，基于 SQLite 持久化到 sm.db。
     每个 key 只保留一条记录；重复 add 同一 key 会更新内容和时间戳。
+    写操作会向订阅者发布变更事件（doc_key 即 key）。
+    可选写后模式（write_behind=True）：写入批量提交，变更事件在落库后发布。
     """
 
-    def __init__(self, db_path: str = "sm.db"):
+    tier = "semantic"
+
+    def __init__(self, db_path: str = "sm.db", journal_mode: str = "wal", synchronous: str = "normal",
+                 write_behind: bool = False, max_batch: int = 256, flush_interval: float = 0.05,
+                 engine: StorageEngine = None):
         """
         打开（或创建）SQLite 数据库，并确保表结构存在。
+        :param journal_mode / synchronous: SQLite 日志模式与同步级别，默认 WAL + NORMAL
+        :param write_behind: 为 True 时写入先进入内存队列，按 max_batch 条或 flush_interval 秒批量提交
+        :param engine: 共用的存储引擎（所有层级同库、按线程分配连接），传入时忽略 db_path 与日志配置
         """
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        super().__init__()
+        self._init_storage(db_path, engine, journal_mode, synchronous, write_behind, max_batch, flush_interval)
         self._ensure_table()
 
     def _ensure_table(self):
-        """
-        创建表 episodic_memory（如果不存在）。
-        key 设置为 PRIMARY KEY，以便重复插入时自动替换。
-        """
-        c = self.conn.cursor()
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS semantic_memory (
-            key TEXT PRIMARY KEY,
-            content TEXT NOT NULL,
-            timestamp TEXT NOT NULL
-        )
-        """)
-        self.conn.commit()
+        """创建表结构（如不存在）并应用未完成的结构迁移，见 memory/migrations.py。"""
+        ensure_schema(self.conn, "semantic", "semantic_memory")
 
     def add(self, key: str, content: str, timestamp: str = None):
         """
         添加或更新一条语义记忆。
         :param key: 概念或术语的标识符
         :param content: 该概念的定义或描述
-        :param timestamp: 时间戳，默认为当前时间
+        :param timestamp: Unix 秒或日期字符串，统一存为整数 Unix 秒，默认为当前时间
         """
-        ts = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        c = self.conn.cursor()
-        c.execute("""
+        ts = to_epoch(timestamp) if timestamp is not None else int(time.time())
+        self._write("""
         INSERT INTO semantic_memory(key, content, timestamp)
         VALUES (?, ?, ?)
         ON CONFLICT(key) DO UPDATE SET
             content = excluded.content,
             timestamp = excluded.timestamp
-        """, (key, content, ts))
-        self.conn.commit()
+        """, (key, content, ts), "update", key, key, content, ts)
 
     def get(self, key: str):
         """
@@ -83,23 +84,51 @@ class SMStore:
         """
         删除指定概念。
         """
+        self.flush()
         c = self.conn.cursor()
         c.execute("DELETE FROM semantic_memory WHERE key = ?", (key,))
+        c.execute("DELETE FROM abstraction_watermark WHERE key = ?", (key,))
         self.conn.commit()
+        self._publish("delete", key, key)
 
     def clear(self):
         """
         清空所有语义记忆。
         """
+        self.flush()
         c = self.conn.cursor()
         c.execute("DELETE FROM semantic_memory")
+        c.execute("DELETE FROM abstraction_watermark")
         self.conn.commit()
+        self._publish("clear")
+
+    def get_watermark(self, key: str) -> int:
+        """
+        该 key 的抽象水位：上次抽象已折叠到的最后一条情景记忆行 id，从未抽象过时为 0。
+        """
+        c = self.conn.cursor()
+        c.execute("SELECT last_id FROM abstraction_watermark WHERE key = ?", (key,))
+        row = c.fetchone()
+        return row[0] if row else 0
+
+    def set_watermark(self, key: str, last_id: int):
+        """
+        推进抽象水位。应在写入对应的抽象总结之后调用：写后模式下两者按顺序落库，
+        即使中途崩溃也只会重复折叠，不会漏掉记录。
+        """
+        self._write("""
+        INSERT INTO abstraction_watermark(key, last_id, timestamp)
+        VALUES (?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            last_id = excluded.last_id,
+            timestamp = excluded.timestamp
+        """, (key, last_id, int(time.time())))
 
     def close(self):
         """
-        关闭数据库连接。
+        落库缓冲中的写入并关闭数据库连接。
         """
-        self.conn.close()
+        self._close_storage()
     
     def get_all_texts(self) -> list[str]:
         """
@@ -125,6 +154,28 @@ class SMStore:
         c.execute("SELECT key, content, timestamp FROM semantic_memory")
         return c.fetchall()
 
+    def get_all_entries(self) -> list[tuple[str, str, str, str]]:
+        """
+        返回所有 (doc_key, key, content, timestamp)，doc_key 即 key，
+        与变更事件中的 doc_key 一致，用于增量索引的全量对账。
+        """
+        return [(k, k, cont, ts) for k, cont, ts in self.get_all_records()]
+
+    def search(self, query: str, limit: int = 10, since=None) -> list[tuple[str, str, str, float]]:
+        """
+        基于 FTS5（trigram 分词）的全文检索，子串与排序都在 SQLite 内完成。
+        :param query: 检索短语，短于 3 个字符时退回 LIKE 子串匹配
+        :param limit: 最多返回条数
+        :param since: 只返回 timestamp >= since 的记录（Unix 秒或日期字符串）
+        :return: [(key, content, timestamp, score)]，按 score（-bm25）降序
+        """
+        return search_table(self.conn, "semantic_memory", query, limit, to_epoch(since))
+
+    def range(self, key: str = None, since=None, until=None, limit: int = None,
+              descending: bool = False) -> list[tuple[str, str, int]]:
+        """按时间范围取记录（Unix 秒或日期字符串），见 memory/migrations.range_table。"""
+        return range_table(self.conn, "semantic_memory", key, to_epoch(since), to_epoch(until), limit, descending)
+
 if __name__ == '__main__':
     sm = SMStore()              # 打开（或创建）sm.db
     sm.add("地球", "地球是太阳系的第三颗行星。")
@@ -0,0 +1,148 @@
+# memory/snapshot.py
+
+import threading
+from typing import Callable, Dict, List, Optional
+
+from memory.events import MemoryEvent
+
+
+class MemoryRecord:
+    """快照中的一条记忆，用 __slots__ 压缩内存。"""
+
+    __slots__ = ("source", "key", "content", "timestamp")
+
+    def __init__(self, source: str, key: str, content: str, timestamp):
+        self.source = source
+        self.key = key
+        self.content = content
+        self.timestamp = timestamp
+
+    def as_dict(self) -> Dict:
+        return {"source": self.source, "key": self.key,
+                "content": self.content, "timestamp": self.timestamp}
+
+
+class MemorySnapshot:
+    """
+    三大记忆体的内存快照，供检索器复用：
+    - 记录各记忆体的 version，refresh() 时版本未变化则直接返回，不执行任何 SQL
+    - 版本变化时优先回放订阅到的变更事件（增量），事件缺失或积压过多时才整层重新加载
+    - 通过 add_listener 把每条增量转发给依赖快照的索引（如 n-gram 倒排索引）
+    """
+
+    SOURCES = {
+        "episodic": "episodic_memory",
+        "semantic": "semantic_memory",
+        "mission": "mission_memory",
+    }
+
+    def __init__(self, em_store, sm_store, ms_store, max_pending: int = 10000):
+        """
+        :param max_pending: 每层最多缓存的未应用事件数，超过后改为整层重新加载
+        """
+        self.stores = {"episodic": em_store, "semantic": sm_store, "mission": ms_store}
+        self.max_pending = max_pending
+        self._records: Dict[str, Dict[str, MemoryRecord]] = {tier: {} for tier in self.stores}
+        self._versions: Dict[str, int] = {tier: -1 for tier in self.stores}
+        self._pending: Dict[str, Optional[List[MemoryEvent]]] = {tier: [] for tier in self.stores}
+        self._listeners: List[Callable[[str, Optional[str], Optional[MemoryRecord]], None]] = []
+        self._dicts: Optional[List[Dict]] = None
+        self._lock = threading.RLock()
+        for store in self.stores.values():
+            store.subscribe(self._on_event)
+
+    def add_listener(self, listener: Callable[[str, Optional[str], Optional[MemoryRecord]], None]):
+        """
+        注册增量回调 listener(tier, doc_key, record)：
+        record 为 None 表示删除；doc_key 也为 None 表示该层被整体清空。
+        """
+        self._listeners.append(listener)
+
+    def _on_event(self, ev: MemoryEvent):
+        with self._lock:
+            pending = self._pending.get(ev.tier)
+            if pending is None:
+                return  # 已积压溢出，等待整层重新加载
+            if len(pending) >= self.max_pending:
+                self._pending[ev.tier] = None
+            else:
+                pending.append(ev)
+
+    def _notify(self, tier: str, doc_key: Optional[str], record: Optional[MemoryRecord]):
+        for listener in self._listeners:
+            listener(tier, doc_key, record)
+
+    def refresh(self) -> bool:
+        """
+        与各记忆体的版本对齐。
+        :return: 快照内容是否发生变化
+        """
+        changed = False
+        with self._lock:
+            for tier, store in self.stores.items():
+                version = store.version
+                if version == self._versions[tier]:
+                    continue
+                pending = self._pending[tier]
+                expected = version - self._versions[tier]
+                if self._versions[tier] >= 0 and pending is not None and len(pending) == expected:
+                    for ev in pending:
+                        self._apply(tier, ev)
+                else:
+                    self._reload(tier)
+                self._pending[tier] = []
+                self._versions[tier] = version
+                changed = True
+            if changed:
+                self._dicts = None
+        return changed
+
+    def _apply(self, tier: str, ev: MemoryEvent):
+        records = self._records[tier]
+        if ev.op == "clear":
+            records.clear()
+            self._notify(tier, None, None)
+        elif ev.op == "delete":
+            if records.pop(ev.doc_key, None) is not None:
+                self._notify(tier, ev.doc_key, None)
+        else:
+            record = MemoryRecord(self.SOURCES[tier], ev.key, ev.content, ev.timestamp)
+            records[ev.doc_key] = record
+            self._notify(tier, ev.doc_key, record)
+
+    def _reload(self, tier: str):
+        """整层重新加载（首次加载、事件缺失或积压溢出时）。"""
+        source = self.SOURCES[tier]
+        records = {
+            doc_key: MemoryRecord(source, key, content, ts)
+            for doc_key, key, content, ts in self.stores[tier].get_all_entries()
+        }
+        self._records[tier] = records
+        self._notify(tier, None, None)
+        for doc_key, record in records.items():
+            self._notify(tier, doc_key, record)
+
+    def get(self, tier: str, doc_key: str) -> Optional[MemoryRecord]:
+        return self._records[tier].get(doc_key)
+
+    def records(self) -> List[MemoryRecord]:
+        """当前全部记录（调用前会先 refresh）。"""
+        self.refresh()
+        with self._lock:
+            return [r for tier in self.stores for r in self._records[tier].values()]
+
+    def as_dicts(self) -> List[Dict]:
+        """
+        当前全部记录的 dict 列表，与 get_all_records 拼出的格式一致。
+        同一版本下复用同一个列表，调用方不应修改它。
+        """
+        self.refresh()
+        with self._lock:
+            if self._dicts is None:
+                self._dicts = [r.as_dict() for tier in self.stores for r in self._records[tier].values()]
+            return self._dicts
+
+    @property
+    def version(self) -> tuple:
+        """快照当前对应的 (episodic, semantic, mission) 版本。"""
+        return tuple(self._versions[tier] for tier in self.stores)
@@ -0,0 +1,158 @@
+# memory/storage.py
+
+import os
+import sqlite3
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from memory.fts import build_match
+from memory.migrations import Migration, current_version, ensure_schema, migrate, to_epoch
+from memory.write_behind import ThreadConnections
+
+# 记忆层级 -> (表名, 行 id 列, 检索结果中的 source 名)
+TIERS: Dict[str, Tuple[str, str, str]] = {
+    "episodic": ("episodic_memory", "id", "episodic_memory"),
+    "semantic": ("semantic_memory", "rowid", "semantic_memory"),
+    "mission": ("mission_state", "rowid", "mission_memory"),
+}
+
+
+class StorageEngine:
+    """
+    三大记忆体共用的存储引擎：
+    - 所有层级的表放在同一个 SQLite 数据库中，可以用一条语句做跨层查询
+    - 连接池按线程分配（ThreadConnections）：每个线程（包括线程池中的任务线程）首次访问时建立自己的连接，
+      不再跨线程共享同一个连接；WAL 模式下多个读线程可与写线程并发；已退出线程的连接会被关闭
+    - 启动时为所有层级建表并应用迁移；import_legacy() 可通过 ATTACH 一次性导入旧的 em.db/sm.db/ms.db
+    EMStore / SMStore / MSStore 传入 engine= 即使用该引擎。
+    """
+
+    def __init__(self, db_path: str = "memory.db", journal_mode: str = "wal", synchronous: str = "normal",
+                 busy_timeout: float = 5.0):
+        """
+        :param busy_timeout: 等待其他连接释放写锁的秒数
+        """
+        self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self._pool = ThreadConnections(db_path, journal_mode, synchronous, timeout=busy_timeout,
+                                       name="StorageEngine")
+        conn = self.connection()
+        for tier, (table, rowid_col, _) in TIERS.items():
+            ensure_schema(conn, tier, table, rowid_col=rowid_col)
+
+    def connection(self) -> sqlite3.Connection:
+        """当前线程专用的连接，首次调用时建立。"""
+        return self._pool.get()
+
+    @property
+    def pool_size(self) -> int:
+        """当前打开的连接数（每个仍在运行、访问过引擎的线程一个）。"""
+        return len(self._pool)
+
+    def import_legacy(self, em_path: str = "em.db", sm_path: str = "sm.db", ms_path: str = "ms.db") -> Dict[str, int]:
+        """
+        把旧版按层级分文件的数据库 ATTACH 进来并复制到统一库，只在首次调用时执行一次
+        （记录为 schema_migrations 中的 storage_import v1）。时间戳在复制时统一为 Unix 秒，
+        EM 记录按原 id 顺序重新编号，SM/MS 中已存在的 key 不覆盖。
+        :return: {层级: 导入条数}
+        """
+        conn = self.connection()
+        counts: Dict[str, int] = {}
+        if current_version(conn, "storage_import") >= 1:
+            return counts
+        sources = {"episodic": em_path, "semantic": sm_path, "mission": ms_path}
+        target = os.path.abspath(self.db_path)
+        attached = {}
+        conn.commit()
+        for tier, path in sources.items():
+            if path and os.path.exists(path) and os.path.abspath(path) != target:
+                alias = f"legacy_{tier}"
+                conn.execute("ATTACH DATABASE ? AS " + alias, (path,))
+                attached[tier] = alias
+
+        def copy(c: sqlite3.Connection):
+            c.create_function("to_epoch", 1, to_epoch, deterministic=True)
+            for tier, alias in attached.items():
+                table = TIERS[tier][0]
+                exists = c.execute(f"SELECT 1 FROM {alias}.sqlite_master WHERE type = 'table' AND name = ?",
+                                   (table,)).fetchone()
+                if not exists:
+                    continue
+                order = "ORDER BY id" if tier == "episodic" else ""
+                verb = "INSERT" if tier == "episodic" else "INSERT OR IGNORE"
+                cur = c.execute(f"""
+                {verb} INTO main.{table}(key, content, timestamp)
+                SELECT key, content, to_epoch(timestamp) FROM {alias}.{table} {order}
+                """)
+                counts[tier] = cur.rowcount
+
+        try:
+            migrate(conn, "storage_import", [Migration(1, "导入分文件的旧版记忆库", copy)])
+        finally:
+            for alias in attached.values():
+                conn.execute("DETACH DATABASE " + alias)
+        if counts:
+            print(f"[StorageEngine] 已从旧版数据库导入：{counts}")
+        return counts
+
+    # —— 跨层查询（单条语句） ——
+    def _tier_tables(self, tiers: Optional[Sequence[str]]):
+        return [TIERS[t] for t in (tiers or TIERS)]
+
+    def recent(self, since=None, until=None, limit: int = 50,
+               tiers: Optional[Sequence[str]] = None) -> List[Tuple[str, str, str, int]]:
+        """
+        按时间倒序取各层级的记录，一条 UNION ALL 语句完成，各分支走 (timestamp) 索引。
+        :return: [(source, key, content, timestamp)]
+        """
+        parts, params = [], []
+        for table, _, source in self._tier_tables(tiers):
+            where = []
+            if since is not None:
+                where.append("timestamp >= ?")
+                params.append(to_epoch(since))
+            if until is not None:
+                where.append("timestamp <= ?")
+                params.append(to_epoch(until))
+            clause = (" WHERE " + " AND ".join(where)) if where else ""
+            parts.append(f"SELECT '{source}' AS source, key, content, timestamp FROM {table}{clause}")
+        sql = " UNION ALL ".join(parts) + " ORDER BY timestamp DESC LIMIT ?"
+        params.append(limit)
+        return self.connection().execute(sql, params).fetchall()
+
+    def search(self, query: str, limit: int = 10, since=None,
+               tiers: Optional[Sequence[str]] = None) -> List[Tuple[str, str, str, int, float]]:
+        """
+        在各层级的 FTS5 索引上做一次跨层全文检索（查询短于 3 个字符时返回空列表）。
+        不同虚表的 BM25 分数量级相近但不严格可比，精排仍由调用方完成。
+        :return: [(source, key, content, timestamp, score)]，按 score 降序
+        """
+        match = build_match(query)
+        if match is None:
+            return []
+        parts, params = [], []
+        for table, rowid_col, source in self._tier_tables(tiers):
+            fts = f"{table}_fts"
+            time_filter = ""
+            params.append(match)
+            if since is not None:
+                time_filter = "AND t.timestamp >= ?"
+                params.append(to_epoch(since))
+            parts.append(f"""
+            SELECT '{source}' AS source, t.key, t.content, t.timestamp, -bm25({fts}) AS score
+            FROM {fts} JOIN {table} AS t ON t.{rowid_col} = {fts}.rowid
+            WHERE {fts} MATCH ? {time_filter}
+            """)
+        sql = " UNION ALL ".join(parts) + " ORDER BY score DESC LIMIT ?"
+        params.append(limit)
+        return self.connection().execute(sql, params).fetchall()
+
+    def counts(self) -> Dict[str, int]:
+        """各层级记录数。"""
+        sql = " UNION ALL ".join(f"SELECT '{tier}', COUNT(*) FROM {table}" for tier, (table, _, _) in TIERS.items())
+        return dict(self.connection().execute(sql).fetchall())
+
+    def close(self):
+        """关闭所有线程的连接（之后不能再使用该引擎）。"""
+        self._pool.close()
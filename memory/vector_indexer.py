@@ -1,52 +1,221 @@
 # memory/vector_indexer.py
 
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
 from memory.em_store import EMStore
 from memory.sm_store import SMStore
 from memory.ms_store import MSStore
 from memory.vector_store import VectorStore
+from memory.embedding_cache import EmbeddingCache
+from memory.events import MemoryEvent
 
 class MemoryVectorIndexer:
     """
-    将三大记忆体的所有文本一次性向量化并构建索引，
-    并提供 query(text) 接口做检索。
+    维护三大记忆体的向量索引，并提供 query(text) 接口做检索。
+    - 启动时 build_indexes() 与数据库对账：只嵌入新增/变化的记录，删除已不存在的记录
+    - 运行期间订阅各记忆体的变更事件，由后台线程批量嵌入并增量更新索引，
+      写入路径只做入队，会话中新写入的记忆无需重启即可被检索到
+    - 每个层级在 index_dir 下有独立的索引和元数据文件，close() 时及运行中每隔
+      autosave_interval 秒原子保存；下次启动以内存映射方式打开，对账时只处理差异
     """
 
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        self.em_store = EMStore()
-        self.sm_store = SMStore()
-        self.ms_store = MSStore()
+    def __init__(self, model_name="all-MiniLM-L6-v2", cache: EmbeddingCache = None,
+                 em_store: EMStore = None, sm_store: SMStore = None, ms_store: MSStore = None,
+                 batch_size: int = 64, flush_interval: float = 0.2,
+                 index_dir: str = "vector_index", autosave_interval: float = 60.0,
+                 index_type: str = "flat", index_params: Dict = None):
+        """
+        :param em_store/sm_store/ms_store: 要索引的记忆体，应与写入方使用同一实例，才能收到变更事件
+        :param batch_size: 后台线程每批最多处理的事件数
+        :param flush_interval: 后台线程凑批的最长等待秒数
+        :param index_dir: 各层级索引文件所在目录
+        :param autosave_interval: 运行中自动保存的最短间隔（秒），<= 0 表示只在 close() 时保存
+        :param index_type/index_params: 各层级使用的 ANN 索引类型及参数，见 memory/ann_index.py
+        """
+        self.em_store = em_store or EMStore()
+        self.sm_store = sm_store or SMStore()
+        self.ms_store = ms_store or MSStore()
+
+        # 三个向量库共用同一个持久化嵌入缓存，未变化的文本重启后不再重新嵌入
+        self.cache = cache or EmbeddingCache.default()
+        self.index_dir = index_dir
+        self.index_type = index_type
+        self.index_params = index_params
+        os.makedirs(index_dir, exist_ok=True)
+        self.vs_em = self._open_tier("episodic", model_name)
+        self.vs_sm = self._open_tier("semantic", model_name)
+        self.vs_ms = self._open_tier("mission", model_name)
 
-        self.vs_em = VectorStore(model_name=model_name)
-        self.vs_sm = VectorStore(model_name=model_name)
-        self.vs_ms = VectorStore(model_name=model_name)
+        self.tiers = {
+            "episodic": (self.em_store, self.vs_em),
+            "semantic": (self.sm_store, self.vs_sm),
+            "mission": (self.ms_store, self.vs_ms),
+        }
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.autosave_interval = autosave_interval
+        self._last_save = time.monotonic()
+        # VectorStore 本身不是线程安全的，后台写入与前台查询通过这把锁串行
+        self._lock = threading.RLock()
+        self._events: "queue.Queue[MemoryEvent]" = queue.Queue()
+        for store, _ in self.tiers.values():
+            store.subscribe(self._events.put)
+        self._worker = threading.Thread(target=self._run, name="vector-indexer", daemon=True)
+        self._worker.start()
+
+    def _open_tier(self, tier: str, model_name: str) -> VectorStore:
+        return VectorStore(
+            model_name=model_name,
+            index_path=os.path.join(self.index_dir, f"{tier}.faiss"),
+            meta_path=os.path.join(self.index_dir, f"{tier}.meta.pkl"),
+            cache=self.cache,
+            index_type=self.index_type,
+            index_params=self.index_params
+        )
 
     def build_indexes(self):
-        texts = self.em_store.get_all_texts()
-        if texts:
-            self.vs_em.add_texts(texts)
+        """与数据库全量对账：新增/变化的记录做嵌入（命中缓存的不再请求），已删除的记录移出索引。"""
+        for tier, (store, vs) in self.tiers.items():
+            entries = store.get_all_entries()
+            items = [(doc_key, content) for doc_key, _, content, _ in entries]
+            with self._lock:
+                changed = [content for doc_key, content in items if vs.get_text(doc_key) != content]
+            self._prefetch(vs, changed)
+            with self._lock:
+                live = {doc_key for doc_key, _ in items}
+                for stale in [k for k in vs.keys if k not in live]:
+                    vs.remove(stale)
+                if items:
+                    vs.upsert_batch(items)
 
-        texts = self.sm_store.get_all_texts()
-        if texts:
-            self.vs_sm.add_texts(texts)
+        stats = self.cache.stats()
+        print(f"[MemoryVectorIndexer] 嵌入缓存：命中 {stats['hits']}，未命中 {stats['misses']}，"
+              f"命中率 {stats['hit_rate']:.1%}，条目 {stats['entries']}")
 
-        texts = self.ms_store.get_all_texts()
+    def _prefetch(self, vs: VectorStore, texts: List[str]):
+        """在锁外先把文本嵌入写进缓存，之后持锁 upsert 时全部命中缓存，不阻塞查询。"""
         if texts:
-            self.vs_ms.add_texts(texts)
+            vs._embed_batch(texts)
+
+    def _run(self):
+        """后台线程：凑批消费变更事件并应用到向量索引。"""
+        while True:
+            event = self._events.get()
+            if event is None:
+                self._events.task_done()
+                return
+            batch = [event]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._events.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+                if event is None:
+                    stop = True
+                    break
+                batch.append(event)
+            try:
+                self._apply(batch)
+            except Exception as err:
+                print(f"[MemoryVectorIndexer] 增量索引失败：{err}")
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._events.task_done()
+            if stop:
+                return
+            if 0 < self.autosave_interval <= time.monotonic() - self._last_save:
+                self.save()
+
+    def _apply(self, events: List[MemoryEvent]):
+        """按层级合并一批事件（同一 doc_key 只保留最后一次操作）后写入索引。"""
+        plans: Dict[str, Dict] = {}
+        for ev in events:
+            plan = plans.setdefault(ev.tier, {"clear": False, "ops": {}})
+            if ev.op == "clear":
+                plan["clear"] = True
+                plan["ops"] = {}
+            elif ev.op == "delete":
+                plan["ops"][ev.doc_key] = None
+            else:
+                plan["ops"][ev.doc_key] = ev.content
 
-    def query(self, text: str, top_k: int = 5):
+        for tier, plan in plans.items():
+            if tier not in self.tiers:
+                continue
+            vs = self.tiers[tier][1]
+            upserts = [(k, text) for k, text in plan["ops"].items() if text is not None]
+            self._prefetch(vs, [text for _, text in upserts])
+            with self._lock:
+                if plan["clear"]:
+                    vs.clear()
+                for k, text in plan["ops"].items():
+                    if text is None:
+                        vs.remove(k)
+                if upserts:
+                    vs.upsert_batch(upserts)
+
+    def flush(self):
+        """阻塞直到已发布的变更全部写入索引。"""
+        self._events.join()
+
+    def save(self):
+        """原子保存各层级索引（未变化的层级跳过）。"""
+        with self._lock:
+            for tier, (_, vs) in self.tiers.items():
+                try:
+                    vs.save()
+                except Exception as err:
+                    print(f"[MemoryVectorIndexer] 保存 {tier} 索引失败：{err}")
+        self._last_save = time.monotonic()
+
+    def close(self):
+        """停止后台线程（先处理完已入队的事件）、取消订阅并保存索引。"""
+        for store, _ in self.tiers.values():
+            store.unsubscribe(self._events.put)
+        if self._worker.is_alive():
+            self._events.put(None)
+            self._worker.join()
+        self.save()
+
+    def query(self, text: str, top_k: int = 5, tiers: Optional[List[str]] = None,
+              top_k_per_tier: Optional[int] = None):
+        """
+        查询文本只嵌入一次，用同一个向量检索各层级，合并后按相似度取 Top-K。
+        :param tiers: 只检索这些层级（"episodic" / "semantic" / "mission"），默认全部
+        :param top_k_per_tier: 每个层级最多返回的条数，默认等于 top_k
+        """
+        selected = [t for t in (tiers or self.tiers) if t in self.tiers]
+        stores = [(source, self.tiers[source][1]) for source in selected]
+        if not any(len(vs) for _, vs in stores):
+            return []
+        # 各层级使用同一嵌入模型，编码在锁外进行，不阻塞后台索引写入
+        q_vec = self.vs_em.embed_query(text)
+
+        per_tier = top_k_per_tier or top_k
         all_hits = []
-        for source, vs in [
-            ("episodic", self.vs_em),
-            ("semantic", self.vs_sm),
-            ("mission", self.vs_ms)
-        ]:
-            hits = vs.query(text, top_k)
+        with self._lock:
+            tier_hits = [(source, vs.search_vector(q_vec, per_tier)) for source, vs in stores]
+        for source, hits in tier_hits:
             for h in hits:
                 all_hits.append({
                     "source": source,
                     "key": h.get("key", None),
                     "content": h.get("text", h.get("content")),
+                    "timestamp": "",
                     "score": h["score"]
                 })
         all_hits.sort(key=lambda x: x["score"], reverse=True)
-        return all_hits[:top_k]
+        all_hits = all_hits[:top_k]
+
+        # EM 的向量 key 是行 id，回表取出记忆体里的 key 和时间戳
+        em_ids = [int(h["key"]) for h in all_hits if h["source"] == "episodic" and h["key"].isdigit()]
+        rows = self.em_store.get_by_ids(em_ids)
+        for h in all_hits:
+            if h["source"] == "episodic" and h["key"].isdigit() and int(h["key"]) in rows:
+                h["key"], _, h["timestamp"] = rows[int(h["key"])]
+        return all_hits
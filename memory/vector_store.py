@@ -1,10 +1,15 @@
 import os
+import time
 import faiss
 import numpy as np
 import pickle
-import requests
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple, Optional, Dict
-import hashlib
+from memory.embedding_cache import EmbeddingCache, content_hash
+from memory import ann_index
+from utils.tracing import get_tracer
+from utils.transport import HttpTransport, get_default_transport
 
 
 class VectorStore:
@@ -13,6 +18,18 @@ class VectorStore:
     - 使用 Ollama 本地模型将文本编码成向量
     - 用 FAISS 做快速近似最近邻检索
     - 支持持久化索引和元数据
+    - 批量嵌入：多条文本合并为一次 /api/embed 请求，按 batch_size 分块，
+      由最多 max_workers 个线程并发发送；服务端不支持多输入时退回逐条请求；
+      每批的吞吐记录在 last_embed_stats 与追踪 span "embed" 中，verbose=True 时才打印
+    - HTTP 请求经共享的 HttpTransport（utils/transport.py）发送：长连接复用、超时与有限重试
+    - 嵌入结果经 EmbeddingCache 按 (模型, 维度, 内容哈希) 缓存，未变化的文本不再请求 Ollama
+    - 以 key 为主键：key -> FAISS id 的哈希索引 + IndexIDMap2，成员判断、删除、替换均为 O(1)；
+      删除只打墓碑，墓碑累计超过 compact_ratio 比例时批量从索引中清除
+    - save() 原子写入：索引写到带版本号的新文件，元数据经临时文件 os.replace 一次性切换；
+      加载时用 FAISS 内存映射只读打开（mmap=True），首次修改前才复制到内存
+    - 索引类型可配置（index_type: flat / hnsw / ivf_flat / ivf_pq，见 memory/ann_index.py）；
+      需要训练的类型在向量数达到训练门槛前先用 flat，达到后自动训练并迁移，
+      数据量增长到上次训练的 retrain_factor 倍时重新训练
     """
 
     def __init__(
@@ -22,25 +39,84 @@ class VectorStore:
         index_path: str = "vs_index.faiss",
         meta_path: str = "vs_meta.pkl",
         batch_size: int = 64,
-        host: str = "http://localhost:11434"
+        host: str = "http://localhost:11434",
+        max_workers: int = 4,
+        cache: Optional[EmbeddingCache] = None,
+        use_cache: bool = True,
+        compact_ratio: float = 0.2,
+        mmap: bool = True,
+        index_type: str = "flat",
+        index_params: Optional[Dict] = None,
+        retrain_factor: float = 4.0,
+        transport: Optional[HttpTransport] = None,
+        verbose: bool = False
     ):
         self.model_name = model_name
         self.dim = dim
         self.index_path = index_path
         self.meta_path = meta_path
         self.batch_size = batch_size
+        self.max_workers = max(1, max_workers)
         self.ollama_url = f"{host}/api/embeddings"
+        self.ollama_batch_url = f"{host}/api/embed"
+        # 与 Llama3Client 共用长连接池，避免每次嵌入都重新建立 TCP 连接
+        self.transport = transport or get_default_transport()
+        # None 表示尚未探测服务端是否支持多输入请求
+        self._batch_supported: Optional[bool] = None
+        self.last_embed_stats: Dict[str, float] = {}
+        # 后台索引线程的增量写入与流式回复共用 stdout，默认不打印每批的嵌入吞吐
+        self.verbose = verbose
+        # 默认与同进程内其他 VectorStore 共用一个持久化缓存
+        self.cache = (cache or EmbeddingCache.default()) if use_cache else None
 
-        if os.path.exists(index_path) and os.path.exists(meta_path):
+        self.compact_ratio = compact_ratio
+        self.mmap = mmap
+        if index_type not in ann_index.INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型：{index_type}，可选 {ann_index.INDEX_TYPES}")
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.retrain_factor = retrain_factor
+        self._index_file: Optional[str] = None  # 当前元数据指向的索引文件
+
+        if os.path.exists(meta_path):
             self._load()
         else:
-            self.index = faiss.IndexFlatIP(dim)
-            self.keys: List[str] = []
-            self.texts: List[str] = []
+            self._reset()
 
-    def _embed(self, text: str) -> np.ndarray:
-        """调用 Ollama 接口获取单个文本的嵌入"""
-        response = requests.post(self.ollama_url, json={
+    def _reset(self):
+        """初始化空索引和元数据。"""
+        self._key_to_id: Dict[str, int] = {}           # key -> FAISS id
+        self._docs: Dict[int, Tuple[str, str]] = {}    # FAISS id -> (key, text)
+        self._tombstones: set = set()                  # 已删除但尚未从索引清除的 id
+        self._next_id = 0
+        self._active_type = self._target_type()         # 当前实际使用的索引类型
+        self._trained_size = 0                          # 上次训练时的向量数
+        self.index = ann_index.create_index(self._active_type, self.dim, self.index_params)
+        self._mmapped = False
+        self._dirty = True
+
+    @property
+    def keys(self) -> List[str]:
+        return list(self._key_to_id)
+
+    @property
+    def texts(self) -> List[str]:
+        return [text for _, text in self._docs.values()]
+
+    def __len__(self) -> int:
+        return len(self._key_to_id)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._key_to_id
+
+    def get_text(self, key: str) -> Optional[str]:
+        """返回 key 当前对应的文本，不存在时返回 None。"""
+        faiss_id = self._key_to_id.get(key)
+        return self._docs[faiss_id][1] if faiss_id is not None else None
+
+    def _embed_single(self, text: str) -> np.ndarray:
+        """调用 Ollama 旧接口 /api/embeddings 获取单个文本的嵌入"""
+        response = self.transport.post_json(self.ollama_url, {
             "model": self.model_name,
             "prompt": text
         })
@@ -48,73 +124,379 @@ class VectorStore:
         embedding = response.json()["embedding"]
         return np.array(embedding, dtype=np.float32).reshape(1, -1)
 
+    def _embed_multi(self, texts: List[str]) -> Optional[np.ndarray]:
+        """
+        调用 Ollama /api/embed 一次性嵌入多条文本。
+        服务端不支持多输入请求时返回 None，由调用方退回逐条请求。
+        """
+        if self._batch_supported is False:
+            return None
+        response = self.transport.post_json(self.ollama_batch_url, {
+            "model": self.model_name,
+            "input": texts
+        })
+        if response.status in (400, 404, 405, 501):
+            self._batch_supported = False
+            return None
+        response.raise_for_status()
+        embeddings = response.json().get("embeddings")
+        if not embeddings or len(embeddings) != len(texts):
+            self._batch_supported = False
+            return None
+        self._batch_supported = True
+        return np.array(embeddings, dtype=np.float32)
+
+    def _embed_chunk(self, texts: List[str]) -> np.ndarray:
+        """嵌入一个分块：优先多输入请求，失败时逐条请求；结果统一做 L2 归一化"""
+        vecs = self._embed_multi(texts)
+        if vecs is None:
+            vecs = np.vstack([self._embed_single(text) for text in texts])
+        # /api/embed 返回归一化向量而 /api/embeddings 不归一化，这里统一，保证内积即余弦相似度
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        faiss.normalize_L2(vecs)
+        return vecs
+
+    def _embed(self, text: str) -> np.ndarray:
+        """获取单个文本的嵌入"""
+        return self._embed_batch([text])
+
+    def _embed_uncached(self, texts: List[str]) -> Tuple[np.ndarray, int]:
+        """
+        按 batch_size 分块，用有界线程池并发请求，结果按输入顺序拼接。
+        :return: (向量矩阵, 实际发出的请求数)
+        """
+        chunks = [texts[i: i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(chunks) == 1:
+            results = [self._embed_chunk(chunks[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+                results = list(pool.map(self._embed_chunk, chunks))
+        return np.vstack(results), (len(chunks) if self._batch_supported else len(texts))
+
     def _embed_batch(self, texts: List[str]) -> np.ndarray:
-        """批量嵌入多个文本（按顺序逐条请求 Ollama）"""
-        vectors = [self._embed(text) for text in texts]
-        return np.vstack(vectors)
+        """
+        批量嵌入多个文本：先查 EmbeddingCache，只把未命中的（去重后的）文本发给 Ollama，
+        并记录吞吐（条/秒）到 last_embed_stats。
+        """
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        with get_tracer().span("embed", texts=len(texts)) as span:
+            vecs = self._embed_batch_cached(texts)
+            stats = self.last_embed_stats
+            span.set(cache_hits=stats["cache_hits"], requests=stats["requests"])
+        return vecs
+
+    def _embed_batch_cached(self, texts: List[str]) -> np.ndarray:
+        """_embed_batch 的实现：查缓存、只请求未命中的文本，并记录 last_embed_stats。"""
+        start = time.perf_counter()
+        vecs = np.zeros((len(texts), self.dim), dtype=np.float32)
+        hashes = [content_hash(text) for text in texts]
+        cached = self.cache.get_many(self.model_name, self.dim, hashes) if self.cache else {}
+
+        # 未命中的文本按哈希去重，同一内容只请求一次
+        missing: Dict[str, str] = {}
+        for h, text in zip(hashes, texts):
+            if h not in cached:
+                missing.setdefault(h, text)
+
+        requests_sent = 0
+        if missing:
+            fresh, requests_sent = self._embed_uncached(list(missing.values()))
+            fresh_map = dict(zip(missing.keys(), fresh))
+            if self.cache:
+                self.cache.put_many(self.model_name, self.dim, fresh_map)
+            cached = {**cached, **fresh_map}
+        for i, h in enumerate(hashes):
+            vecs[i] = cached[h]
+
+        elapsed = time.perf_counter() - start
+        self.last_embed_stats = {
+            "texts": len(texts),
+            "cache_hits": len(texts) - sum(1 for h in hashes if h in missing),
+            "requests": requests_sent,
+            "seconds": elapsed,
+            "texts_per_sec": len(texts) / elapsed if elapsed > 0 else float("inf"),
+        }
+        return vecs
+
+    def _ensure_writable(self):
+        """内存映射的索引是只读视图，修改前先完整复制到内存。"""
+        if self._mmapped:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            ann_index.apply_search_params(self.index, self._active_type, self.index_params)
+            self._mmapped = False
+
+    def _insert(self, items: List[Tuple[str, str]]):
+        """嵌入并写入一批 key 均不在库中的条目。"""
+        vecs = self._embed_batch([t for _, t in items])
+        self._ensure_writable()
+        self._dirty = True
+        if self.verbose and len(items) > 1:
+            stats = self.last_embed_stats
+            print(f"[VectorStore] 嵌入 {stats['texts']} 条文本（缓存命中 {stats['cache_hits']}），"
+                  f"用时 {stats['seconds']:.2f}s，吞吐 {stats['texts_per_sec']:.1f} 条/秒")
+
+        ids = np.arange(self._next_id, self._next_id + len(items), dtype=np.int64)
+        self._next_id += len(items)
+        self.index.add_with_ids(vecs, ids)
+        for faiss_id, (k, t) in zip(ids.tolist(), items):
+            self._key_to_id[k] = faiss_id
+            self._docs[faiss_id] = (k, t)
+        self._maybe_migrate()
 
     def add(self, key: str, text: str):
-        if key in self.keys:
+        if key in self._key_to_id:
             return
-        vec = self._embed(text)
-        self.index.add(vec)
-        self.keys.append(key)
-        self.texts.append(text)
+        self._insert([(key, text)])
 
     def add_batch(self, items: List[Tuple[str, str]]):
-        new_items = [(k, t) for k, t in items if k not in self.keys]
-        if not new_items:
+        """批量添加，已存在的 key 跳过（同一批内重复的 key 只保留第一条）。"""
+        new_items: Dict[str, str] = {}
+        for k, t in items:
+            if k not in self._key_to_id and k not in new_items:
+                new_items[k] = t
+        if new_items:
+            self._insert(list(new_items.items()))
+
+    def upsert(self, key: str, text: str):
+        """添加或替换 key 对应的文本；内容未变化时不做任何事。"""
+        self.upsert_batch([(key, text)])
+
+    def upsert_batch(self, items: List[Tuple[str, str]]):
+        """批量添加或替换（同一批内重复的 key 以最后一条为准）。"""
+        latest: Dict[str, str] = {}
+        for k, t in items:
+            latest[k] = t
+        changed = []
+        for k, t in latest.items():
+            faiss_id = self._key_to_id.get(k)
+            if faiss_id is not None:
+                if self._docs[faiss_id][1] == t:
+                    continue
+                self._tombstone(k)
+            changed.append((k, t))
+        if changed:
+            self._insert(changed)
+        self._maybe_compact()
+
+    def remove(self, key: str) -> bool:
+        """
+        删除 key 对应的向量（打墓碑，查询时不再返回）。
+        :return: key 是否存在
+        """
+        if key not in self._key_to_id:
+            return False
+        self._tombstone(key)
+        self._maybe_compact()
+        return True
+
+    def _tombstone(self, key: str):
+        faiss_id = self._key_to_id.pop(key)
+        del self._docs[faiss_id]
+        self._tombstones.add(faiss_id)
+        self._dirty = True
+
+    def _maybe_compact(self):
+        """墓碑比例超过 compact_ratio 时清除，保证删除的均摊代价为 O(1)。"""
+        if len(self._tombstones) > max(64, self.compact_ratio * self.index.ntotal):
+            self.compact()
+
+    def compact(self):
+        """把墓碑 id 从 FAISS 索引中真正删除（HNSW 不支持删除，改为重建）。"""
+        if not self._tombstones:
             return
+        if not ann_index.supports_remove(self._active_type):
+            self.rebuild(self._active_type)
+            return
+        ids = np.fromiter(self._tombstones, dtype=np.int64, count=len(self._tombstones))
+        self._ensure_writable()
+        self.index.remove_ids(ids)
+        self._tombstones.clear()
 
-        all_texts = [t for _, t in new_items]
-        embeddings = []
-        for i in range(0, len(all_texts), self.batch_size):
-            batch = all_texts[i: i + self.batch_size]
-            emb = self._embed_batch(batch)
-            embeddings.append(emb)
-        vecs = np.vstack(embeddings)
+    def _target_type(self) -> str:
+        """需要训练的索引类型在向量数达到门槛前先用 flat。"""
+        if ann_index.needs_training(self.index_type) and \
+                len(self._docs) < ann_index.min_train_size(self.index_type, self.index_params):
+            return "flat"
+        return self.index_type
 
-        self.index.add(vecs)
-        for k, t in new_items:
-            self.keys.append(k)
-            self.texts.append(t)
+    def _maybe_migrate(self):
+        if self._active_type == self.index_type:
+            # 已训练的索引即使删除后低于门槛也不退回 flat，只在数据量大幅增长时重新训练
+            if ann_index.needs_training(self.index_type) and \
+                    len(self._docs) > self.retrain_factor * self._trained_size:
+                self.rebuild(self.index_type)
+        elif self._target_type() != self._active_type:
+            self.rebuild(self._target_type())
 
-    def query(self, q: str, top_k: int = 5) -> List[Dict]:
-        q_vec = self._embed(q)
-        scores, ids = self.index.search(q_vec, top_k)
+    def rebuild(self, index_type: Optional[str] = None):
+        """
+        用当前全部有效向量重建索引（必要时先训练），用于切换索引类型、重新训练和 HNSW 清除墓碑。
+        向量从 EmbeddingCache 取回，缓存未命中时才重新请求 Ollama。
+        """
+        index_type = index_type or self._target_type()
+        start = time.perf_counter()
+        live = sorted(self._docs.items())
+        ids = np.array([faiss_id for faiss_id, _ in live], dtype=np.int64)
+        vecs = self._embed_batch([text for _, (_, text) in live])
+
+        train = vecs if ann_index.needs_training(index_type) else None
+        index = ann_index.create_index(index_type, self.dim, self.index_params, train_vectors=train)
+        if len(ids):
+            index.add_with_ids(vecs, ids)
+
+        self.index = index
+        self._active_type = index_type
+        self._trained_size = len(ids) if train is not None else 0
+        self._tombstones.clear()
+        self._mmapped = False
+        self._dirty = True
+        print(f"[VectorStore] 索引重建为 {index_type}（{len(ids)} 条向量），"
+              f"用时 {time.perf_counter() - start:.2f}s")
+
+    def embed_query(self, q: str) -> np.ndarray:
+        """
+        把查询文本编码成 shape=(1, dim) 的向量，可复用于多个同模型的向量库。
+        查询不经过 EmbeddingCache：一次性的查询向量不值得在检索路径上落盘提交，也不应挤掉文档向量。
+        """
+        return self._embed_uncached([q])[0]
+
+    def search_vector(self, q_vec: np.ndarray, top_k: int = 5) -> List[Dict]:
+        """用已编码的查询向量检索 Top-K。"""
+        if not self._docs:
+            return []
+        # 多取墓碑个数条，过滤掉已删除的向量后仍能凑满 top_k
+        k = min(top_k + len(self._tombstones), self.index.ntotal)
+        scores, ids = self.index.search(np.asarray(q_vec, dtype=np.float32).reshape(1, -1), k)
         results = []
-        for score, idx in zip(scores[0], ids[0]):
-            if idx < len(self.keys):
-                results.append({
-                    "key": self.keys[idx],
-                    "text": self.texts[idx],
-                    "score": float(score)
-                })
+        for score, faiss_id in zip(scores[0], ids[0]):
+            doc = self._docs.get(int(faiss_id))
+            if doc is None:
+                continue
+            results.append({
+                "key": doc[0],
+                "text": doc[1],
+                "score": float(score)
+            })
+            if len(results) >= top_k:
+                break
         return results
 
+    def query(self, q: str, top_k: int = 5) -> List[Dict]:
+        if not self._docs:
+            return []
+        return self.search_vector(self.embed_query(q), top_k)
+
     def save(self):
-        faiss.write_index(self.index, self.index_path)
-        with open(self.meta_path, "wb") as f:
+        """
+        原子持久化：先把索引写到新的版本文件，再用 os.replace 切换元数据，
+        任何时刻崩溃都不会出现索引与元数据不一致。内容未变化时跳过。
+        """
+        if not self._dirty and self._index_file:
+            return
+        self.compact()
+        directory = os.path.dirname(os.path.abspath(self.meta_path))
+        os.makedirs(directory, exist_ok=True)
+
+        index_file = f"{os.path.basename(self.index_path)}.{uuid.uuid4().hex[:12]}"
+        faiss.write_index(self.index, os.path.join(directory, index_file))
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "wb") as f:
             pickle.dump({
-                "keys": self.keys,
-                "texts": self.texts
+                "index_file": index_file,
+                "model_name": self.model_name,
+                "dim": self.dim,
+                "index_type": self._active_type,
+                "trained_size": self._trained_size,
+                "docs": self._docs,
+                "next_id": self._next_id
             }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+        old_file = self._index_file
+        self._index_file = index_file
+        self._dirty = False
+        if old_file and old_file != index_file:
+            self._remove_file(os.path.join(directory, old_file))
+        elif old_file is None:
+            # 旧版本直接写在 index_path 的索引文件已被版本文件取代
+            self._remove_file(self.index_path)
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            # Windows 下仍被内存映射的旧文件无法删除，留待下次保存
+            pass
+
+    def _read_index(self, path: str):
+        """优先以内存映射只读方式打开，打开大索引只需毫秒级且多进程共享页缓存。"""
+        if self.mmap and hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            try:
+                index = faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+                self._mmapped = True
+                return index
+            except RuntimeError:
+                pass
+        self._mmapped = False
+        return faiss.read_index(path)
 
     def _load(self):
-        self.index = faiss.read_index(self.index_path)
+        self._reset()
         with open(self.meta_path, "rb") as f:
             meta = pickle.load(f)
-        self.keys = meta["keys"]
-        self.texts = meta["texts"]
+        if meta.get("model_name", self.model_name) != self.model_name or meta.get("dim", self.dim) != self.dim:
+            print(f"[VectorStore] {self.meta_path} 的模型或维度与当前配置不一致，忽略已保存的索引")
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.meta_path))
+        index_file = meta.get("index_file")
+        index_path = os.path.join(directory, index_file) if index_file else self.index_path
+        if not os.path.exists(index_path):
+            print(f"[VectorStore] 索引文件 {index_path} 不存在，忽略已保存的元数据")
+            return
+        index = self._read_index(index_path)
+
+        if "docs" in meta:
+            self.index = index
+            self._docs = meta["docs"]
+            self._next_id = meta["next_id"]
+            self._key_to_id = {k: faiss_id for faiss_id, (k, _) in self._docs.items()}
+            self._index_file = index_file
+            self._dirty = index_file is None
+            self._active_type = meta.get("index_type", "flat")
+            self._trained_size = meta.get("trained_size", 0)
+            ann_index.apply_search_params(self.index, self._active_type, self.index_params)
+            # 配置的索引类型与已保存的不同时，迁移到新类型
+            try:
+                self._maybe_migrate()
+            except Exception as err:
+                print(f"[VectorStore] 索引迁移失败，继续使用 {self._active_type}：{err}")
+            return
+
+        # 旧格式：IndexFlatIP 按位置对应 keys/texts，迁移为 id 映射索引
+        if index.ntotal:
+            vecs = index.reconstruct_n(0, index.ntotal)
+            self.index.add_with_ids(vecs, np.arange(index.ntotal, dtype=np.int64))
+        self._mmapped = False
+        for faiss_id, (k, t) in enumerate(zip(meta["keys"], meta["texts"])):
+            self._key_to_id[k] = faiss_id
+            self._docs[faiss_id] = (k, t)
+        self._next_id = len(meta["keys"])
+        self._maybe_migrate()
 
     def clear(self):
-        self.index = faiss.IndexFlatIP(self.dim)
-        self.keys = []
-        self.texts = []
-        if os.path.exists(self.index_path):
-            os.remove(self.index_path)
-        if os.path.exists(self.meta_path):
-            os.remove(self.meta_path)
+        self._reset()
+        directory = os.path.dirname(os.path.abspath(self.meta_path))
+        if self._index_file:
+            self._remove_file(os.path.join(directory, self._index_file))
+            self._index_file = None
+        self._remove_file(self.index_path)
+        self._remove_file(self.meta_path)
 
     # === 新增方法 ===
     def add_texts(self, texts: List[str]):
@@ -124,7 +506,7 @@ class VectorStore:
         items = []
         for text in texts:
             # 使用文本内容的哈希作为key
-            key = hashlib.md5(text.encode()).hexdigest()
+            key = content_hash(text)
             items.append((key, text))
         
         # 使用现有的批量添加方法
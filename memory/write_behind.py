@@ -0,0 +1,312 @@
+# memory/write_behind.py
+
+import atexit
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from utils import tracing
+
+JOURNAL_MODES = ("delete", "truncate", "persist", "memory", "wal", "off")
+SYNCHRONOUS_LEVELS = ("off", "normal", "full", "extra")
+
+
+def configure_connection(conn: sqlite3.Connection, journal_mode: str = "wal", synchronous: str = "normal"):
+    """
+    设置日志模式与同步级别。
+    WAL 下 synchronous=normal 只在检查点时 fsync，单次提交不再等待磁盘，掉电最多丢失最近几次提交。
+    """
+    journal_mode, synchronous = journal_mode.lower(), synchronous.lower()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f"不支持的 journal_mode：{journal_mode}，可选 {JOURNAL_MODES}")
+    if synchronous not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f"不支持的 synchronous：{synchronous}，可选 {SYNCHRONOUS_LEVELS}")
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+
+
+class ThreadConnections:
+    """
+    按线程分配的 SQLite 连接：每个线程首次访问时打开并配置自己的连接，连接不跨线程共享；
+    WAL 模式下各线程的读可与写并发。
+    新线程建立连接时顺带关闭已退出线程留下的连接，线程池反复换线程也不会累积文件句柄；
+    close() 统一关闭所有线程的连接。
+    """
+
+    def __init__(self, db_path: str, journal_mode: str = "wal", synchronous: str = "normal",
+                 timeout: float = 5.0, name: str = "ThreadConnections"):
+        """
+        :param timeout: 等待其他连接释放写锁的秒数
+        """
+        self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.timeout = timeout
+        self.name = name
+        self._local = threading.local()
+        self._connections: List[Tuple[threading.Thread, sqlite3.Connection]] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.reaped = 0
+
+    def get(self) -> sqlite3.Connection:
+        """当前线程专用的连接，首次调用时建立。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self._closed:
+                raise RuntimeError(f"[{self.name}] 连接池已关闭")
+            # 连接只由创建它的线程使用；关闭 check_same_thread 仅为了能在其他线程关闭它
+            conn = tracing.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+            configure_connection(conn, self.journal_mode, self.synchronous)
+            self._local.conn = conn
+            with self._lock:
+                dead = [c for thread, c in self._connections if not thread.is_alive()]
+                self._connections = [(t, c) for t, c in self._connections if t.is_alive()]
+                self._connections.append((threading.current_thread(), conn))
+                self.reaped += len(dead)
+            for c in dead:
+                c.close()
+        return conn
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._connections)
+
+    def close(self):
+        """关闭所有线程的连接（之后不能再使用）。"""
+        with self._lock:
+            self._closed = True
+            conns, self._connections = self._connections, []
+        for _, conn in conns:
+            conn.close()
+
+
+class WriteBehindQueue:
+    """
+    进程内的写后缓冲队列（group commit）：
+    - submit() 只把 (sql, 参数, 回调) 放入内存缓冲区，立即返回
+    - 后台线程在缓冲达到 max_batch 条或最早一条等待超过 flush_interval 秒时，
+      用独立的写连接在一个事务里批量写入，连续相同的 SQL 合并为一次 executemany
+    - 事务提交后按提交顺序执行回调（用于发布变更事件），因此订阅者看到的总是已落库的数据；
+      需要行 id 的写入（with_rowid=True）逐条执行，回调收到 SQLite 分配的 lastrowid
+    - 批次失败时回滚并逐条重试，仍失败的写入被丢弃并计入 stats["dropped"]，错误保存在 last_error
+    - flush() 阻塞到调用前提交的所有写入都已落库，用作持久化点；期间有写入被丢弃时返回 False；
+      进程退出时自动 flush
+    """
+
+    def __init__(self, db_path: str, journal_mode: str = "wal", synchronous: str = "normal",
+                 max_batch: int = 256, flush_interval: float = 0.05, name: str = "write-behind"):
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.name = name
+        # 写连接只在后台线程中使用，读连接不会看到未提交的批次
+        self.conn = tracing.connect(db_path, check_same_thread=False)
+        configure_connection(self.conn, journal_mode, synchronous)
+        self._buffer: List[Tuple[str, tuple, Optional[Callable[[Optional[int]], None]], bool]] = []
+        self._cond = threading.Condition()
+        self._submitted = 0
+        self._flushed = 0
+        self._force = False
+        self._stopped = False
+        # flush() 上次返回时已丢弃的写入数，丢弃只向 flush() 报告一次
+        self._dropped_reported = 0
+        self.last_error: Optional[Exception] = None
+        self.stats = {"rows": 0, "batches": 0, "seconds": 0.0, "errors": 0, "dropped": 0}
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, sql: str, params: tuple, callback: Optional[Callable[[Optional[int]], None]] = None,
+               with_rowid: bool = False):
+        """
+        缓冲一条写入；callback 在所在批次提交后于后台线程中调用。
+        :param with_rowid: 为 True 时该条单独执行，callback 收到其 lastrowid，否则收到 None
+        """
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError(f"[{self.name}] 写入队列已关闭")
+            self._buffer.append((sql, params, callback, with_rowid))
+            self._submitted += 1
+            if len(self._buffer) == 1 or len(self._buffer) >= self.max_batch:
+                self._cond.notify_all()
+
+    @property
+    def pending(self) -> int:
+        """尚未落库的写入数。"""
+        with self._cond:
+            return self._submitted - self._flushed
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._buffer or self._stopped)
+                if not self._buffer and self._stopped:
+                    return
+                # 攒批：等待凑满 max_batch、超时或被 flush() 唤醒
+                deadline = time.monotonic() + self.flush_interval
+                while (len(self._buffer) < self.max_batch and not self._force and not self._stopped):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._buffer = self._buffer, []
+                self._force = False
+                target = self._submitted
+            self._write_batch(batch)
+            with self._cond:
+                self._flushed = target
+                self._cond.notify_all()
+
+    def _execute(self, c: sqlite3.Cursor, batch) -> List[Optional[int]]:
+        """在当前事务中执行一批写入，连续相同的 SQL 合并为 executemany；返回每条写入的行 id。"""
+        rowids: List[Optional[int]] = [None] * len(batch)
+        i = 0
+        while i < len(batch):
+            sql, params, _, with_rowid = batch[i]
+            if with_rowid:
+                c.execute(sql, params)
+                rowids[i] = c.lastrowid
+                i += 1
+                continue
+            j = i
+            while j < len(batch) and batch[j][0] == sql and not batch[j][3]:
+                j += 1
+            c.executemany(sql, [item[1] for item in batch[i:j]])
+            i = j
+        return rowids
+
+    def _write_batch(self, batch):
+        start = time.perf_counter()
+        c = self.conn.cursor()
+        try:
+            c.execute("BEGIN")
+            rowids = self._execute(c, batch)
+            self.conn.commit()
+        except Exception as err:
+            self.conn.rollback()
+            self.stats["errors"] += 1
+            print(f"[{self.name}] 批量写入失败，逐条重试 {len(batch)} 条：{err}")
+            self._write_rows(batch)
+            return
+        self.stats["rows"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["seconds"] += time.perf_counter() - start
+        for (_, _, callback, _), rowid in zip(batch, rowids):
+            if callback is not None:
+                callback(rowid)
+
+    def _write_rows(self, batch):
+        """批次失败后的逐条重试：每条各自一个事务，只丢弃仍然失败的写入。"""
+        c = self.conn.cursor()
+        for item in batch:
+            try:
+                c.execute("BEGIN")
+                rowid = self._execute(c, [item])[0]
+                self.conn.commit()
+            except Exception as err:
+                self.conn.rollback()
+                self.last_error = err
+                self.stats["dropped"] += 1
+                print(f"[{self.name}] 写入失败，已丢弃：{err}")
+                continue
+            self.stats["rows"] += 1
+            if item[2] is not None:
+                item[2](rowid)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞到此前提交的写入全部处理完。
+        :return: 是否在 timeout 内完成且自上次 flush() 以来没有写入被丢弃（原因见 last_error）
+        """
+        with self._cond:
+            target = self._submitted
+            if self._flushed < target:
+                self._force = True
+                self._cond.notify_all()
+                if not self._cond.wait_for(lambda: self._flushed >= target, timeout):
+                    return False
+            dropped = self.stats["dropped"]
+            ok = dropped == self._dropped_reported
+            self._dropped_reported = dropped
+            return ok
+
+    def close(self):
+        """落库剩余写入，停止后台线程并关闭写连接。"""
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify_all()
+        self._worker.join()
+        self.conn.close()
+        atexit.unregister(self.close)
+
+
+class BufferedWrites:
+    """
+    记忆体的连接与写入混入类（与 ChangeFeed 一起使用）：
+    - 传入 engine（StorageEngine）时使用引擎按线程分配的连接，否则自己按线程打开 db_path 的连接
+      （ThreadConnections）：检索线程池、写入线程与后台抽象线程各用各的连接，不共享同一个连接
+    - 所有连接都按 journal_mode / synchronous 配置（默认 WAL + NORMAL）
+    - write_behind=True 时，插入与更新经 WriteBehindQueue 批量提交，变更事件在落库后发布；
+      删除与清空先 flush() 再同步执行，保证与之前的写入顺序一致
+    - 读操作只能看到已落库的数据，需要立即可见时先调用 flush()
+    """
+
+    def _init_storage(self, db_path: str, engine, journal_mode: str, synchronous: str, write_behind: bool,
+                      max_batch: int, flush_interval: float):
+        self.engine = engine
+        if engine is not None:
+            self.db_path = engine.db_path
+            journal_mode, synchronous = engine.journal_mode, engine.synchronous
+            self._connections = None
+        else:
+            self.db_path = db_path
+            self._connections = ThreadConnections(db_path, journal_mode, synchronous, name=type(self).__name__)
+        self._wb: Optional[WriteBehindQueue] = None
+        if write_behind:
+            self._wb = WriteBehindQueue(self.db_path, journal_mode, synchronous, max_batch, flush_interval,
+                                        name=f"{type(self).__name__}-writer")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """当前线程应使用的连接。"""
+        return self.engine.connection() if self.engine is not None else self._connections.get()
+
+    @property
+    def write_behind(self) -> bool:
+        return self._wb is not None
+
+    def _write(self, sql: str, params: tuple, op: str = None, doc_key: str = None, key: str = None,
+               content: str = None, timestamp: int = None, rowid_key: bool = False) -> Optional[int]:
+        """
+        执行一条写入并发布变更事件；写后模式下只入队，事件在落库后发布。
+        op 为 None 时不发布事件（用于不属于记忆内容的辅助表）。
+        rowid_key=True 时以 SQLite 分配的行 id 作为事件的 doc_key。
+        :return: 同步模式下为 lastrowid，写后模式下为 None（行 id 随变更事件发布）
+        """
+        if self._wb is not None:
+            callback = None
+            if op is not None:
+                callback = lambda rowid: self._publish(op, str(rowid) if rowid_key else doc_key, key, content,
+                                                       timestamp)
+            self._wb.submit(sql, params, callback, with_rowid=rowid_key)
+            return None
+        conn = self.conn
+        rowid = conn.execute(sql, params).lastrowid
+        conn.commit()
+        if op is not None:
+            self._publish(op, str(rowid) if rowid_key else doc_key, key, content, timestamp)
+        return rowid
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """持久化点：等待缓冲中的写入全部落库（非写后模式下直接返回）；有写入被丢弃时返回 False。"""
+        return self._wb.flush(timeout) if self._wb is not None else True
+
+    def _close_storage(self):
+        """落库缓冲中的写入；自己打开的连接随之关闭，引擎的连接由引擎管理。"""
+        if self._wb is not None:
+            self._wb.close()
+        if self._connections is not None:
+            self._connections.close()
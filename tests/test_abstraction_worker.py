@@ -0,0 +1,46 @@
+# tests/test_abstraction_worker.py
+
+import threading
+
+from memory.abstraction_worker import AbstractionWorker
+from wm.working_memory import WorkingMemory
+
+
+class SlowAbstractor:
+    """第一次摘要阻塞到 release 被设置，让后续提交在队列中合并。"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.batches = []
+        self.sm_store = self
+
+    def abstract_conversation(self, messages):
+        self.release.wait(5)
+        self.batches.append([m["text"] for m in messages])
+        return "摘要"
+
+    def add(self, key, content, timestamp=None):
+        pass
+
+
+def test_merged_conversation_messages_are_not_duplicated():
+    abstractor = SlowAbstractor()
+    worker = AbstractionWorker(abstractor)
+    wm = WorkingMemory(max_history=50)
+    # 第一个任务占住后台线程，之后的提交都在队列中合并
+    worker.submit_conversation([{"role": "user", "text": "占位", "ts": "0"}], key="blocker")
+    # 与对话流程相同：历史达到 8 条时提交最近 8 条，只保留最后 2 条
+    turns = 10
+    for turn in range(turns):
+        wm.add_context("user", f"问题 {turn}")
+        wm.add_context("assistant", f"回答 {turn}")
+        if len(wm.context) >= 8:
+            worker.submit_conversation(wm.recent(8))
+            wm.truncate(2)
+    abstractor.release.set()
+    assert worker.flush(timeout=5)
+    worker.close()
+
+    merged = abstractor.batches[1]
+    assert len(merged) == len(set(merged))
+    assert merged == [f"{role} {i}" for i in range(turns) for role in ("问题", "回答")]
@@ -0,0 +1,43 @@
+# tests/test_abstractor.py
+
+import json
+
+from llm.llm_client import Llama3Client
+from memory.abstractor import Abstractor
+from memory.em_store import EMStore
+from memory.sm_store import SMStore
+
+
+class VerboseLLM:
+    """总结从不变短的 LLM。"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def chat(self, messages, temperature=0.7, max_tokens=None, **kwargs):
+        self.calls += 1
+        return "很长的总结" * 20
+
+
+def test_map_reduce_terminates_when_summaries_do_not_shrink(tmp_path):
+    em = EMStore(str(tmp_path / "em.db"))
+    sm = SMStore(str(tmp_path / "sm.db"))
+    for i in range(20):
+        em.add("吃饭", f"第 {i} 次吃了很多东西" * 5)
+    llm = VerboseLLM()
+    ab = Abstractor(em, sm, llm=llm, chunk_chars=150, max_levels=3)
+
+    assert ab.abstract("吃饭") == "很长的总结" * 20
+    # 第一层之后块数不再减少即截断，不会无限调用 LLM
+    assert llm.calls < 40
+    kept = ab._truncate(["- " + "甲" * 100, "- " + "乙" * 100])
+    assert kept == ["- " + "乙" * 100]
+    assert ab._truncate(["x" * 500]) == ["x" * 150]
+
+
+def test_max_tokens_is_sent_in_fields_the_server_reads():
+    client = Llama3Client(model="m", url="http://localhost:1/v1/chat/completions")
+    payload = json.loads(client._build_request([], 0.3, 200, stream=False))
+    assert payload["max_tokens"] == 200
+    assert payload["options"]["num_predict"] == 200
+    assert "max_new_tokens" not in payload["options"]
@@ -0,0 +1,50 @@
+# tests/test_em_store.py
+
+import threading
+
+from memory.em_store import EMStore
+
+
+def test_write_behind_ids_do_not_collide_with_other_writers(tmp_path):
+    db = str(tmp_path / "em.db")
+    buffered = EMStore(db, write_behind=True, flush_interval=0.01)
+    plain = EMStore(db)
+    inserted = []
+    buffered.subscribe(lambda event: inserted.append(int(event.doc_key)))
+
+    plain.add("k", "来自另一个连接")
+    assert buffered.add("k", "写后 1") is None
+    buffered.add("k", "写后 2")
+
+    assert buffered.flush(timeout=5) is True
+    rows = plain.get_after("k")
+    assert [content for _, content, _ in rows] == ["来自另一个连接", "写后 1", "写后 2"]
+    # 变更事件中的 doc_key 就是 SQLite 分配的行 id
+    assert inserted == [row_id for row_id, _, _ in rows[1:]]
+    buffered.close()
+    plain.close()
+
+
+def test_each_thread_gets_its_own_connection(tmp_path):
+    em = EMStore(str(tmp_path / "em.db"))
+    em.add("k", "主线程写入")
+    conns, errors = [], []
+
+    def worker(i):
+        try:
+            conns.append(em.conn)
+            em.add("k", f"线程 {i} 写入")
+            for _ in range(20):
+                em.get_all("k")
+        except Exception as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert len({id(c) for c in conns} | {id(em.conn)}) == 5
+    assert len(em.get_all("k")) == 5
+    em.close()
@@ -0,0 +1,44 @@
+# tests/test_embedding_cache.py
+
+import numpy as np
+
+from memory.embedding_cache import EmbeddingCache
+
+
+def _vec(i, dim=4):
+    return np.full(dim, i, dtype=np.float32)
+
+
+def test_lookups_do_not_write(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), touch_batch=100)
+    cache.put_many("m", 4, {"a": _vec(1), "b": _vec(2)})
+    before = cache.conn.total_changes
+    for _ in range(10):
+        assert set(cache.get_many("m", 4, ["a", "b", "c"])) == {"a", "b"}
+    assert cache.conn.total_changes == before
+    assert cache.stats()["hits"] == 20 and cache.stats()["misses"] == 10
+    cache.close()
+
+
+def test_batched_access_times_still_drive_eviction(tmp_path):
+    # 每条向量 16 字节，上限 64 字节：写入第 5 条时淘汰到 57 字节以内（保留 3 条）
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=64, touch_batch=100)
+    for i, h in enumerate("abcd"):
+        cache.put_many("m", 4, {h: _vec(i)})
+    # 最早写入的 a、b 刚被访问过，访问时间只在内存中，淘汰前写回
+    cache.get_many("m", 4, ["a", "b"])
+    cache.put_many("m", 4, {"e": _vec(4)})
+    assert set(cache.get_many("m", 4, list("abcde"))) == {"a", "b", "e"}
+    assert cache.stats()["evictions"] == 2
+    cache.close()
+
+
+def test_access_times_are_written_in_batches(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), touch_batch=3)
+    cache.put_many("m", 4, {h: _vec(i) for i, h in enumerate("abc")})
+    before = cache.conn.total_changes
+    cache.get_many("m", 4, ["a", "b"])
+    assert cache.conn.total_changes == before
+    cache.get_many("m", 4, ["c"])
+    assert cache.conn.total_changes == before + 3
+    cache.close()
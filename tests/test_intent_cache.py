@@ -0,0 +1,65 @@
+# tests/test_intent_cache.py
+
+from intent import intent_cache
+from intent.intent_cache import IntentCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def test_normalized_inputs_share_an_entry(tmp_path):
+    cache = IntentCache(db_path=str(tmp_path / "cache.db"))
+    cache.put("m", "今天吃什么？", "吃饭")
+    assert cache.get("m", "  今天吃什么 ") == "吃饭"
+    assert cache.get("other-model", "今天吃什么") is None
+    cache.close()
+
+
+def test_ttl_expires_memory_and_disk(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(intent_cache, "time", clock)
+    db = str(tmp_path / "cache.db")
+    cache = IntentCache(ttl=60, db_path=db)
+    cache.put("m", "你好", "问候")
+    clock.now += 30
+    assert cache.get("m", "你好") == "问候"
+
+    # 新进程只有磁盘层：未过期时命中磁盘，过期后删除并计为未命中
+    reopened = IntentCache(ttl=60, db_path=db)
+    assert reopened.get("m", "你好") == "问候"
+    assert reopened.stats()["disk_hits"] == 1
+    clock.now += 31
+    fresh = IntentCache(ttl=60, db_path=db)
+    assert fresh.get("m", "你好") is None
+    assert fresh.stats()["disk_entries"] == 0
+    assert cache.get("m", "你好") is None
+    for c in (cache, reopened, fresh):
+        c.close()
+
+
+def test_memory_lru_and_disk_eviction(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(intent_cache, "time", clock)
+    cache = IntentCache(max_entries=2, ttl=None, db_path=str(tmp_path / "cache.db"), max_disk_entries=10)
+    for i in range(3):
+        clock.now += 1
+        cache.put("m", f"输入 {i}", f"意图 {i}")
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
+
+    for i in range(3, 11):
+        clock.now += 1
+        cache.put("m", f"输入 {i}", f"意图 {i}")
+    stats = cache.stats()
+    # 超过上限时按最近访问时间淘汰到上限的 90%
+    assert stats["disk_entries"] == 9 and stats["disk_evictions"] == 2
+    assert cache.conn.execute("SELECT COUNT(*) FROM intent_cache").fetchone()[0] == 9
+    cache._entries.clear()
+    assert cache.get("m", "输入 0") is None
+    assert cache.get("m", "输入 10") == "意图 10"
+    cache.close()
@@ -0,0 +1,64 @@
+# tests/test_intent_classifier.py
+
+from intent.intent_classifier import IntentClassifier, label_from_intent
+from intent.intent_detector import IntentDetector
+
+
+class FixedClassifier:
+    def __init__(self, label, confidence):
+        self.result = (label, confidence)
+
+    def predict(self, text):
+        return self.result
+
+
+class FakeLLM:
+    model = "fake"
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = 0
+
+    def chat(self, messages, temperature=0.7, max_tokens=None, **kwargs):
+        self.calls += 1
+        return self.reply
+
+
+def _detector(classifier, reply, min_confidence=0.9):
+    detector = IntentDetector(classifier=classifier, use_cache=False, min_confidence=min_confidence,
+                              log_path=None)
+    detector.llm = FakeLLM(reply)
+    return detector
+
+
+def test_confident_classifier_skips_llm():
+    detector = _detector(FixedClassifier("record", 0.95), "record")
+    route = detector.route("帮我记一下明天开会")
+    assert route.source == "classifier" and route.label == "record"
+    assert route.query == "帮我记一下明天开会"
+    assert detector.llm.calls == 0
+
+
+def test_low_confidence_falls_back_to_llm():
+    detector = _detector(FixedClassifier("record", 0.5), "update_goal 跑步")
+    route = detector.route("把目标改成跑步")
+    assert route.source == "llm" and route.label == "update_goal"
+    assert detector.llm.calls == 1
+
+
+def test_destructive_labels_always_ask_llm():
+    detector = _detector(FixedClassifier("clear_memory", 0.99), "闲聊")
+    route = detector.route("清空一下")
+    assert route.source == "llm" and route.label == "other"
+    assert detector.llm.calls == 1
+
+
+def test_trained_classifier_routes_known_phrasings():
+    samples = [("帮我记一下" + s, "record") for s in ("明天开会", "买牛奶", "交房租", "取快递")]
+    samples += [(s, "other") for s in ("今天天气怎么样", "讲个笑话", "你好呀", "推荐一本书")]
+    clf = IntentClassifier().train(samples, epochs=30)
+    label, confidence = clf.predict("帮我记一下买面包")
+    assert label == "record" and confidence > 0.5
+    # 没见过的输入覆盖率不足，置信度为 0
+    assert clf.predict("量子色动力学")[1] == 0.0
+    assert label_from_intent("clear_memory 全部") == "clear_memory"
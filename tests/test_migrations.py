@@ -0,0 +1,120 @@
+# tests/test_migrations.py
+# 在基线格式（TEXT 时间戳）的旧库上打开新版记忆体，检查迁移结果
+
+import sqlite3
+
+from memory.em_store import EMStore
+from memory.migrations import current_version, to_epoch
+from memory.ms_store import MSStore
+from memory.sm_store import SMStore
+
+
+def _baseline_em(path):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+    CREATE TABLE episodic_memory (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TEXT NOT NULL
+    )
+    """)
+    conn.executemany("INSERT INTO episodic_memory(key, content, timestamp) VALUES (?, ?, ?)", [
+        ("吃饭", "中午吃了火锅", "2025-07-14 12:30:00"),
+        ("吃饭", "晚上吃了拉面", "1752500000.25"),
+        ("学习", "读完一章机器学习", "2025-07-15 09:00:00"),
+        ("学习", "这条会被删除", "2025-07-16 09:00:00"),
+    ])
+    conn.execute("DELETE FROM episodic_memory WHERE id = 4")
+    conn.commit()
+    conn.close()
+
+
+def _baseline_keyed(path, table):
+    conn = sqlite3.connect(path)
+    conn.execute(f"""
+    CREATE TABLE {table} (
+        key TEXT PRIMARY KEY,
+        content TEXT NOT NULL,
+        timestamp TEXT NOT NULL
+    )
+    """)
+    conn.executemany(f"INSERT INTO {table}(key, content, timestamp) VALUES (?, ?, ?)", [
+        ("地球", "地球是太阳系的第三颗行星", "2025-07-14 15:22:10"),
+        ("重力", "重力是物体间的引力", "2025-07-14 15:22:11"),
+        ("睡眠", "用户工作日睡眠五小时", "2025-07-14 15:22:12"),
+    ])
+    conn.commit()
+    conn.close()
+
+
+def _columns(conn, table):
+    return {row[1]: row[2].upper() for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _indexes(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA index_list({table})")}
+
+
+def test_episodic_baseline_migrates_and_keeps_sequence(tmp_path):
+    path = str(tmp_path / "em.db")
+    _baseline_em(path)
+    em = EMStore(path)
+
+    assert current_version(em.conn, "episodic") == 2
+    assert _columns(em.conn, "episodic_memory")["timestamp"] == "INTEGER"
+    assert {"idx_episodic_memory_key_ts", "idx_episodic_memory_ts"} <= _indexes(em.conn, "episodic_memory")
+    rows = em.conn.execute("SELECT id, content, timestamp FROM episodic_memory ORDER BY id").fetchall()
+    assert [(i, c) for i, c, _ in rows] == [(1, "中午吃了火锅"), (2, "晚上吃了拉面"), (3, "读完一章机器学习")]
+    assert rows[0][2] == to_epoch("2025-07-14 12:30:00")
+    assert rows[1][2] == 1752500000
+
+    # AUTOINCREMENT 序列保留：被删除的 id 4 不会被重新使用
+    em.add("学习", "新的一条")
+    assert em.conn.execute("SELECT MAX(id) FROM episodic_memory").fetchone()[0] == 5
+    assert [r[1] for r in em.search("机器学习")] == ["读完一章机器学习"]
+    assert [r[1] for r in em.range("吃饭", since=to_epoch("2025-07-14 13:00:00"))] == ["晚上吃了拉面"]
+    em.close()
+
+    # 再次打开不重复迁移
+    again = EMStore(path)
+    assert current_version(again.conn, "episodic") == 2
+    again.close()
+
+
+def test_semantic_baseline_migrates_to_v4(tmp_path):
+    path = str(tmp_path / "sm.db")
+    _baseline_keyed(path, "semantic_memory")
+    sm = SMStore(path)
+
+    assert current_version(sm.conn, "semantic") == 4
+    columns = _columns(sm.conn, "semantic_memory")
+    assert columns["id"] == "INTEGER" and columns["timestamp"] == "INTEGER"
+    assert {"idx_semantic_memory_key_ts", "idx_semantic_memory_ts"} <= _indexes(sm.conn, "semantic_memory")
+    assert sm.get("地球")[1] == to_epoch("2025-07-14 15:22:10")
+    assert sm.get_watermark("地球") == 0
+    sm.set_watermark("地球", 7)
+    assert sm.get_watermark("地球") == 7
+
+    # key 仍然唯一，重复 add 更新原记录
+    sm.add("地球", "地球是一颗岩石行星")
+    assert len(sm.all()) == 3
+    assert [r[0] for r in sm.search("岩石行星")] == ["地球"]
+    sm.close()
+
+
+def test_fts_stays_in_sync_after_vacuum(tmp_path):
+    path = str(tmp_path / "ms.db")
+    _baseline_keyed(path, "mission_state")
+    ms = MSStore(path)
+    assert current_version(ms.conn, "mission") == 3
+    assert "id" in _columns(ms.conn, "mission_state")
+
+    # 删除中间的行后 VACUUM：隐式 rowid 可能被重新编号，显式的 id 列不会
+    ms.conn.execute("DELETE FROM mission_state WHERE key = '重力'")
+    ms.conn.commit()
+    ms.conn.execute("VACUUM")
+    ms.conn.execute("INSERT INTO mission_state_fts(mission_state_fts) VALUES ('integrity-check')")
+    assert [r[0] for r in ms.search("睡眠五小时")] == ["睡眠"]
+    assert ms.search("物体间的引力") == []
+    ms.close()
@@ -0,0 +1,43 @@
+# tests/test_ngram_index.py
+
+from memory.em_store import EMStore
+from memory.ms_store import MSStore
+from memory.ngram_index import MemoryTextIndex, NgramIndex
+from memory.sm_store import SMStore
+
+
+def _index(tmp_path):
+    em = EMStore(str(tmp_path / "em.db"))
+    sm = SMStore(str(tmp_path / "sm.db"))
+    ms = MSStore(str(tmp_path / "ms.db"))
+    return em, sm, ms, MemoryTextIndex(em, sm, ms)
+
+
+def test_single_char_query_uses_unigram_postings(tmp_path):
+    em, sm, ms, index = _index(tmp_path)
+    em.add("k", "今天天气很好")
+    em.add("k", "明天要下雨")
+    sm.add("k", "猫喜欢晒太阳")
+
+    contents = {r["content"] for r in index.search("天", top_k=0)}
+    assert contents == {"今天天气很好", "明天要下雨"}
+    assert index.search("狗", top_k=0) == []
+    assert [r["content"] for r in index.search("猫", top_k=0)] == ["猫喜欢晒太阳"]
+
+
+def test_unmatched_long_query_returns_nothing(tmp_path):
+    em, sm, ms, index = _index(tmp_path)
+    em.add("k", "今天天气很好")
+    assert index.search("下雨天", top_k=0) == []
+    assert [r["content"] for r in index.search("天气", top_k=0)] == ["今天天气很好"]
+
+
+def test_remove_drops_unigram_postings():
+    index = NgramIndex()
+    index.add(1, "ab")
+    index.add(2, "bc")
+    assert index.search_short("b") == {1, 2}
+    index.remove(1)
+    assert index.search_short("a") == set()
+    assert index.search_short("b") == {2}
+    assert index.chars.keys() == {"b", "c"}
@@ -0,0 +1,63 @@
+# tests/test_prompt_builder.py
+
+from dialogue.prompt_builder import PromptBuilder
+from wm.working_memory import WorkingMemory
+
+
+def _memory(source, content, score):
+    return {"source": source, "key": "k", "content": content, "timestamp": 1700000000, "score": score}
+
+
+def test_blocks_layout_respects_budget():
+    wm = WorkingMemory(max_history=20)
+    for i in range(30):
+        wm.add_context("user" if i % 2 == 0 else "assistant", f"第 {i} 句话" + "内容" * 20)
+    wm.load_memories([_memory("semantic", "低分记忆" * 30, 0.1), _memory("episodic", "高分记忆", 0.9)])
+    builder = PromptBuilder("系统提示", context_window=400, reserve_tokens=100, verbose=False)
+
+    messages = builder.build("你好", ["闲聊"], wm)
+    stats = builder.last_stats
+    assert stats["prompt_tokens"] <= builder.budget() == 300
+    assert stats["turns"] < stats["turns_total"]
+    # 保留的是最近的对话，高分记忆优先
+    history = messages[2]["content"]
+    assert "第 29 句话" in history and "第 0 句话" not in history
+    assert "高分记忆" in messages[1]["content"] and "低分记忆" not in messages[1]["content"]
+    assert messages[-1] == {"role": "user", "content": "你好"}
+
+
+def test_stable_layout_keeps_byte_identical_prefix():
+    wm = WorkingMemory(max_history=50)
+    builder = PromptBuilder("系统提示", context_window=100000, verbose=False, layout="stable")
+    previous = None
+    for turn in range(8):
+        user_input = f"第 {turn} 个问题"
+        wm.add_context("user", user_input)
+        wm.load_memories([_memory("episodic", f"每轮不同的记忆 {turn}", 0.5)])
+        messages = builder.build(user_input, [f"意图{turn}"], wm)
+        # 每轮变化的记忆与意图只出现在末尾两条之前的一条消息里
+        prefix = messages[:-2]
+        if previous is not None:
+            assert prefix[:len(previous)] == previous
+            assert len(prefix) == len(previous) + 2
+        previous = prefix
+        wm.add_context("assistant", f"第 {turn} 个回答")
+
+
+def test_stable_layout_trims_in_one_step_when_over_budget():
+    wm = WorkingMemory(max_history=100)
+    builder = PromptBuilder("系统提示", context_window=600, reserve_tokens=100, verbose=False, layout="stable")
+    trims = 0
+    previous = None
+    for turn in range(40):
+        user_input = f"问题 {turn}" + "字" * 20
+        wm.add_context("user", user_input)
+        messages = builder.build(user_input, ["闲聊"], wm)
+        assert builder.last_stats["prompt_tokens"] <= builder.budget()
+        prefix = messages[:-2]
+        if previous is not None and prefix[:len(previous)] != previous:
+            trims += 1
+        previous = prefix
+        wm.add_context("assistant", "回答" + "字" * 20)
+    # 裁剪一次约去掉一半，之后若干轮前缀保持稳定，而不是每轮滑动
+    assert 0 < trims <= 40 // 4
@@ -0,0 +1,62 @@
+# tests/test_snapshot.py
+
+from memory.em_store import EMStore
+from memory.ms_store import MSStore
+from memory.sm_store import SMStore
+from memory.snapshot import MemorySnapshot
+
+
+def _snapshot(tmp_path, **kwargs):
+    em = EMStore(str(tmp_path / "em.db"))
+    sm = SMStore(str(tmp_path / "sm.db"))
+    ms = MSStore(str(tmp_path / "ms.db"))
+    snapshot = MemorySnapshot(em, sm, ms, **kwargs)
+    reloads = []
+    original = snapshot._reload
+
+    def counting_reload(tier):
+        reloads.append(tier)
+        original(tier)
+
+    snapshot._reload = counting_reload
+    return em, sm, ms, snapshot, reloads
+
+
+def test_unchanged_version_reuses_snapshot(tmp_path):
+    em, sm, ms, snapshot, reloads = _snapshot(tmp_path)
+    em.add("k", "第一条")
+    first = snapshot.as_dicts()
+    assert sorted(reloads) == ["episodic", "mission", "semantic"]
+    assert snapshot.refresh() is False
+    assert snapshot.as_dicts() is first
+    assert snapshot.version == (em.version, sm.version, ms.version)
+
+
+def test_events_are_applied_incrementally(tmp_path):
+    em, sm, ms, snapshot, reloads = _snapshot(tmp_path)
+    snapshot.refresh()
+    reloads.clear()
+
+    em.add("k", "新的情景记忆")
+    sm.add("概念", "旧定义")
+    sm.add("概念", "新定义")
+    assert snapshot.refresh() is True
+    assert reloads == []
+    contents = sorted(r["content"] for r in snapshot.as_dicts())
+    assert contents == ["新定义", "新的情景记忆"]
+
+    sm.clear()
+    snapshot.refresh()
+    assert [r["content"] for r in snapshot.as_dicts()] == ["新的情景记忆"]
+    assert reloads == []
+
+
+def test_backlog_overflow_reloads_tier(tmp_path):
+    em, sm, ms, snapshot, reloads = _snapshot(tmp_path, max_pending=2)
+    snapshot.refresh()
+    reloads.clear()
+    for i in range(5):
+        em.add("k", f"记录 {i}")
+    snapshot.refresh()
+    assert reloads == ["episodic"]
+    assert len(snapshot.records()) == 5
@@ -0,0 +1,28 @@
+# tests/test_storage.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from memory.em_store import EMStore
+from memory.storage import StorageEngine
+
+
+def test_connections_of_finished_threads_are_closed(tmp_path):
+    engine = StorageEngine(str(tmp_path / "memory.db"))
+    em = EMStore(engine=engine)
+    assert engine.pool_size == 1
+
+    # 每批任务用一个新的线程池，线程随池关闭退出
+    for batch in range(5):
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            list(pool.map(lambda i: em.add("k", f"第 {batch} 批 {i}"), range(6)))
+    # 之前退出的线程的连接在新线程建连时被关闭，只剩主线程与最后一批的连接
+    assert engine.pool_size <= 1 + 3
+    assert engine._pool.reaped >= 4
+
+    t = threading.Thread(target=lambda: em.add("k", "最后一条"))
+    t.start()
+    t.join()
+    assert engine.pool_size <= 1 + 3 + 1
+    assert len(em.get_all("k")) == 31
+    engine.close()
@@ -0,0 +1,98 @@
+# tests/test_transport.py
+
+import http.client
+import socket
+import threading
+import time
+
+import pytest
+
+from utils.transport import HttpTransport
+
+
+class RawServer:
+    """
+    极简 HTTP 服务端：
+    - mode="drop"：读完请求后不响应直接关闭连接
+    - mode="respond_once"：每条连接只响应一次（keep-alive），随后在空闲时关闭连接
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.requests = []
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(8)
+        self.url = f"http://127.0.0.1:{self.sock.getsockname()[1]}/api"
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _read_request(self, conn) -> bytes:
+        data = b""
+        while b"\r\n\r\n" not in data:
+            chunk = conn.recv(4096)
+            if not chunk:
+                return b""
+            data += chunk
+        head, body = data.split(b"\r\n\r\n", 1)
+        length = 0
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+        while len(body) < length:
+            body += conn.recv(4096)
+        return head.split(b"\r\n")[0]
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            line = self._read_request(conn)
+            if not line:
+                return
+            self.requests.append(line)
+            if self.mode == "respond_once":
+                conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok")
+                time.sleep(0.05)
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def transport():
+    t = HttpTransport(max_retries=2, backoff_base=0.0, connect_timeout=2.0, read_timeout=2.0)
+    yield t
+    t.close()
+
+
+def test_post_is_not_resent_after_connection_drop(transport):
+    server = RawServer("drop")
+    with pytest.raises(http.client.RemoteDisconnected):
+        transport.request("POST", server.url, body=b"{}")
+    assert len(server.requests) == 1
+    server.close()
+
+
+def test_get_is_retried_after_connection_drop(transport):
+    server = RawServer("drop")
+    with pytest.raises(http.client.RemoteDisconnected):
+        transport.request("GET", server.url)
+    assert len(server.requests) == 3
+    server.close()
+
+
+def test_stale_idle_connection_is_replaced_before_sending(transport):
+    server = RawServer("respond_once")
+    assert transport.request("POST", server.url, body=b"{}").data == b"ok"
+    time.sleep(0.2)  # 服务端已关闭空闲连接
+    assert transport.request("POST", server.url, body=b"{}").data == b"ok"
+    stats = transport.stats()
+    assert stats["stale_discarded"] == 1 and stats["errors"] == 0
+    assert len(server.requests) == 2
+    server.close()
@@ -0,0 +1,71 @@
+# tests/test_vector_store.py
+# 用 HashEmbeddingStore（离线确定性嵌入）测试索引逻辑，不依赖 Ollama
+
+from benchmarks.synthetic import HashEmbeddingStore
+
+
+def _store(tmp_path, **kwargs):
+    return HashEmbeddingStore(dim=64, index_path=str(tmp_path / "vs.faiss"),
+                              meta_path=str(tmp_path / "vs_meta.pkl"), **kwargs)
+
+
+def test_upsert_replaces_and_remove_hides(tmp_path):
+    vs = _store(tmp_path)
+    vs.upsert_batch([("a", "今天吃了火锅"), ("b", "明天去跑步"), ("c", "周末读完一本书")])
+    assert len(vs) == 3
+
+    vs.upsert("a", "今天吃了拉面")
+    assert vs.get_text("a") == "今天吃了拉面"
+    assert vs.query("今天吃了拉面", top_k=1)[0]["key"] == "a"
+    # 旧向量只打了墓碑，检索时不会返回
+    assert all(r["text"] != "今天吃了火锅" for r in vs.query("今天吃了火锅", top_k=3))
+
+    assert vs.remove("b") is True
+    assert vs.remove("b") is False
+    assert "b" not in vs
+    assert [r["key"] for r in vs.query("明天去跑步", top_k=3)].count("b") == 0
+
+
+def test_save_and_mmap_reload(tmp_path):
+    vs = _store(tmp_path)
+    vs.upsert_batch([(f"k{i}", f"第 {i} 条记录") for i in range(10)])
+    vs.remove("k3")
+    vs.save()
+
+    reloaded = _store(tmp_path)
+    assert sorted(reloaded.keys) == sorted(f"k{i}" for i in range(10) if i != 3)
+    assert reloaded._mmapped is True
+    assert reloaded.query("第 7 条记录", top_k=1)[0]["key"] == "k7"
+
+    # 内存映射的索引首次修改前复制到内存，保存后旧版本文件被替换
+    reloaded.upsert("k11", "新加的一条")
+    assert reloaded._mmapped is False
+    reloaded.save()
+    again = _store(tmp_path)
+    assert "k11" in again and len(again) == 10
+
+
+def test_ivf_auto_migration(tmp_path):
+    vs = _store(tmp_path, index_type="ivf_flat", index_params={"min_train_size": 50, "nlist": 4})
+    vs.upsert_batch([(f"k{i}", f"记录 {i}") for i in range(20)])
+    assert vs._active_type == "flat"
+
+    vs.upsert_batch([(f"k{i}", f"记录 {i}") for i in range(20, 60)])
+    assert vs._active_type == "ivf_flat"
+    assert vs.index.ntotal == 60
+    assert vs.query("记录 42", top_k=1)[0]["key"] == "k42"
+
+    vs.save()
+    reloaded = _store(tmp_path, index_type="ivf_flat", index_params={"min_train_size": 50, "nlist": 4})
+    assert reloaded._active_type == "ivf_flat" and len(reloaded) == 60
+
+
+def test_embed_throughput_is_printed_only_when_verbose(tmp_path, capsys):
+    vs = _store(tmp_path)
+    vs.upsert_batch([("a", "第一条"), ("b", "第二条")])
+    assert "[VectorStore] 嵌入" not in capsys.readouterr().out
+    assert vs.last_embed_stats["texts"] == 2
+
+    vs.verbose = True
+    vs.upsert_batch([("c", "第三条"), ("d", "第四条")])
+    assert "[VectorStore] 嵌入 2 条文本" in capsys.readouterr().out
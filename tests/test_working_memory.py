@@ -0,0 +1,25 @@
+# tests/test_working_memory.py
+
+from wm.working_memory import WorkingMemory
+
+
+def _joined(wm):
+    return "\n".join(entry.line for entry in wm.context)
+
+
+def test_context_text_is_maintained_incrementally():
+    wm = WorkingMemory(max_history=2)
+    assert wm.get_context_text() == ""
+    for i in range(9):
+        wm.add_context("user" if i % 2 == 0 else "assistant", f"第 {i} 句\n含换行")
+        # 缓存一直存在，环形缓冲区淘汰时也不需要整块重建
+        assert wm._context_text is not None
+        assert wm.get_context_text() == _joined(wm)
+    assert wm.context_tokens == sum(e.tokens for e in wm.context) + len(wm.context) - 1
+
+    wm.truncate(1)
+    assert wm.get_context_text() == _joined(wm)
+    wm.add_context("user", "新的一句")
+    assert wm.get_context_text() == _joined(wm)
+    wm.truncate(0)
+    assert wm.get_context_text() == ""
@@ -0,0 +1,31 @@
+# tests/test_write_behind.py
+
+import sqlite3
+
+from memory.write_behind import WriteBehindQueue
+
+
+def test_failed_batch_is_retried_row_by_row(tmp_path):
+    db = str(tmp_path / "wb.db")
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    conn.execute("INSERT INTO t VALUES (1, 'other writer')")
+    conn.commit()
+
+    wb = WriteBehindQueue(db, flush_interval=0.01)
+    published = []
+    wb.submit("INSERT INTO t VALUES (?, ?)", (1, "conflict"), lambda rowid: published.append("conflict"))
+    wb.submit("INSERT INTO t VALUES (?, ?)", (2, "ok"), lambda rowid: published.append("ok"))
+
+    # 冲突的一条被丢弃并报告，同批的另一条仍然落库
+    assert wb.flush(timeout=5) is False
+    assert wb.stats["dropped"] == 1
+    assert isinstance(wb.last_error, sqlite3.IntegrityError)
+    assert published == ["ok"]
+    assert conn.execute("SELECT v FROM t ORDER BY id").fetchall() == [("other writer",), ("ok",)]
+
+    # 丢弃只报告一次
+    wb.submit("INSERT INTO t VALUES (?, ?)", (3, "later"))
+    assert wb.flush(timeout=5) is True
+    wb.close()
+    conn.close()
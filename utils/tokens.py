@@ -0,0 +1,36 @@
+# utils/tokens.py
+# token 计数：PromptBuilder 与 WorkingMemory 共用
+
+import re
+from typing import Callable
+
+# 中日韩文字与全角符号：大多数 BPE 词表下约 1 个字 1 个 token（偏保守）
+_CJK = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    不依赖分词器的 token 数粗估：中日韩字符每字计 1，其余字符每 4 个计 1（向上取整）。
+    对中文偏保守，英文与 BPE 分词结果误差一般在 20% 以内，用于预算控制足够。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    rest = len(text) - cjk
+    return cjk + (rest + 3) // 4
+
+
+def make_token_counter(tokenizer=None) -> Callable[[str], int]:
+    """
+    把分词器统一成 text -> token 数 的函数：
+    - None：使用 estimate_tokens
+    - 可调用对象：直接作为计数函数（返回 int）
+    - 带 encode() 的对象（tiktoken 的 Encoding、transformers 的 tokenizer 等）：len(encode(text))
+    """
+    if tokenizer is None:
+        return estimate_tokens
+    if hasattr(tokenizer, "encode"):
+        return lambda text: len(tokenizer.encode(text)) if text else 0
+    if callable(tokenizer):
+        return tokenizer
+    raise TypeError(f"不支持的 tokenizer 类型：{type(tokenizer).__name__}")
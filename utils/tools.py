@@ -35,6 +35,13 @@ class Tools:
     def to_unix_timestamp():
         return int(time.time())
 
+    @staticmethod
+    def format_timestamp(ts, fmt: str = "%Y-%m-%d %H:%M:%S") -> str:
+        """把记忆体中的 Unix 秒格式化为本地时间字符串；非数字原样返回"""
+        if isinstance(ts, (int, float)):
+            return datetime.fromtimestamp(ts).strftime(fmt)
+        return "" if ts is None else str(ts)
+
     @staticmethod
     def ensure_ollama_running(process_name="ollama"):
         """
@@ -0,0 +1,287 @@
+# utils/tracing.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar, copy_context
+from typing import Callable, Dict, List, Optional
+
+from config import TRACING_CONFIG
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    一个计时区间。用作 with 块：进入时成为当前上下文（contextvars）的活动 span，
+    之后同一上下文中打开的 span 自动挂到它下面；退出时记录耗时并交给 Tracer。
+    """
+    __slots__ = ("tracer", "name", "attrs", "parent", "children", "trace_id", "root",
+                 "start", "wall", "duration", "closed", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict, root: bool = False):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.root = root
+        self.parent: Optional[Span] = None
+        self.children: List[Span] = []
+        self.trace_id: Optional[str] = None
+        self.duration: Optional[float] = None
+        self.closed = False
+
+    def set(self, **attrs):
+        """补充属性（如返回的 token 数、命中条数）。"""
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        parent = None if self.root else _current.get()
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else (os.urandom(8).hex() if self.root else None)
+        self.wall = time.time()
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # 生成器在别的上下文中被关闭时无法 reset，直接恢复父 span
+            _current.set(self.parent)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+    def to_dict(self) -> Dict:
+        d = {"name": self.name, "ms": round(self.duration * 1000, 3)}
+        if self.attrs:
+            d["attrs"] = self.attrs
+        if self.children:
+            d["children"] = [c.to_dict() for c in self.children]
+        return d
+
+
+class _NoopSpan:
+    """关闭追踪时返回的空 span，不计时、不分配对象。"""
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Tracer:
+    """
+    轻量的分阶段追踪与延迟统计：
+    - trace(name)：一轮对话（或一个后台任务）的根 span，结束时整棵 span 树作为一行 JSON 追加到 sink 文件
+    - span(name)：嵌套在当前活动 span 下的子阶段（意图识别、检索、prompt 组装、生成、记忆写入、
+      单次 HTTP 请求与 SQLite 语句等）；没有活动根 span 时只计入统计，不写文件
+    - 每个 span 名维护最近 max_samples 个耗时样本，summary() / format_summary() 随时给出 p50/p95/p99
+    - 根 span 已写出后才结束的子 span（例如后台记忆写入）单独写一行，用 trace_id 关联
+    开销：每个 span 两次 perf_counter、一次 ContextVar set/reset 与一次 deque 追加，关闭时为空操作。
+    """
+
+    def __init__(self, enabled: bool = True, sink: Optional[str] = None, max_samples: int = 4096):
+        """
+        :param sink: JSONL 文件路径，None 时不写文件，只保留进程内统计
+        :param max_samples: 每个 span 名保留的最近耗时样本数
+        """
+        self.enabled = enabled
+        self.sink = sink
+        self.max_samples = max_samples
+        # span 名 -> [累计次数, 最近样本]
+        self._stats: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def span(self, name: str, **attrs):
+        """当前上下文中的子阶段 span。"""
+        if not self.enabled:
+            return _NOOP
+        return Span(self, name, attrs)
+
+    def trace(self, name: str, **attrs):
+        """根 span：结束时写出整棵 span 树。"""
+        if not self.enabled:
+            return _NOOP
+        return Span(self, name, attrs, root=True)
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _current.get()
+
+    def record(self, name: str, seconds: float):
+        """直接记录一个耗时样本（不产生 span）。"""
+        entry = self._stats.get(name)
+        if entry is None:
+            with self._lock:
+                entry = self._stats.setdefault(name, [0, deque(maxlen=self.max_samples)])
+        entry[0] += 1
+        entry[1].append(seconds)
+
+    def _finish(self, span: Span):
+        self.record(span.name, span.duration)
+        span.closed = True
+        parent = span.parent
+        if parent is None:
+            if span.root:
+                self._emit(span.trace_id, span.to_dict(), span.wall)
+            return
+        if parent.closed:
+            # 父 span 已结束（根已写出），单独写一行
+            if span.trace_id is not None:
+                self._emit(span.trace_id, dict(span.to_dict(), parent=parent.name, late=True), span.wall)
+        else:
+            parent.children.append(span)
+
+    def _emit(self, trace_id: str, record: Dict, wall: float):
+        if not self.sink:
+            return
+        line = json.dumps(dict(trace_id=trace_id, ts=round(wall, 3), **record), ensure_ascii=False,
+                          default=str)
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._file = open(self.sink, "a", encoding="utf-8")
+                self._file.write(line + "\n")
+                self._file.flush()
+            except OSError as err:
+                print(f"[Tracer] 写入 {self.sink} 失败，停止写文件：{err}")
+                self.sink = None
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """各 span 名的调用次数与最近样本的平均 / p50 / p95 / p99 / 最大耗时（毫秒）。"""
+        with self._lock:
+            snapshot = {name: (count, list(samples)) for name, (count, samples) in self._stats.items()}
+        result = {}
+        for name, (count, samples) in sorted(snapshot.items()):
+            if not samples:
+                continue
+            samples.sort()
+            n = len(samples)
+
+            def pct(p: float) -> float:
+                return round(samples[min(n - 1, int(p * n))] * 1000, 3)
+
+            result[name] = {
+                "count": count,
+                "mean_ms": round(sum(samples) / n * 1000, 3),
+                "p50_ms": pct(0.50),
+                "p95_ms": pct(0.95),
+                "p99_ms": pct(0.99),
+                "max_ms": round(samples[-1] * 1000, 3),
+            }
+        return result
+
+    def format_summary(self) -> str:
+        """summary() 的表格形式，用于随时打印。"""
+        rows = self.summary()
+        if not rows:
+            return "[Tracer] 暂无数据"
+        width = max(len(name) for name in rows)
+        lines = [f"{'阶段':<{width}} {'次数':>7} {'平均ms':>10} {'p50ms':>10} {'p95ms':>10} {'p99ms':>10} {'最大ms':>10}"]
+        for name, s in rows.items():
+            lines.append(f"{name:<{width}} {s['count']:>7} {s['mean_ms']:>10.2f} {s['p50_ms']:>10.2f} "
+                         f"{s['p95_ms']:>10.2f} {s['p99_ms']:>10.2f} {s['max_ms']:>10.2f}")
+        return "\n".join(lines)
+
+    def reset(self):
+        """清空统计样本。"""
+        with self._lock:
+            self._stats.clear()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def bind(fn: Callable) -> Callable:
+    """
+    把当前上下文（含活动 span）绑定到 fn 上，交给线程池执行时子 span 仍挂在当前 span 下。
+    run_in_executor / ThreadPoolExecutor.submit 默认不会传递 contextvars。
+    """
+    ctx = copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+class TracedCursor(sqlite3.Cursor):
+    """每条语句计为一个 sqlite.<动词> span（如 sqlite.select、sqlite.insert）。"""
+
+    def execute(self, sql, parameters=()):
+        with _tracer.span("sqlite." + _verb(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with _tracer.span("sqlite." + _verb(sql)) as span:
+            cur = super().executemany(sql, seq_of_parameters)
+            span.set(rows=cur.rowcount)
+            return cur
+
+    def executescript(self, sql_script):
+        with _tracer.span("sqlite.script"):
+            return super().executescript(sql_script)
+
+
+class TracedConnection(sqlite3.Connection):
+    """
+    sqlite3.connect(..., factory=TracedConnection)：游标默认为 TracedCursor，
+    conn.execute() 等快捷方法改为经由该游标执行，因此所有语句都会被追踪；commit 单独计为 sqlite.commit。
+    """
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        with _tracer.span("sqlite.commit"):
+            return super().commit()
+
+
+def _verb(sql: str) -> str:
+    head = sql.lstrip()[:16].split(None, 1)
+    return head[0].lower() if head else "sql"
+
+
+def connect(database: str, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect 的替代：开启追踪时返回 TracedConnection。"""
+    if _tracer.enabled:
+        kwargs.setdefault("factory", TracedConnection)
+    return sqlite3.connect(database, **kwargs)
+
+
+_tracer = Tracer(enabled=TRACING_CONFIG.get("enabled", True), sink=TRACING_CONFIG.get("sink"),
+                 max_samples=TRACING_CONFIG.get("max_samples", 4096))
+
+
+def get_tracer() -> Tracer:
+    """进程内共享的 Tracer，按 config.TRACING_CONFIG 初始化。"""
+    return _tracer
+
+
+def span(name: str, **attrs):
+    """get_tracer().span() 的简写。"""
+    return _tracer.span(name, **attrs)
@@ -0,0 +1,271 @@
+# utils/transport.py
+# 共享 HTTP 传输层：LLM 与嵌入请求共用的长连接池、超时与重试
+
+import http.client
+import json
+import random
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+from utils.tracing import get_tracer
+
+# 可重试的状态码：限流与网关/服务暂不可用
+RETRY_STATUS = {429, 502, 503, 504}
+# 建立连接时的错误（连接被拒、连接超时等）：请求还没有发出，任何方法都可以重试
+CONNECT_ERRORS = (ConnectionError, socket.timeout, TimeoutError, OSError)
+# 发出请求后、收到响应前连接被关闭或重置：请求可能已到达服务端，只对幂等方法重发
+STALE_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+# 读超时与上述连接错误只对幂等方法重试：POST（如 LLM 生成）可能已被服务端处理，重发会重复生成
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class HttpError(Exception):
+    """服务端返回非 2xx 状态码。"""
+
+    def __init__(self, status: int, body: bytes, url: str):
+        super().__init__(f"HTTP {status} from {url}: {body[:200]!r}")
+        self.status = status
+        self.body = body
+        self.url = url
+
+
+class HttpResponse:
+    """已完整读取的响应。"""
+
+    def __init__(self, status: int, headers, data: bytes, url: str):
+        self.status = status
+        self.headers = headers
+        self.data = data
+        self.url = url
+
+    def json(self):
+        return json.loads(self.data)
+
+    def raise_for_status(self):
+        if not 200 <= self.status < 300:
+            raise HttpError(self.status, self.data, self.url)
+
+
+class HttpTransport:
+    """
+    线程安全的 HTTP/1.1 长连接池：
+    - 按 (scheme, host, port) 复用 keep-alive 连接，每个目标最多缓存 pool_size 条空闲连接
+    - 连接超时与读超时分开设置，单次调用不会无限挂起
+    - 连接失败、429/502/503/504 按指数退避加随机抖动重试，最多 max_retries 次
+    - 复用空闲连接前先检查它是否已被服务端关闭，失效的连接在发出任何字节之前就丢弃并换用新连接，
+      POST 也能安全地换连接；检查之后、发送之前恰好被关闭的极小窗口内 POST 会报错，而不是冒险重发
+    - 请求发出后连接被关闭/重置或读超时，只对幂等方法重试（复用的连接立即重试），POST 直接抛出
+    - stats() 返回请求数、新建/复用连接数、重试次数，可观察连接复用情况
+    """
+
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 300.0,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 pool_size: int = 8):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self._idle: Dict[Tuple[str, str, int], list] = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "connections_opened": 0, "connections_reused": 0,
+                       "stale_discarded": 0, "retries": 0, "errors": 0}
+
+    # —— 连接池 ——
+    @staticmethod
+    def _target(url: str) -> Tuple[Tuple[str, str, int], str]:
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        port = parts.port or (443 if scheme == "https" else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        return (scheme, parts.hostname, port), path
+
+    @staticmethod
+    def _dropped(conn) -> bool:
+        """
+        空闲连接是否已失效：空闲时本不该有可读数据，可读意味着服务端已关闭（EOF）或连接出错。
+        只做一次零超时的 select，不发送任何字节。
+        """
+        sock = conn.sock
+        if sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _acquire(self, key, read_timeout: float):
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            if conn is None or not self._dropped(conn):
+                break
+            conn.close()
+            with self._lock:
+                self._stats["stale_discarded"] += 1
+        with self._lock:
+            self._stats["connections_reused" if conn else "connections_opened"] += 1
+        reused = conn is not None
+        if conn is None:
+            scheme, host, port = key
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = cls(host, port, timeout=self.connect_timeout)
+            conn.connect()
+        conn.sock.settimeout(read_timeout)
+        return conn, reused
+
+    def _release(self, key, conn, resp):
+        if resp.will_close:
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _backoff(self, attempt: int, delay: bool = True):
+        with self._lock:
+            self._stats["retries"] += 1
+        if delay:
+            time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt))))
+
+    def _give_up(self, attempt: int) -> bool:
+        """重试次数已用完时记一次错误并返回 True。"""
+        if attempt < self.max_retries:
+            return False
+        with self._lock:
+            self._stats["errors"] += 1
+        return True
+
+    def _open(self, method: str, url: str, body: Optional[bytes], headers: Optional[Dict],
+              read_timeout: Optional[float]):
+        """发送请求并拿到响应头，处理重试；返回 (key, conn, resp)。"""
+        key, path = self._target(url)
+        headers = dict(headers or {})
+        timeout = read_timeout or self.read_timeout
+        attempt = 0
+        with self._lock:
+            self._stats["requests"] += 1
+        while True:
+            try:
+                conn, reused = self._acquire(key, timeout)
+            except CONNECT_ERRORS:
+                if self._give_up(attempt):
+                    raise
+                self._backoff(attempt)
+                attempt += 1
+                continue
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+            except STALE_ERRORS + (socket.timeout, TimeoutError) as err:
+                conn.close()
+                # 请求可能已被服务端处理：非幂等方法不重发（空闲连接失效已在发送前由 _acquire 排除）
+                if method.upper() not in IDEMPOTENT_METHODS:
+                    with self._lock:
+                        self._stats["errors"] += 1
+                    raise
+                if self._give_up(attempt):
+                    raise
+                # 复用的连接被关闭时立即换新连接重发，其余情况退避后重试
+                self._backoff(attempt, delay=not (reused and isinstance(err, STALE_ERRORS)))
+                attempt += 1
+                continue
+            except Exception:
+                conn.close()
+                with self._lock:
+                    self._stats["errors"] += 1
+                raise
+            if resp.status in RETRY_STATUS and attempt < self.max_retries:
+                resp.read()
+                self._release(key, conn, resp)
+                self._backoff(attempt)
+                attempt += 1
+                continue
+            return key, conn, resp
+
+    # —— 对外接口 ——
+    def request(self, method: str, url: str, body: Optional[bytes] = None,
+                headers: Optional[Dict] = None, read_timeout: Optional[float] = None) -> HttpResponse:
+        """发送请求并完整读取响应体，连接随后归还连接池。"""
+        with get_tracer().span("http." + method.lower(), url=url) as span:
+            key, conn, resp = self._open(method, url, body, headers, read_timeout)
+            span.set(status=resp.status)
+            try:
+                data = resp.read()
+            except Exception:
+                conn.close()
+                raise
+            self._release(key, conn, resp)
+            return HttpResponse(resp.status, resp.headers, data, url)
+
+    def post_json(self, url: str, payload, read_timeout: Optional[float] = None) -> HttpResponse:
+        return self.request("POST", url, body=json.dumps(payload).encode("utf-8"),
+                            headers={"Content-Type": "application/json"}, read_timeout=read_timeout)
+
+    @contextmanager
+    def stream(self, method: str, url: str, body: Optional[bytes] = None,
+               headers: Optional[Dict] = None, read_timeout: Optional[float] = None) -> Iterator:
+        """
+        流式请求：with 块内可逐行迭代响应（HTTPResponse）。
+        只在收到响应头之前重试；完整读完才归还连接，提前退出则关闭连接。
+        """
+        # span 覆盖从发出请求到流读完（或提前退出）的整个过程
+        with get_tracer().span("http." + method.lower(), url=url, stream=True) as span:
+            key, conn, resp = self._open(method, url, body, headers, read_timeout)
+            span.set(status=resp.status)
+            if not 200 <= resp.status < 300:
+                data = resp.read()
+                self._release(key, conn, resp)
+                raise HttpError(resp.status, data, url)
+            try:
+                yield resp
+            except BaseException:
+                conn.close()
+                raise
+            if resp.isclosed() or not resp.read(1):
+                self._release(key, conn, resp)
+            else:
+                conn.close()
+
+    def stats(self) -> Dict[str, float]:
+        """连接复用等统计。"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle_connections"] = sum(len(v) for v in self._idle.values())
+        opened = stats["connections_opened"] + stats["connections_reused"]
+        stats["reuse_rate"] = stats["connections_reused"] / opened if opened else 0.0
+        return stats
+
+    def close(self):
+        """关闭所有空闲连接。"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+_default_transport: Optional[HttpTransport] = None
+_default_lock = threading.Lock()
+
+
+def get_default_transport() -> HttpTransport:
+    """进程内共享的默认传输层，Llama3Client 与 VectorStore 默认都使用它。"""
+    global _default_transport
+    with _default_lock:
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+        return _default_transport
@@ -1,42 +1,148 @@
 import datetime
-from typing import List, Dict, Union
+from collections import deque
+from typing import Callable, Deque, List, Dict, Union
+from utils.tools import Tools
+from utils.tokens import estimate_tokens
+
+
+class ContextEntry:
+    """
+    一条对话记录。渲染后的文本行与 token 数在创建时计算一次，之后拼 prompt 直接复用。
+    支持 entry["role"] 形式的读取，兼容原先的 dict 写法。
+    """
+    __slots__ = ("role", "text", "ts", "line", "tokens", "text_tokens")
+
+    def __init__(self, role: str, text: str, ts: str, count_tokens: Callable[[str], int]):
+        self.role = role
+        self.text = text
+        self.ts = ts
+        self.line = WorkingMemory.format_context_line(self)
+        self.tokens = count_tokens(self.line)
+        self.text_tokens = count_tokens(text)
+
+    def __getitem__(self, name: str):
+        return getattr(self, name)
+
+    def get(self, name: str, default=None):
+        return getattr(self, name, default)
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "text": self.text, "ts": self.ts}
+
+
+class MemoryEntry:
+    """一条检索到的记忆，渲染后的文本行与 token 数在加载时计算一次。"""
+    __slots__ = ("source", "key", "content", "timestamp", "score", "line", "tokens")
+
+    def __init__(self, item: Dict, count_tokens: Callable[[str], int]):
+        self.source = item["source"]
+        self.key = item["key"]
+        self.content = item["content"]
+        self.timestamp = item.get("timestamp", "")
+        self.score = item.get("score")
+        self.line = WorkingMemory.format_memory_line(self)
+        self.tokens = count_tokens(self.line)
+
+    def __getitem__(self, name: str):
+        return getattr(self, name)
+
+    def get(self, name: str, default=None):
+        return getattr(self, name, default)
+
+    def to_dict(self) -> Dict:
+        return {"source": self.source, "key": self.key, "content": self.content,
+                "timestamp": self.timestamp, "score": self.score}
+
 
 class WorkingMemory:
     """
     工作记忆：存储对话历史、记忆条目，并构建对话 prompt。
+    - 对话历史是定长环形缓冲区（deque(maxlen=max_history*2)），超出时自动淘汰最早的条目，
+      每个会话占用的内存有上限
+    - 每条对话/记忆在写入时渲染一次文本行并计数 token，同时维护历史的 token 总数；
+      拼接后的对话文本块增量维护：新增一条只在末尾追加一行，淘汰最早的一条时切掉开头一行，
+      只有 truncate 之后才整块重建
     """
 
-    def __init__(self, max_history: int = 10):
-        self.context: List[Dict[str, str]] = []  # [{"role": "user"/"assistant", "text": "...", "ts": "..."}]
-        self.memories: List[Dict[str, str]] = [] # [{"source": ..., "key": ..., "content": ..., "timestamp": ...}]
+    def __init__(self, max_history: int = 10, token_counter: Callable[[str], int] = None):
+        """
+        :param max_history: 保留的对话轮数（一问一答为一轮）
+        :param token_counter: text -> token 数，默认使用 estimate_tokens（与 PromptBuilder 默认一致）
+        """
         self.max_history = max_history
+        self.count_tokens = token_counter or estimate_tokens
+        self.context: Deque[ContextEntry] = deque(maxlen=max_history * 2)
+        self.memories: List[MemoryEntry] = []
+        self._context_tokens = 0
+        self._context_text: Union[str, None] = None
+        self._memories_text: Union[str, None] = None
 
     def load_memories(self, memory_items: List[Dict[str, str]]):
         """加载或刷新记忆摘要条目（来自 MemoryFilter）。"""
-        self.memories = memory_items.copy()
+        self.memories = [MemoryEntry(m, self.count_tokens) for m in memory_items]
+        self._memories_text = None
 
     def add_context(self, role: str, text: str):
-        """记录一轮对话，按最大长度截断历史。"""
+        """记录一条对话，缓冲区已满时淘汰最早的一条。"""
         ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.context.append({"role": role, "text": text, "ts": ts})
-        if len(self.context) > self.max_history * 2:
-            self.context = self.context[-self.max_history*2:]
+        evicted = self.context[0] if len(self.context) == self.context.maxlen else None
+        if evicted is not None:
+            self._context_tokens -= evicted.tokens + 1
+        entry = ContextEntry(role, text, ts, self.count_tokens)
+        self.context.append(entry)
+        self._context_tokens += entry.tokens + 1
+        if self._context_text is not None:
+            text_block = self._context_text
+            if evicted is not None:
+                # 缓存以被淘汰的那一行开头，按其长度切掉
+                text_block = text_block[len(evicted.line) + 1:]
+            self._context_text = text_block + "\n" + entry.line if text_block else entry.line
+
+    def recent(self, n: int) -> List[ContextEntry]:
+        """最近 n 条对话（按时间顺序）。"""
+        if n <= 0:
+            return []
+        start = max(len(self.context) - n, 0)
+        return [self.context[i] for i in range(start, len(self.context))]
+
+    def truncate(self, keep: int):
+        """只保留最近 keep 条对话。"""
+        while len(self.context) > max(keep, 0):
+            self._context_tokens -= self.context.popleft().tokens + 1
+        self._context_text = None
+
+    @property
+    def context_tokens(self) -> int:
+        """get_context_text() 的 token 数：各行 token 数之和加换行（逐行计数，对粗估而言是略偏大的上界）。"""
+        return max(self._context_tokens - 1, 0)
+
+    @staticmethod
+    def format_context_line(entry) -> str:
+        """单条对话的文本：时间戳、角色与内容。"""
+        prefix = "用户" if entry["role"] == "user" else "助手"
+        return f"{entry['ts']} {prefix}: {entry['text']}"
+
+    @staticmethod
+    def format_memory_line(m) -> str:
+        """单条记忆的文本：来源、时间戳、key 与内容。"""
+        ts = Tools.format_timestamp(m.get("timestamp", ""))
+        return f"[{m['source']}][{ts}][{m['key']}] {m['content']}"
 
     def get_context_text(self) -> str:
         """生成上下文文本块：带角色与时间戳。"""
-        lines = []
-        for entry in self.context:
-            prefix = "用户" if entry["role"] == "user" else "助手"
-            lines.append(f"{entry['ts']} {prefix}: {entry['text']}")
-        return "\n".join(lines)
+        if self._context_text is None:
+            self._context_text = "\n".join(entry.line for entry in self.context)
+        return self._context_text
 
     def get_memories_text(self) -> str:
         """生成记忆文本块：包括来源和摘要时间戳。"""
-        lines = []
-        for m in self.memories:
-            ts = m.get("timestamp", "")
-            lines.append(f"[{m['source']}][{ts}][{m['key']}] {m['content']}")
-        return "\n".join(lines)
+        if self._memories_text is None:
+            self._memories_text = "\n".join(m.line for m in self.memories)
+        return self._memories_text
+
+    def __repr__(self) -> str:
+        return (f"WorkingMemory(context={len(self.context)}/{self.context.maxlen}, "
+                f"memories={len(self.memories)}, context_tokens={self.context_tokens})")
 
     def get_prompt(self, user_input: str, intents: List[str]) -> str:
         """
@@ -51,4 +157,4 @@ class WorkingMemory:
             f"\n用户输入：{user_input}",
             "\n助手回复："
         ]
-        return "\n".join(parts)
\ No newline at end of file
+        return "\n".join(parts)